@@ -0,0 +1,419 @@
+import gzip
+import io
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# number of threads used for decompressing the BGZF blocks
+default_threads = min(4, os.cpu_count() or 1)
+
+# maximum uncompressed size of a BGZF block (like bgzip), so even an incompressible block fits in 64 KiB
+bgzf_block_size = 0xff00
+
+# the empty block closing a BGZF file
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+class InvalidBgzfFile(Exception):
+    pass
+
+
+def is_gzip(path):
+    """ True if the file is gzip compressed (including BGZF) """
+    with open(path, mode="rb") as fin:
+        return fin.read(2) == GZIP_MAGIC
+
+
+def is_bgzf(path):
+    """ True if the file is BGZF compressed (bgzip, the blocked gzip format used by tabix and samtools) """
+    with open(path, mode="rb") as fin:
+        header = fin.read(18)
+    return len(header) == 18 and header[:2] == GZIP_MAGIC and header[3] & 4 == 4 and header[12:14] == b"BC"
+
+
+def open_file(path, mode="rt", threads=None, encoding="utf-8"):
+    """
+    Opens a plain, gzip or BGZF compressed file for reading, detecting the compression from the content
+    of the file. The blocks of BGZF files are decompressed in parallel threads.
+
+    Parameters
+    ----------
+    path : str
+        path to the file
+    mode : str
+        'r' / 'rt' for text mode (default), 'rb' for binary mode.
+    threads : int
+        number of threads decompressing the BGZF blocks. By default min(4, number of CPUs).
+    encoding : str
+        encoding used in text mode.
+
+    Returns
+    -------
+    A file object.
+    """
+    if mode not in ("r", "rt", "rb"):
+        raise ValueError("open_file supports only reading, got mode: " + mode)
+    if not is_gzip(path):
+        return open(path, mode="rb") if mode == "rb" else open(path, mode="r", encoding=encoding)
+    if is_bgzf(path):
+        binary = io.BufferedReader(BgzfReader(path, threads), buffer_size=1 << 20)
+    else:
+        binary = gzip.open(path, mode="rb")
+    if mode == "rb":
+        return binary
+    return io.TextIOWrapper(binary, encoding=encoding)
+
+
+def open_seekable(path):
+    """
+    Opens a file for random access in binary mode. The offsets used by seek() refer to the uncompressed
+    content, so the same .fai index can be used for plain and compressed FASTA files. BGZF files are
+    accessed block by block (using the .gzi index if it exists), plain gzip files are decompressed on
+    the fly (so they are efficient only if the seeks are going forward).
+    """
+    if not is_gzip(path):
+        return open(path, mode="rb")
+    if is_bgzf(path):
+        return BgzfSeekableReader(path)
+    return gzip.open(path, mode="rb")
+
+
+def _read_raw_block(fin):
+    """
+    Reads the next BGZF block from a binary file object.
+
+    Returns
+    -------
+    None at the end of the file, otherwise a tuple (compressed data, uncompressed size).
+    """
+    header = fin.read(12)
+    if len(header) == 0:
+        return None
+    if len(header) < 12 or header[:2] != GZIP_MAGIC or header[3] & 4 != 4:
+        raise InvalidBgzfFile("Invalid BGZF block header")
+    extra_length = struct.unpack("<H", header[10:12])[0]
+    extra = fin.read(extra_length)
+    block_size = None
+    position = 0
+    while position + 4 <= len(extra):
+        subfield_length = struct.unpack("<H", extra[position + 2:position + 4])[0]
+        if extra[position:position + 2] == b"BC":
+            block_size = struct.unpack("<H", extra[position + 4:position + 6])[0] + 1
+        position += 4 + subfield_length
+    if block_size is None:
+        raise InvalidBgzfFile("BGZF block without BC subfield")
+    rest = fin.read(block_size - 12 - extra_length)
+    return rest[:-8], struct.unpack("<I", rest[-4:])[0]
+
+
+def _inflate_block(raw_block):
+    """ Decompresses a BGZF block (zlib releases the GIL, so this runs in parallel in threads) """
+    compressed_data, uncompressed_size = raw_block
+    data = zlib.decompress(compressed_data, -15)
+    if len(data) != uncompressed_size:
+        raise InvalidBgzfFile("Corrupted BGZF block")
+    return data
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    Sequential reader of a BGZF file. The blocks are read in order by the calling thread and decompressed
+    by a thread pool, keeping a bounded number of blocks in flight.
+    """
+
+    def __init__(self, path, threads=None):
+        super().__init__()
+        threads = threads or default_threads
+        self._file = open(path, mode="rb")
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()
+        self._max_pending = threads * 4
+        self._eof = False
+        self._buffer = b""
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def _submit_blocks(self):
+        while not self._eof and len(self._pending) < self._max_pending:
+            raw_block = _read_raw_block(self._file)
+            if raw_block is None:
+                self._eof = True
+            else:
+                self._pending.append(self._executor.submit(_inflate_block, raw_block))
+
+    def readinto(self, buffer):
+        while self._position >= len(self._buffer):
+            self._submit_blocks()
+            if not self._pending:
+                return 0
+            self._buffer = self._pending.popleft().result()
+            self._position = 0
+        size = min(len(buffer), len(self._buffer) - self._position)
+        buffer[:size] = self._buffer[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._executor.shutdown(wait=True)
+            self._file.close()
+        super().close()
+
+
+def _deflate_block(data, level):
+    """ Compresses a BGZF block (zlib releases the GIL, so this runs in parallel in threads) """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed_data = compressor.compress(data) + compressor.flush()
+    header = GZIP_MAGIC + b"\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    block_size = len(header) + 2 + len(compressed_data) + 8
+    return (header + struct.pack("<H", block_size - 1) + compressed_data +
+            struct.pack("<II", zlib.crc32(data), len(data)))
+
+
+class BgzfWriter(io.RawIOBase):
+    """
+    Sequential writer of a BGZF file, which is a valid (multi-member) gzip file, so it can be read by
+    gzip, tar or open_file. The data is cut into blocks, which are compressed by a thread pool (like
+    pigz), keeping a bounded number of blocks in flight, and written in order.
+    """
+
+    def __init__(self, path, level=6, threads=None):
+        super().__init__()
+        threads = threads or default_threads
+        self.level = level
+        self._file = open(path, mode="wb")
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()
+        self._max_pending = threads * 4
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def _submit_block(self, data):
+        if len(self._pending) >= self._max_pending:
+            self._file.write(self._pending.popleft().result())
+        self._pending.append(self._executor.submit(_deflate_block, data, self.level))
+
+    def write(self, data):
+        self._buffer += data
+        full_blocks_end = len(self._buffer) - len(self._buffer) % bgzf_block_size
+        if full_blocks_end:
+            with memoryview(self._buffer) as view:
+                for position in range(0, full_blocks_end, bgzf_block_size):
+                    self._submit_block(bytes(view[position:position + bgzf_block_size]))
+            del self._buffer[:full_blocks_end]
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self._buffer:
+                    self._submit_block(bytes(self._buffer))
+                    self._buffer = bytearray()
+                while self._pending:
+                    self._file.write(self._pending.popleft().result())
+                self._file.write(BGZF_EOF)
+            finally:
+                self._executor.shutdown(wait=True)
+                self._file.close()
+        super().close()
+
+
+def _load_gzi(path):
+    """
+    Returns the (compressed offsets, uncompressed offsets) of the BGZF blocks of a file. The .gzi index
+    (written by bgzip -i or samtools faidx) is used if it exists, otherwise the block headers are scanned
+    (without decompressing the blocks).
+    """
+    compressed_offsets = [0]
+    uncompressed_offsets = [0]
+    if os.path.exists(path + ".gzi"):
+        with open(path + ".gzi", mode="rb") as gzi:
+            entries = struct.unpack("<Q", gzi.read(8))[0]
+            for _ in range(entries):
+                compressed_offset, uncompressed_offset = struct.unpack("<QQ", gzi.read(16))
+                compressed_offsets.append(compressed_offset)
+                uncompressed_offsets.append(uncompressed_offset)
+        return compressed_offsets, uncompressed_offsets
+
+    with open(path, mode="rb") as fin:
+        while True:
+            raw_block = _read_raw_block(fin)
+            if raw_block is None:
+                break
+            compressed_offsets.append(fin.tell())
+            uncompressed_offsets.append(uncompressed_offsets[-1] + raw_block[1])
+    return compressed_offsets[:-1], uncompressed_offsets[:-1]
+
+
+class BgzfSeekableReader:
+    """
+    Random access reader of a BGZF file, with seek / tell / read using uncompressed offsets.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, mode="rb")
+        self._compressed_offsets, self._uncompressed_offsets = _load_gzi(path)
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def seek(self, offset, whence=0):
+        if whence != 0:
+            raise ValueError("BgzfSeekableReader supports only absolute seeks")
+        self._position = offset
+        return offset
+
+    def tell(self):
+        return self._position
+
+    def read(self, size):
+        block_index = bisect_right(self._uncompressed_offsets, self._position) - 1
+        skip = self._position - self._uncompressed_offsets[block_index]
+        self._file.seek(self._compressed_offsets[block_index])
+        chunks = []
+        needed = skip + size
+        while needed > 0:
+            raw_block = _read_raw_block(self._file)
+            if raw_block is None:
+                break
+            data = _inflate_block(raw_block)
+            chunks.append(data)
+            needed -= len(data)
+        data = b"".join(chunks)[skip:skip + size]
+        self._position += len(data)
+        return data
+
+
+def _reg2bins(begin, end):
+    """ The bins of the tabix binning index overlapping the [begin, end) region (0-based) """
+    end -= 1
+    bins = [0]
+    for shift, offset in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+        bins.extend(range(offset + (begin >> shift), offset + (end >> shift) + 1))
+    return bins
+
+
+def _load_tabix_index(path_to_tbi):
+    """
+    Parses a tabix (.tbi) index.
+
+    Returns
+    -------
+    A dictionary with the settings of the index (format, col_seq, col_beg, col_end, meta) and the
+    'references': sequence name -> (bins: dictionary bin -> list of chunks, linear index).
+    """
+    with open_file(path_to_tbi, mode="rb") as tbi:
+        data = tbi.read()
+    if data[:4] != b"TBI\x01":
+        raise InvalidBgzfFile("Invalid tabix index: " + path_to_tbi)
+    n_ref, file_format, col_seq, col_beg, col_end, meta, skip, names_length = struct.unpack("<8i", data[4:36])
+    names = data[36:36 + names_length].split(b"\x00")[:n_ref]
+    position = 36 + names_length
+    references = {}
+    for name in names:
+        n_bin = struct.unpack("<i", data[position:position + 4])[0]
+        position += 4
+        bins = {}
+        for _ in range(n_bin):
+            bin_number, n_chunk = struct.unpack("<Ii", data[position:position + 8])
+            position += 8
+            chunks = [struct.unpack("<QQ", data[position + 16 * i:position + 16 * (i + 1)]) for i in range(n_chunk)]
+            position += 16 * n_chunk
+            bins[bin_number] = chunks
+        n_intv = struct.unpack("<i", data[position:position + 4])[0]
+        position += 4
+        linear_index = list(struct.unpack(f"<{n_intv}Q", data[position:position + 8 * n_intv]))
+        position += 8 * n_intv
+        references[name.decode("utf-8")] = (bins, linear_index)
+    return {"format": file_format, "col_seq": col_seq, "col_beg": col_beg, "col_end": col_end,
+            "meta": chr(meta), "references": references}
+
+
+def fetch_region(path, chrom, start=1, end=None, encoding="utf-8"):
+    """
+    Returns the lines of a BGZF compressed, tabix indexed file (e.g. a .vcf.gz with a .vcf.gz.tbi index)
+    overlapping a region, like 'tabix path chrom:start-end'. Only the blocks of the file containing the
+    region are read.
+
+    Parameters
+    ----------
+    path : str
+        path to the BGZF compressed file. The index must be at path + '.tbi'.
+    chrom : str
+        name of the sequence (chromosome).
+    start : int
+        1-based start position of the region (inclusive). Default: 1.
+    end : int
+        1-based end position of the region (inclusive). Default: None (the end of the sequence).
+
+    Returns
+    -------
+    A generator yielding the lines (with the line ending) in the order of the file.
+    """
+    index = _load_tabix_index(path + ".tbi")
+    if chrom not in index["references"]:
+        return
+    if end is None:
+        end = 1 << 29
+    begin = max(start - 1, 0)
+    bins, linear_index = index["references"][chrom]
+    min_offset = linear_index[min(begin >> 14, len(linear_index) - 1)] if linear_index else 0
+    chunks = sorted(chunk for bin_number in _reg2bins(begin, end) for chunk in bins.get(bin_number, [])
+                    if chunk[1] > min_offset)
+    merged_chunks = []
+    for chunk_begin, chunk_end in chunks:
+        chunk_begin = max(chunk_begin, min_offset)
+        if merged_chunks and chunk_begin <= merged_chunks[-1][1]:
+            merged_chunks[-1][1] = max(merged_chunks[-1][1], chunk_end)
+        else:
+            merged_chunks.append([chunk_begin, chunk_end])
+
+    is_vcf = index["format"] & 0xFFFF == 2
+    zero_based = index["format"] & 0x10000 != 0
+    col_seq, col_beg, col_end = index["col_seq"] - 1, index["col_beg"] - 1, index["col_end"] - 1
+    with open(path, mode="rb") as fin:
+        for chunk_begin, chunk_end in merged_chunks:
+            fin.seek(chunk_begin >> 16)
+            blocks = []
+            while fin.tell() <= chunk_end >> 16:
+                last_block = fin.tell() == chunk_end >> 16
+                raw_block = _read_raw_block(fin)
+                if raw_block is None:
+                    break
+                data = _inflate_block(raw_block)
+                blocks.append(data[:chunk_end & 0xFFFF] if last_block else data)
+            data = b"".join(blocks)[chunk_begin & 0xFFFF:]
+            for line in data.decode(encoding).splitlines(True):
+                if not line.strip() or line.startswith(index["meta"]):
+                    continue
+                fields = line.rstrip("\r\n").split("\t")
+                if fields[col_seq] != chrom:
+                    continue
+                line_begin = int(fields[col_beg]) + (1 if zero_based else 0)
+                if is_vcf:
+                    line_end = line_begin + len(fields[3]) - 1
+                elif col_end >= 0:
+                    line_end = int(fields[col_end])
+                else:
+                    line_end = line_begin
+                if line_begin <= end and line_end >= start:
+                    yield line
@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+
+PLINK_BED_MAGIC = b"\x6c\x1b\x01"
+
+# the 2-bit genotype codes of the .bed file: 00 homozygous A1, 01 missing, 10 heterozygous, 11 homozygous A2
+# (A1 is the 5th, A2 the 6th column of the .bim file; A2 is the reference allele, like in plink2 --recode vcf)
+VCF_GENOTYPES = np.array(["1/1", "./.", "0/1", "0/0"])
+
+# number of A1 (alternative) alleles for each genotype code, -1 for missing
+ALT_ALLELE_COUNTS = np.array([2, -1, 1, 0], dtype=np.int8)
+
+# numeric chromosome codes of PLINK for the non autosomal chromosomes
+PLINK_CHROMOSOMES = {"23": "X", "24": "Y", "25": "XY", "26": "MT"}
+
+_shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+class InvalidPlinkFile(Exception):
+    pass
+
+
+def read_fam(path_to_fam):
+    """ Returns the (family ID, individual ID) of the samples of a .fam file, in the order of the file """
+    samples = []
+    with open(path_to_fam) as fam:
+        for line in fam:
+            cells = line.split()
+            if cells:
+                samples.append((cells[0], cells[1]))
+    return samples
+
+
+def read_bim(path_to_bim):
+    """
+    Returns the variants of a .bim file, in the order of the file.
+
+    Returns
+    -------
+    A list of (chrom, variant ID, position, A1, A2) tuples. Missing alleles ('0') are replaced with '.', and
+    the numeric codes of the X, Y, XY and MT chromosomes with their names.
+    """
+    variants = []
+    with open(path_to_bim) as bim:
+        for line in bim:
+            cells = line.split()
+            if cells:
+                a1 = "." if cells[4] == "0" else cells[4]
+                a2 = "." if cells[5] == "0" else cells[5]
+                chrom = PLINK_CHROMOSOMES.get(cells[0], cells[0])
+                variants.append((chrom, cells[1], cells[3], a1, a2))
+    return variants
+
+
+class PlinkBed:
+    """
+    Memory-mapped genotype matrix of a PLINK 1 binary (.bed) file. Only the variant-major format (the
+    default since PLINK 1.0) is supported. The genotypes are decoded block by block, so only the
+    requested part of the file is read.
+    """
+
+    def __init__(self, path_to_bed, n_samples, n_variants):
+        """
+        Parameters
+        ----------
+        path_to_bed : str
+            path to the .bed file.
+        n_samples : int
+            number of samples (lines of the .fam file).
+        n_variants : int
+            number of variants (lines of the .bim file).
+        """
+        with open(path_to_bed, mode="rb") as bed:
+            magic = bed.read(3)
+        if magic != PLINK_BED_MAGIC:
+            raise InvalidPlinkFile("Not a variant-major PLINK .bed file: " + path_to_bed)
+        self.n_samples = n_samples
+        self.n_variants = n_variants
+        self.bytes_per_variant = (n_samples + 3) // 4
+        if os.path.getsize(path_to_bed) != 3 + self.bytes_per_variant * n_variants:
+            raise InvalidPlinkFile("The size of the .bed file does not match the .fam and .bim files: " + path_to_bed)
+        if n_variants == 0:
+            self.matrix = np.zeros((0, self.bytes_per_variant), dtype=np.uint8)
+        else:
+            self.matrix = np.memmap(path_to_bed, dtype=np.uint8, mode="r", offset=3,
+                                    shape=(n_variants, self.bytes_per_variant))
+
+    def genotype_codes(self, variant_start, variant_end, sample_start=0, sample_end=None):
+        """
+        Decodes the genotypes of the [variant_start, variant_end) variants of the [sample_start, sample_end)
+        samples.
+
+        Returns
+        -------
+        A (variants, samples) numpy array (uint8) of the 2-bit genotype codes (see VCF_GENOTYPES and
+        ALT_ALLELE_COUNTS).
+        """
+        if sample_end is None:
+            sample_end = self.n_samples
+        first_byte = sample_start // 4
+        last_byte = (sample_end + 3) // 4
+        packed = np.asarray(self.matrix[variant_start:variant_end, first_byte:last_byte])
+        codes = (packed[:, :, None] >> _shifts) & 3
+        codes = codes.reshape(packed.shape[0], -1)
+        return codes[:, sample_start - 4 * first_byte:sample_end - 4 * first_byte]
+
+
+def find_plink_files(plink_file_paths):
+    """ Returns the (.bed, .bim, .fam) paths from a list of the three PLINK file paths, in any order """
+    by_extension = {os.path.splitext(path)[1]: path for path in plink_file_paths}
+    try:
+        return by_extension[".bed"], by_extension[".bim"], by_extension[".fam"]
+    except KeyError:
+        raise InvalidPlinkFile("The .bed, .bim and .fam files are needed: " + ",".join(plink_file_paths))
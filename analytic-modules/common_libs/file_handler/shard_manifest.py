@@ -0,0 +1,95 @@
+import json
+import os
+import re
+
+
+class InvalidManifest(Exception):
+    pass
+
+
+def shard_ranges(n_items, chunk_size=None, chunks=None):
+    """
+    Splits n_items iteration items into balanced shards of consecutive items, in the order of the items:
+    the sizes of the shards differ by at most one.
+
+    Parameters
+    ----------
+    n_items : int
+        number of items (e.g. lines of a text file, VCF files).
+    chunk_size : int
+        maximum number of items in a shard (the number of shards is the minimum needed).
+    chunks : int
+        number of shards (fewer if there are less items). Used if chunk_size is not given.
+
+    Returns
+    -------
+    A list of (first item, last item) tuples (1-based, inclusive), one for each shard.
+    """
+    if chunk_size is not None:
+        n_shards = -(-n_items // chunk_size)
+    else:
+        n_shards = min(chunks, n_items)
+    if n_shards == 0:
+        return []
+    base_size, n_larger = divmod(n_items, n_shards)
+    ranges = []
+    first_item = 1
+    for shard in range(n_shards):
+        size = base_size + (1 if shard < n_larger else 0)
+        ranges.append((first_item, first_item + size - 1))
+        first_item += size
+    return ranges
+
+
+def write_manifest(path, shard_names, ranges):
+    """
+    Writes the manifest of a sharded iteration (JSON): the number of items and the name, first item and
+    last item of each shard, in the order of the shards.
+    """
+    manifest = {"total_items": ranges[-1][1] if ranges else 0,
+                "shards": [{"name": name, "first_item": first_item, "last_item": last_item}
+                           for name, (first_item, last_item) in zip(shard_names, ranges)]}
+    with open(path, mode="w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def read_manifest(path):
+    """ Reads a manifest written by write_manifest, returns the dictionary of the manifest """
+    with open(path) as manifest_file:
+        try:
+            manifest = json.load(manifest_file)
+        except json.JSONDecodeError as error:
+            raise InvalidManifest(f"Invalid manifest file: {path} ({error})")
+    if not isinstance(manifest, dict) or "shards" not in manifest:
+        raise InvalidManifest(f"Invalid manifest file: {path}")
+    return manifest
+
+
+def _shard_of_path(path, shard_names):
+    """ The shard name appearing in a path (as a folder or a file name, e.g. iteration-3/out.tsv), or None """
+    for component in reversed(re.split(r"[\\/]", os.path.normpath(path))):
+        name = re.match(r"[^._]*", component).group(0)
+        if name in shard_names:
+            return name
+    return None
+
+
+def order_by_manifest(input_files, manifest):
+    """
+    Orders the output files of the iterations (one for each shard) by the order of the shards in the
+    manifest. The shard of a file is found by its path (a folder or file name starting with the shard
+    name). If the shards can not be found in the paths, the given order is kept.
+
+    Raises
+    ------
+    InvalidManifest if the number of files is not the number of shards in the manifest.
+    """
+    shard_names = [shard["name"] for shard in manifest["shards"]]
+    if len(input_files) != len(shard_names):
+        raise InvalidManifest(f"{len(input_files)} input files are given for the {len(shard_names)} shards of the "
+                              "manifest")
+    position = {name: index for index, name in enumerate(shard_names)}
+    shards = [_shard_of_path(path, position) for path in input_files]
+    if None in shards or len(set(shards)) != len(shards):
+        return list(input_files)
+    return [path for _, path in sorted(zip(shards, input_files), key=lambda pair: position[pair[0]])]
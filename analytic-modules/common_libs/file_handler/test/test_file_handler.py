@@ -0,0 +1,101 @@
+import gzip
+import struct
+import zlib
+
+import pytest
+from common_libs.file_handler import file_handler
+
+VCF = ("##fileformat=VCFv4.0\n"
+       "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+       "1\t35\trs1\tT\tC\t32\t.\tNS=65\n"
+       "1\t150\trs2\tTA\tC\t32\t.\tNS=65\n"
+       "1\t600\trs3\tT\tC\t32\t.\tNS=65\n"
+       "2\t40\trs4\tG\tA\t32\t.\tNS=65\n")
+
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def _bgzf_block(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    compressed_data = compressor.compress(data) + compressor.flush()
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+    block_size = len(header) + 2 + len(compressed_data) + 8
+    return (header + struct.pack("<H", block_size - 1) + compressed_data +
+            struct.pack("<II", zlib.crc32(data), len(data)))
+
+
+def _write_bgzf(path, content, block_length=20):
+    data = content.encode("utf-8")
+    with open(path, mode="wb") as fout:
+        for position in range(0, len(data), block_length):
+            fout.write(_bgzf_block(data[position:position + block_length]))
+        fout.write(BGZF_EOF)
+
+
+def _write_tbi(path, sequence_names, file_end):
+    """ Minimal tabix index, with all the records of each sequence in bin 0 """
+    names = b"".join(name.encode("utf-8") + b"\x00" for name in sequence_names)
+    data = b"TBI\x01" + struct.pack("<8i", len(sequence_names), 2, 1, 2, 0, ord("#"), 0, len(names)) + names
+    for _ in sequence_names:
+        data += struct.pack("<iIiQQ", 1, 0, 1, 0, file_end << 16) + struct.pack("<i", 0)
+    with open(path, mode="wb") as fout:
+        fout.write(_bgzf_block(data) + BGZF_EOF)
+
+
+@pytest.fixture(params=["plain", "gzip", "bgzip"])
+def vcf_path(request, tmpdir):
+    if request.param == "plain":
+        path = tmpdir.join("input.vcf")
+        path.write(VCF)
+    elif request.param == "gzip":
+        path = tmpdir.join("input.vcf.gz")
+        with gzip.open(str(path), mode="wt") as fout:
+            fout.write(VCF)
+    else:
+        path = tmpdir.join("input.vcf.gz")
+        _write_bgzf(str(path), VCF)
+    return str(path)
+
+
+def test_open_file(vcf_path):
+    with file_handler.open_file(vcf_path, threads=2) as fin:
+        assert fin.readlines() == VCF.splitlines(True)
+
+
+def test_open_seekable(vcf_path):
+    with file_handler.open_seekable(vcf_path) as fin:
+        fin.seek(VCF.index("rs2"))
+        assert fin.read(3) == b"rs2"
+        fin.seek(VCF.index("rs4"))
+        assert fin.read(12) == b"rs4\tG\tA\t32\t."
+
+
+def test_is_bgzf(tmpdir):
+    path = tmpdir.join("input.vcf.gz")
+    _write_bgzf(str(path), VCF)
+    assert file_handler.is_gzip(str(path)) and file_handler.is_bgzf(str(path))
+    with gzip.open(str(path), mode="wt") as fout:
+        fout.write(VCF)
+    assert file_handler.is_gzip(str(path)) and not file_handler.is_bgzf(str(path))
+
+
+def test_bgzf_writer(tmpdir):
+    path = str(tmpdir.join("output.gz"))
+    data = VCF.encode("utf-8") * 10000
+    with file_handler.BgzfWriter(path, level=1, threads=2) as fout:
+        fout.write(data[:100])
+        fout.write(data[100:])
+    assert file_handler.is_bgzf(path)
+    with gzip.open(path, mode="rb") as fin:
+        assert fin.read() == data
+    with file_handler.open_file(path, mode="rb", threads=2) as fin:
+        assert fin.read() == data
+
+
+def test_fetch_region(tmpdir):
+    path = tmpdir.join("input.vcf.gz")
+    _write_bgzf(str(path), VCF)
+    _write_tbi(str(path) + ".tbi", ["1", "2"], path.size())
+    assert [line.split("\t")[2] for line in file_handler.fetch_region(str(path), "1", 151, 600)] == ["rs2", "rs3"]
+    assert [line.split("\t")[2] for line in file_handler.fetch_region(str(path), "2")] == ["rs4"]
+    assert list(file_handler.fetch_region(str(path), "X")) == []
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from common_libs.file_handler import plink_reader
+
+# genotype codes of 3 variants (rows) for 5 samples (columns)
+CODES = np.array([[0, 1, 2, 3, 3],
+                  [3, 3, 3, 3, 2],
+                  [2, 0, 1, 3, 0]], dtype=np.uint8)
+
+
+def write_plink_files(folder, codes=CODES):
+    n_variants, n_samples = codes.shape
+    padded = np.zeros((n_variants, 4 * ((n_samples + 3) // 4)), dtype=np.uint8)
+    padded[:, :n_samples] = codes
+    packed = padded[:, 0::4] | (padded[:, 1::4] << 2) | (padded[:, 2::4] << 4) | (padded[:, 3::4] << 6)
+    folder.join("data.bed").write_binary(plink_reader.PLINK_BED_MAGIC + packed.astype(np.uint8).tobytes())
+    folder.join("data.bim").write("".join(f"{23 if variant == 2 else 1}\trs{variant + 1}\t0\t{100 * (variant + 1)}\tA\tG\n"
+                                          for variant in range(n_variants)))
+    folder.join("data.fam").write("".join(f"FAM{sample} IND{sample} 0 0 1 -9\n" for sample in range(n_samples)))
+    return [str(folder.join("data." + extension)) for extension in ("bed", "bim", "fam")]
+
+
+def test_genotype_codes(tmpdir):
+    bed_path, bim_path, fam_path = write_plink_files(tmpdir)
+    bed = plink_reader.PlinkBed(bed_path, 5, 3)
+    assert (bed.genotype_codes(0, 3) == CODES).all()
+    assert (bed.genotype_codes(1, 3, 3, 5) == CODES[1:3, 3:5]).all()
+    assert plink_reader.ALT_ALLELE_COUNTS[bed.genotype_codes(0, 1)].tolist() == [[2, -1, 1, 0, 0]]
+
+
+def test_read_bim_and_fam(tmpdir):
+    bed_path, bim_path, fam_path = write_plink_files(tmpdir)
+    assert plink_reader.read_bim(bim_path)[2] == ("X", "rs3", "300", "A", "G")
+    assert plink_reader.read_fam(fam_path)[4] == ("FAM4", "IND4")
+
+
+def test_invalid_bed_size(tmpdir):
+    bed_path, bim_path, fam_path = write_plink_files(tmpdir)
+    with pytest.raises(plink_reader.InvalidPlinkFile):
+        plink_reader.PlinkBed(bed_path, 9, 3)
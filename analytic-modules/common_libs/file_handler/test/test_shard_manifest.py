@@ -0,0 +1,26 @@
+import pytest
+from common_libs.file_handler import shard_manifest
+
+
+def test_shard_ranges():
+    assert shard_manifest.shard_ranges(10, chunk_size=4) == [(1, 4), (5, 7), (8, 10)]
+    assert shard_manifest.shard_ranges(10, chunks=4) == [(1, 3), (4, 6), (7, 8), (9, 10)]
+    assert shard_manifest.shard_ranges(2, chunks=4) == [(1, 1), (2, 2)]
+    assert shard_manifest.shard_ranges(0, chunk_size=3) == []
+
+
+def test_order_by_manifest(tmpdir):
+    manifest_file = str(tmpdir.join("manifest.json"))
+    shard_manifest.write_manifest(manifest_file, ["iteration-1", "iteration-2", "iteration-10"],
+                                  shard_manifest.shard_ranges(5, chunks=3))
+    manifest = shard_manifest.read_manifest(manifest_file)
+    assert manifest["total_items"] == 5
+
+    input_files = ["out/iteration-10/net.tsv", "out/iteration-2/net.tsv", "out/iteration-1/net.tsv"]
+    assert shard_manifest.order_by_manifest(input_files, manifest) == input_files[::-1]
+    assert shard_manifest.order_by_manifest(["iteration-2.txt", "iteration-10_out.txt", "iteration-1.txt"],
+                                            manifest) == ["iteration-1.txt", "iteration-2.txt", "iteration-10_out.txt"]
+    # the order is kept, if the shards are not in the paths
+    assert shard_manifest.order_by_manifest(["c", "a", "b"], manifest) == ["c", "a", "b"]
+    with pytest.raises(shard_manifest.InvalidManifest):
+        shard_manifest.order_by_manifest(input_files[:2], manifest)
@@ -3,6 +3,8 @@ import os
 import sys
 from Bio import SeqIO
 
+from common_libs.file_handler import file_handler
+
 
 def _create_bedtools_command(path_to_fasta, path_to_bed, out_path):
     """
@@ -53,6 +55,9 @@ def transform_the_wild_type_fasta(original_output_wild_fasta, input_vcf, output_
     """
     Transform wild type fasta files into vcf files.
 
+    The annotation of a SNP can list more genes separated by ',' (see filter_vcf.filter_vcf). The
+    wild type sequence is dropped if the SNP has an 'N' alternative base for any of its genes.
+
     Parameters
     ----------
     original_output_wild_fasta
@@ -60,23 +65,184 @@ def transform_the_wild_type_fasta(original_output_wild_fasta, input_vcf, output_
     output_wild_fasta
     """
     n_base_dictionary = {}
-    with open(input_vcf, 'r') as vcf:
+    with file_handler.open_file(input_vcf) as vcf:
         for line in vcf:
             line = line.strip()
             if line[:1] != "#":
                 line = line.strip().split('\t')
                 alt_base = line[4]
                 if alt_base.upper() == "N":
-                    n_base_dictionary[line[2]] = line[13].split(":")[1]
+                    gene_ids = [gene.split(":", 1)[1] for gene in line[13].split(",")]
+                    n_base_dictionary.setdefault(line[2], set()).update(gene_ids)
 
     with open(output_wild_fasta, 'w') as out_fasta:
         for seq in SeqIO.parse(original_output_wild_fasta, 'fasta'):
             desc = seq.description
             snp_id = desc.split("|")[1].split(":")[1].strip()
             conn = seq.id
-            gene_id = conn.split(":")[1]
+            gene_ids = set(gene.split(":", 1)[1] for gene in conn.split(","))
             if snp_id not in n_base_dictionary:
                 SeqIO.write(seq, out_fasta, "fasta-2line")
             else:
-                if gene_id not in n_base_dictionary[snp_id]:
+                if not gene_ids & n_base_dictionary[snp_id]:
                     SeqIO.write(seq, out_fasta, "fasta-2line")
+
+
+def extract_genome_windows(path_to_fasta, paths_to_bed, out_paths):
+    """
+    Extracts the nucleotide sequences for several bed files from the same genome in a single run.
+
+    The windows of all the bed files are collected per chromosome and overlapping windows are merged
+    into genomic spans. Each span is read only once from the genome (using the .fai index of the FASTA
+    file, which is created next to the genome if it is missing, like bedtools does) and the windows are
+    sliced out from it. This way the SNPs appearing in more region classes (e.g. in protein coding and
+    promoter regions with different radius) and the nearby SNPs do not read the same part of the genome
+    again and again.
+
+    The genome can be plain text, gzip or bgzip compressed (a bgzip compressed genome is read block by
+    block, see common_libs.file_handler; the .fai index uses the uncompressed offsets, like samtools).
+
+    For each bed file a FASTA file is written (in the order of the bed file), with the same content as
+    'bedtools getfasta -name' would produce. Windows outside of the chromosome or on unknown chromosomes
+    are skipped with a warning.
+
+    Parameters
+    ----------
+    path_to_fasta: path to fasta file with the genomic secuence.
+    paths_to_bed: list of paths to the bed files defining the "cuts".
+    out_paths: list of paths where the output FASTA files are written (one for each bed file).
+    """
+    if not os.path.exists(path_to_fasta):
+        sys.stderr.write("Could not find fasta file: " + path_to_fasta)
+        sys.exit(202)
+
+    for path_to_bed in paths_to_bed:
+        if not os.path.exists(path_to_bed):
+            sys.stderr.write("Could not find bed file: " + path_to_bed)
+            sys.exit(203)
+
+    fasta_index = _load_fasta_index(path_to_fasta)
+
+    windows_by_chrom = {}
+    names = []
+    for bed_index, path_to_bed in enumerate(paths_to_bed):
+        bed_names = []
+        with file_handler.open_file(path_to_bed) as bed:
+            for line in bed:
+                if not line.strip() or line.startswith(("#", "track", "browser")):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                chrom, start, end = fields[0], int(fields[1]), int(fields[2])
+                name = fields[3] if len(fields) > 3 else f"{chrom}:{start}-{end}"
+                if chrom not in fasta_index:
+                    print(f"WARNING. chromosome ({chrom}) was not found in the FASTA file. Skipping.")
+                elif end > fasta_index[chrom][0] or start >= end:
+                    print(f"Feature ({chrom}:{start}-{end}) beyond length of {chrom} size "
+                          f"({fasta_index[chrom][0]} bp).  Skipping.")
+                else:
+                    windows_by_chrom.setdefault(chrom, []).append((start, end, bed_index, len(bed_names)))
+                bed_names.append(name)
+        names.append(bed_names)
+
+    sequences = [{} for _ in paths_to_bed]
+    # the chromosomes are read in the order of the FASTA file, so a gzip compressed genome is read forward only
+    chroms = sorted(windows_by_chrom, key=lambda chrom: fasta_index[chrom][1])
+    with file_handler.open_seekable(path_to_fasta) as fasta:
+        for chrom in chroms:
+            windows = windows_by_chrom[chrom]
+            for span_start, span_end, span_windows in _merge_windows(windows):
+                span_seq = _read_fasta_span(fasta, fasta_index[chrom], span_start, span_end)
+                for start, end, bed_index, line_index in span_windows:
+                    sequences[bed_index][line_index] = span_seq[start - span_start:end - span_start]
+
+    for bed_sequences, bed_names, out_path in zip(sequences, names, out_paths):
+        with open(out_path, mode="w") as out_fasta:
+            for line_index, name in enumerate(bed_names):
+                if line_index in bed_sequences:
+                    out_fasta.write(">" + name + "\n" + bed_sequences[line_index] + "\n")
+
+
+def _merge_windows(windows):
+    """
+    Merges the overlapping (or adjacent) windows of a chromosome into spans.
+
+    Parameters
+    ----------
+    windows: list of (start, end, ...) tuples, using 0-based half open coordinates.
+
+    Returns
+    -------
+    A generator yielding (span_start, span_end, windows_in_the_span) tuples.
+    """
+    windows = sorted(windows)
+    span_start, span_end, span_windows = None, None, []
+    for window in windows:
+        start, end = window[0], window[1]
+        if span_windows and start <= span_end:
+            span_end = max(span_end, end)
+        else:
+            if span_windows:
+                yield span_start, span_end, span_windows
+            span_start, span_end, span_windows = start, end, []
+        span_windows.append(window)
+    if span_windows:
+        yield span_start, span_end, span_windows
+
+
+def _load_fasta_index(path_to_fasta):
+    """
+    Reads the .fai index of a FASTA file (the samtools faidx format). If the index does not exist, it is
+    built by reading the FASTA file once and saved next to it (if the folder is writable).
+
+    Returns
+    -------
+    fasta_index: dictionary, sequence name -> (length, offset, line_bases, line_width)
+    """
+    path_to_fai = path_to_fasta + ".fai"
+    fasta_index = {}
+    if os.path.exists(path_to_fai):
+        with open(path_to_fai) as fai:
+            for line in fai:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) >= 5:
+                    fasta_index[fields[0]] = tuple(int(field) for field in fields[1:5])
+        return fasta_index
+
+    name, length, offset, line_bases, line_width = None, 0, 0, 0, 0
+    position = 0
+    with file_handler.open_file(path_to_fasta, mode="rb") as fasta:
+        for line in fasta:
+            if line.startswith(b">"):
+                if name is not None:
+                    fasta_index[name] = (length, offset, line_bases, line_width)
+                name = line[1:].split()[0].decode("utf-8")
+                length, offset, line_bases, line_width = 0, position + len(line), 0, 0
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if line_bases == 0:
+                    line_bases, line_width = bases, len(line)
+                length += bases
+            position += len(line)
+    if name is not None:
+        fasta_index[name] = (length, offset, line_bases, line_width)
+
+    try:
+        with open(path_to_fai, mode="w") as fai:
+            for name, entry in fasta_index.items():
+                fai.write("\t".join([name] + [str(field) for field in entry]) + "\n")
+    except OSError:
+        print("WARNING. Could not write the FASTA index file: " + path_to_fai)
+    return fasta_index
+
+
+def _read_fasta_span(fasta, index_entry, start, end):
+    """
+    Reads the [start, end) region (0-based) of a sequence from an open (binary) FASTA file, using its
+    .fai index entry.
+    """
+    length, offset, line_bases, line_width = index_entry
+    first_byte = offset + (start // line_bases) * line_width + start % line_bases
+    last_byte = offset + (end // line_bases) * line_width + end % line_bases
+    fasta.seek(first_byte)
+    raw = fasta.read(last_byte - first_byte)
+    return raw.replace(b"\n", b"").replace(b"\r", b"").decode("utf-8")
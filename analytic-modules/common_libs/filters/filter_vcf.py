@@ -1,43 +1,16 @@
 import os
-import re
-import subprocess
 import sys
 
+from common_libs.file_handler import file_handler
+from common_libs.filters import intersect
+from common_libs.filters import snp_panel
 
-def _create_bedtools_command(path_to_vcf,
-                             path_to_bed,
-                             header,
-                             bed_info):
-    """
-    https://bedtools.readthedocs.io/en/latest/content/tools/intersect.html
-
-    Parameters
-    ----------
-    - path_to_vcf: character path to the .vcf file to filter.
-    - path_to_bed: character path to the .bed file to define the filtering.
-    - out_vcf: character path where to save the filtered .vcf.
-    - header: boolean. Should the header of the .vcf file be included in out_vcf? default = True
-    - bed_info: boolean. Should the information in the bed file be included (e.g. names)? Note that
-    the output file may not be .vcf compliant. default = False.
-
-    Returns
-    -------
-    bed_tools_command: call for bedtools
-    """
-    bed_tools_command = ['bedtools', 'intersect', '-a', path_to_vcf, '-b', path_to_bed, '-wa']
-    if header:
-        bed_tools_command.append("-header")
-    if bed_info:
-        bed_tools_command.append("-wb")
-    else:
-        bed_tools_command.append("-u")
-    return bed_tools_command
 
-
-def filter_vcf(path_to_vcf, path_to_bed, out_vcf, header=True, bed_info=False):
+def filter_vcf(path_to_vcf, path_to_bed, out_vcf, header=True, bed_info=False, collapse_annotations=True):
     """
-    Filters the contents of a .vcf file based on the contents of a .bed file using the intersect
-    function from bedtools. The result is written as a .vcf file in out_vcf_file.
+    Filters the contents of a .vcf file based on the contents of a .bed file, with the semantics of the
+    intersect function from bedtools (see common_libs.filters.intersect). The result is streamed to a
+    .vcf file in out_vcf_file.
 
     Note that, by default, the information in the bed file (chrom, start, end, name) is included as
     additional fields in the .vcf. Therefore, the output file is not compliant with the .vcf format.
@@ -53,6 +26,9 @@ def filter_vcf(path_to_vcf, path_to_bed, out_vcf, header=True, bed_info=False):
     - header: boolean. Should the header of the .vcf file be included in out_vcf? default = True
     - bed_info: boolean. Should the information in the bed file be included (e.g. names)? Note that
     the output file may not be .vcf compliant. default = False.
+    - collapse_annotations: boolean. Only used with bed_info = True. A SNP overlapping N annotations is
+    reported N times; if True, these records are merged into a single record per SNP, where the name
+    column of the bed lists all the annotations separated by ','. default = True.
     """
 
     if not os.path.exists(path_to_vcf):
@@ -63,35 +39,83 @@ def filter_vcf(path_to_vcf, path_to_bed, out_vcf, header=True, bed_info=False):
         sys.stderr.write("Could not find bed file: " + path_to_bed)
         sys.exit(203)
 
-    bed_tools_command = _create_bedtools_command(path_to_vcf,
-                                                 path_to_bed,
-                                                 header,
-                                                 bed_info)
-    p = subprocess.Popen(bed_tools_command, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-    my_stdout, my_stderr = p.communicate()
-    print(my_stderr.decode("utf-8"))
-    with open(out_vcf, mode="w") as out_vcf_file:
-        out_vcf_file.write(my_stdout.decode("utf-8"))
+    intersect.intersect(path_to_vcf, path_to_bed, out_vcf, header=header, bed_info=bed_info,
+                        collapse_annotations=collapse_annotations)
 
 
-def filter_vcf_by_id(path_to_vcf, path_to_snp_list, out_vcf, header=True):
+def filter_vcf_multi(path_to_vcf, paths_to_bed, out_vcfs, path_to_snp_list=None, header=True, bed_info=True,
+                     collapse_annotations=True, snp_panel_cache=None):
     """
-    Filters the contents of a .vcf file based on the contents of a .bed file using the intersect
-    function from bedtools. The result is written as a .vcf file in out_vcf_file.
+    Filters the contents of a .vcf file by a SNP list and by several .bed files in a single pass. The .vcf
+    file is read once, the records are filtered by the SNP list (if given), and each remaining record is
+    routed to the output of every .bed file it overlaps, using preloaded interval indexes of the .bed files.
+    The i-th output is identical to running filter_vcf_by_id and then filter_vcf with the i-th .bed file.
+
     Parameters
     ----------
     - path_to_vcf: character path to the .vcf file to filter.
-    - path_to_bed: character path to the .bed file to define the filtering.
+    - paths_to_bed: list of character paths to the .bed files to define the filtering.
+    - out_vcfs: list of character paths where to save the filtered .vcf files (one for each .bed file).
+    - path_to_snp_list: character path to the SNP list to filter by. None by default (no filter).
+    - header: boolean. Should the header of the .vcf file be included in out_vcfs? default = True
+    - bed_info: boolean. Should the information in the bed files be included (e.g. names)? default = True.
+    - collapse_annotations: boolean. See filter_vcf. default = True.
+    - snp_panel_cache: character path to the folder of the compiled SNP panels (see
+    snp_panel.load_snp_panel). None by default (a folder in the temporary folder).
+    """
+
+    if not os.path.exists(path_to_vcf):
+        sys.stderr.write("vcf file not found: " + path_to_vcf)
+        sys.exit(201)
+
+    for path_to_bed in paths_to_bed:
+        if not os.path.exists(path_to_bed):
+            sys.stderr.write("Could not find bed file: " + path_to_bed)
+            sys.exit(203)
+
+    snp_list = snp_panel.load_snp_panel(path_to_snp_list, snp_panel_cache) if path_to_snp_list else None
+    bed_indexes = [intersect.BedIndex(path_to_bed) for path_to_bed in paths_to_bed]
+    out_vcf_files = [open(out_vcf, mode="w") for out_vcf in out_vcfs]
+    try:
+        with file_handler.open_file(path_to_vcf) as in_vcf:
+            for each_line in in_vcf:
+                if each_line.startswith("#"):
+                    if header:
+                        for out_vcf_file in out_vcf_files:
+                            out_vcf_file.write(each_line)
+                    continue
+                my_data = each_line.split("\t", 5)
+                if len(my_data) < 5:
+                    print("SNP had length " + str(len(each_line.split("\t"))) + ". It is skipped.")
+                    continue
+                if snp_list is not None and my_data[2].strip() not in snp_list:
+                    continue
+                chrom, start, end = intersect.parse_vcf_interval(each_line)
+                for bed_index, out_vcf_file in zip(bed_indexes, out_vcf_files):
+                    intersect.write_hits(out_vcf_file, each_line, bed_index.query(chrom, start, end),
+                                         bed_info, collapse_annotations)
+    finally:
+        for out_vcf_file in out_vcf_files:
+            out_vcf_file.close()
+
+
+def filter_vcf_by_id(path_to_vcf, path_to_snp_list, out_vcf, header=True, snp_panel_cache=None):
+    """
+    Filters the contents of a .vcf file based on the SNP IDs in a SNP list. The SNP list is compiled
+    into a sorted SNP panel (cached, see snp_panel.load_snp_panel), so each record is checked by a binary
+    search.
+    The result is written as a .vcf file in out_vcf_file.
+    Parameters
+    ----------
+    - path_to_vcf: character path to the .vcf file to filter.
+    - path_to_snp_list: character path to the SNP list to define the filtering.
     - out_vcf: character path where to save the filtered .vcf.
     - header: boolean. Should the header of the .vcf file be included in out_vcf? default = True
+    - snp_panel_cache: character path to the folder of the compiled SNP panels. None by default (a
+    folder in the temporary folder).
     """
-    snp_list = []
-    with open(path_to_snp_list) as fin:
-        for each_line in fin:
-            snp_list.append(each_line.strip())
-    nox_id_regex = re.compile('[^;]+;[^;]+;([^;]+)')
-    snp_list = list(map(lambda x: nox_id_regex.match(x).group(1) if nox_id_regex.match(x) else x, snp_list))
-    with open(path_to_vcf) as in_vcf:
+    snp_list = snp_panel.load_snp_panel(path_to_snp_list, snp_panel_cache)
+    with file_handler.open_file(path_to_vcf) as in_vcf:
         with open(out_vcf, mode = "w") as out_vcf_file:
             for each_line in in_vcf:
                 if each_line.startswith("#"):
@@ -0,0 +1,293 @@
+from bisect import bisect_left
+
+from common_libs.file_handler import file_handler
+
+
+class UnsortedInputError(Exception):
+    pass
+
+
+def _parse_bed_line(line):
+    """
+    Parses a line of a .bed file.
+
+    Returns
+    -------
+    None for header / empty lines, otherwise a tuple (chrom, start, end, fields), where fields is the
+    list of all the (tab separated) fields of the line.
+    """
+    if not line.strip() or line.startswith(("#", "track", "browser")):
+        return None
+    fields = line.rstrip("\r\n").split("\t")
+    return fields[0], int(fields[1]), int(fields[2]), fields
+
+
+def parse_vcf_interval(line):
+    """
+    Returns the (chrom, start, end) interval of a .vcf record, using 0-based half open coordinates
+    like bedtools: the interval starts at POS and covers the REF allele.
+    """
+    fields = line.split("\t", 4)
+    chrom = fields[0].strip()
+    start = int(fields[1]) - 1
+    end = start + max(len(fields[3].strip()), 1)
+    return chrom, start, end
+
+
+def scan_bed(path_to_bed):
+    """
+    Reads a .bed file once to check if it is coordinate sorted and to find the file offset of the block
+    of each chromosome. A .bed file is considered sorted if the records of each chromosome are in a single
+    block and they are sorted by their start positions (the order of the chromosomes does not matter).
+
+    Returns
+    -------
+    is_sorted: boolean
+    chrom_offsets: dictionary, chromosome -> offset of the first record of the chromosome in the file
+    """
+    chrom_offsets = {}
+    is_sorted = True
+    last_chrom = None
+    last_start = -1
+    offset = 0
+    with open(path_to_bed, mode="rb") as bed:
+        for raw_line in bed:
+            record = _parse_bed_line(raw_line.decode("utf-8"))
+            if record is not None:
+                chrom, start = record[0], record[1]
+                if chrom != last_chrom:
+                    if chrom in chrom_offsets:
+                        is_sorted = False
+                    else:
+                        chrom_offsets[chrom] = offset
+                    last_chrom = chrom
+                    last_start = -1
+                if start < last_start:
+                    is_sorted = False
+                last_start = start
+            offset += len(raw_line)
+    return is_sorted, chrom_offsets
+
+
+class BedIndex:
+    """
+    Interval index over all the records of a .bed file. Used for unsorted inputs, as the records of
+    the whole .bed file are kept in memory.
+    """
+
+    def __init__(self, path_to_bed):
+        records = {}
+        with file_handler.open_file(path_to_bed) as bed:
+            for order, line in enumerate(bed):
+                record = _parse_bed_line(line)
+                if record is not None:
+                    records.setdefault(record[0], []).append((record[1], record[2], order, record[3]))
+        self.starts = {}
+        self.max_ends = {}
+        self.records = {}
+        for chrom, chrom_records in records.items():
+            chrom_records.sort(key=lambda record: record[0])
+            max_ends = []
+            max_end = -1
+            for record in chrom_records:
+                max_end = max(max_end, record[1])
+                max_ends.append(max_end)
+            self.starts[chrom] = [record[0] for record in chrom_records]
+            self.max_ends[chrom] = max_ends
+            self.records[chrom] = chrom_records
+
+    def query(self, chrom, start, end):
+        """
+        Returns the fields of the .bed records overlapping the [start, end) interval, in the order of
+        the .bed file.
+        """
+        if chrom not in self.records:
+            return []
+        starts = self.starts[chrom]
+        max_ends = self.max_ends[chrom]
+        chrom_records = self.records[chrom]
+        hits = []
+        index = bisect_left(starts, end) - 1
+        while index >= 0 and max_ends[index] > start:
+            if chrom_records[index][1] > start:
+                hits.append(chrom_records[index])
+            index -= 1
+        hits.sort(key=lambda record: record[2])
+        return [record[3] for record in hits]
+
+
+class SortedBedCursor:
+    """
+    Streaming sweep over a coordinate sorted .bed file. The queries must come sorted by start position
+    within each chromosome (and each chromosome in a single block), otherwise UnsortedInputError is
+    raised. Only the .bed records overlapping the current position are kept in memory.
+    """
+
+    def __init__(self, path_to_bed, chrom_offsets):
+        self.bed = open(path_to_bed, mode="rb")
+        self.chrom_offsets = chrom_offsets
+        self.visited_chroms = set()
+        self.chrom = None
+        self.last_start = -1
+        self.active = []
+        self.next_record = None
+
+    def close(self):
+        self.bed.close()
+
+    def _read_next(self):
+        for raw_line in self.bed:
+            record = _parse_bed_line(raw_line.decode("utf-8"))
+            if record is not None:
+                return record if record[0] == self.chrom else None
+        return None
+
+    def _switch_chrom(self, chrom):
+        if chrom in self.visited_chroms:
+            raise UnsortedInputError(f"the records of chromosome {chrom} are not in a single block")
+        self.visited_chroms.add(chrom)
+        self.chrom = chrom
+        self.last_start = -1
+        self.active = []
+        self.next_record = None
+        if chrom in self.chrom_offsets:
+            self.bed.seek(self.chrom_offsets[chrom])
+            self.next_record = self._read_next()
+
+    def query(self, chrom, start, end):
+        """
+        Returns the fields of the .bed records overlapping the [start, end) interval, in the order of
+        the .bed file.
+        """
+        if chrom != self.chrom:
+            self._switch_chrom(chrom)
+        if start < self.last_start:
+            raise UnsortedInputError(f"the records are not sorted at {chrom}:{start + 1}")
+        self.last_start = start
+        while self.next_record is not None and self.next_record[1] < end:
+            self.active.append(self.next_record)
+            self.next_record = self._read_next()
+        self.active = [record for record in self.active if record[2] > start]
+        return [record[3] for record in self.active if record[1] < end]
+
+
+def iter_intersections(path_to_vcf, path_to_bed):
+    """
+    Intersects the records of a .vcf file with the records of a .bed file, like 'bedtools intersect'.
+
+    Both files can be plain text or gzip / bgzip compressed (see common_libs.file_handler).
+    If the .bed file is coordinate sorted (and not compressed), the files are merge-joined in a single streaming pass (keeping
+    in memory only the .bed records overlapping the current SNP). Otherwise (or if the .vcf file turns out
+    to be unsorted) an interval index of the .bed file is used.
+
+    Parameters
+    ----------
+    - path_to_vcf: character path to the .vcf file.
+    - path_to_bed: character path to the .bed file.
+
+    Returns
+    -------
+    A generator yielding a (line, hits) tuple for each line of the .vcf file. hits is None for the header
+    lines, otherwise the list of the fields of the overlapping .bed records (in the order of the .bed file).
+    """
+    if file_handler.is_gzip(path_to_bed):
+        # the sweep seeks in the .bed file, so compressed .bed files are always indexed in memory
+        is_sorted, chrom_offsets = False, {}
+    else:
+        is_sorted, chrom_offsets = scan_bed(path_to_bed)
+    if is_sorted:
+        bed_lookup = SortedBedCursor(path_to_bed, chrom_offsets)
+    else:
+        print("The bed file is not sorted, using an interval index: " + path_to_bed)
+        bed_lookup = BedIndex(path_to_bed)
+    try:
+        with file_handler.open_file(path_to_vcf) as vcf:
+            for line in vcf:
+                if line.startswith("#"):
+                    yield line, None
+                    continue
+                if len(line.split("\t", 4)) < 5:
+                    print("SNP had length " + str(len(line.split("\t"))) + ". It is skipped.")
+                    continue
+                chrom, start, end = parse_vcf_interval(line)
+                try:
+                    hits = bed_lookup.query(chrom, start, end)
+                except UnsortedInputError as error:
+                    print(f"The vcf file is not sorted ({error}), using an interval index: " + path_to_vcf)
+                    bed_lookup.close()
+                    bed_lookup = BedIndex(path_to_bed)
+                    hits = bed_lookup.query(chrom, start, end)
+                yield line, hits
+    finally:
+        if isinstance(bed_lookup, SortedBedCursor):
+            bed_lookup.close()
+
+
+def collapse_hits(hits):
+    """
+    Merges the overlapping .bed records of a SNP into a single record. The fields of the first record
+    are kept, and the name field (column 4, e.g. gene_id:gene;ensembl;ENSG00000139618) lists the (unique)
+    names of all the records, separated by ','. The other columns (e.g. score and strand of BED6 files)
+    are the ones of the first record.
+    """
+    if len(hits[0]) < 4:
+        # BED3, there are no names
+        return hits[0]
+    names = []
+    for fields in hits:
+        for name in fields[3].split(","):
+            if name not in names:
+                names.append(name)
+    return hits[0][:3] + [",".join(names)] + hits[0][4:]
+
+
+def intersect(path_to_vcf, path_to_bed, out_vcf, header=True, bed_info=False, collapse_annotations=False):
+    """
+    Writes the records of a .vcf file overlapping the records of a .bed file, with the semantics of
+    'bedtools intersect -a path_to_vcf -b path_to_bed -wa [-header] [-wb | -u]'. The records are streamed
+    to out_vcf.
+
+    Parameters
+    ----------
+    - path_to_vcf: character path to the .vcf file to filter.
+    - path_to_bed: character path to the .bed file to define the filtering.
+    - out_vcf: character path where to save the filtered .vcf.
+    - header: boolean. Should the header of the .vcf file be included in out_vcf? (-header)
+    - bed_info: boolean. If True, the fields of each overlapping .bed record are appended to the .vcf
+    record (-wb), otherwise each overlapping .vcf record is written once (-u).
+    - collapse_annotations: boolean. Only used with bed_info = True. If True, a single record is written
+    for each SNP (see collapse_hits) instead of one for each overlapping .bed record.
+    """
+    with open(out_vcf, mode="w") as out_vcf_file:
+        for line, hits in iter_intersections(path_to_vcf, path_to_bed):
+            if hits is None:
+                if header:
+                    out_vcf_file.write(line)
+            else:
+                write_hits(out_vcf_file, line, hits, bed_info, collapse_annotations)
+
+
+def write_hits(out_vcf_file, line, hits, bed_info=False, collapse_annotations=False):
+    """
+    Writes a .vcf record with its overlapping .bed records (nothing is written if there is no overlap).
+
+    Parameters
+    ----------
+    - out_vcf_file: file object to write to.
+    - line: the .vcf record.
+    - hits: list of the fields of the overlapping .bed records.
+    - bed_info: boolean. If True, the fields of each .bed record are appended to the .vcf record (-wb),
+    otherwise the .vcf record is written once (-u).
+    - collapse_annotations: boolean. Only used with bed_info = True. If True, a single record is written
+    (see collapse_hits) instead of one for each .bed record.
+    """
+    if not hits:
+        return
+    if not bed_info:
+        out_vcf_file.write(line)
+        return
+    vcf_part = line.rstrip("\r\n")
+    if collapse_annotations:
+        hits = [collapse_hits(hits)]
+    for fields in hits:
+        out_vcf_file.write(vcf_part + "\t" + "\t".join(fields) + "\n")
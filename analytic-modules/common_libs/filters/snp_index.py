@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from common_libs.file_handler import file_handler
+from common_libs.filters.snp_panel import rs_number
+
+index_arrays = ("rs_numbers", "other_ids", "record_numbers", "chroms", "chrom_names", "positions", "allele_offsets",
+                "alleles")
+
+# arrays of a chunk of reference records, and their types (see compile_snp_index)
+chunk_arrays = {"rs_keys": np.int64, "rs_records": np.int64, "other_keys": str, "other_records": np.int64,
+                "chroms": np.int32, "positions": np.int64}
+
+# number of reference records converted to numpy arrays at a time
+chunk_size = 1 << 20
+
+# version of the saved index, a saved index of another version is rebuilt
+index_version = 2
+
+# folder of the saved indexes, if no index folder is given (not the folder of the references, which can be
+# a read-only or shared input folder)
+default_index_folder = os.path.join(tempfile.gettempdir(), "isnp_snp_index")
+
+
+class SnpIndex:
+    """
+    Sorted rsID -> (chrom, pos, ref, alt) table of a set of reference files, stored as numpy arrays which
+    are memory-mapped from the disk (see load_snp_index), so opening even a dbSNP sized index is instant
+    and only the pages touched by the lookups are read. Each lookup is a binary search (O(log n)).
+
+    The rs IDs (rs followed by a number) are stored as integers, every other ID as a string. The records
+    of the rs IDs come first, followed by the records of the other IDs, both in the order of the keys. All
+    the records of an ID are kept, in the order of the reference files (record_numbers is the number of the
+    record in the reference files, so the records can be put back into the order of the files).
+    """
+
+    def __init__(self, rs_numbers, other_ids, record_numbers, chroms, chrom_names, positions, allele_offsets,
+                 alleles):
+        self.rs_numbers = rs_numbers
+        self.other_ids = other_ids
+        self.record_numbers = record_numbers
+        self.chroms = chroms
+        self.chrom_names = [str(chrom) for chrom in chrom_names]
+        self.positions = positions
+        self.allele_offsets = allele_offsets
+        self.alleles = alleles
+
+    def __len__(self):
+        return len(self.rs_numbers) + len(self.other_ids)
+
+    def __contains__(self, snp_id):
+        return self._find(snp_id) is not None
+
+    def _find(self, snp_id):
+        """ Returns the range of the records of a SNP ID (start, end), or None if the ID is not in the index """
+        number = rs_number(snp_id)
+        if number is not None:
+            keys, key, first_record = self.rs_numbers, number, 0
+        else:
+            keys, key, first_record = self.other_ids, snp_id, len(self.rs_numbers)
+        start = int(np.searchsorted(keys, key, side="left"))
+        if start < len(keys) and keys[start] == key:
+            return first_record + start, first_record + int(np.searchsorted(keys, key, side="right"))
+        return None
+
+    def lookup(self, snp_id):
+        """
+        Returns the (chrom, pos, ref, alt) record of a SNP ID, or None if the ID is not in the index. If the
+        ID occurs more times, the last record wins (later files override the earlier ones).
+        pos is a str (as in the reference file), ref and alt are empty strings for .bed references.
+        """
+        records = self._find(snp_id)
+        if records is None:
+            return None
+        return self._record(records[1] - 1)
+
+    def lookup_all(self, snp_id):
+        """
+        Returns all the records of a SNP ID in the order of the reference files, as a list of (record number,
+        (chrom, pos, ref, alt)) tuples (empty if the ID is not in the index).
+        """
+        records = self._find(snp_id)
+        if records is None:
+            return []
+        return [(int(self.record_numbers[record]), self._record(record)) for record in range(*records)]
+
+    def _record(self, record):
+        alleles = bytes(self.alleles[self.allele_offsets[record]:self.allele_offsets[record + 1]]).decode("utf-8")
+        ref, _, alt = alleles.partition("\t")
+        return self.chrom_names[self.chroms[record]], str(self.positions[record]), ref, alt
+
+
+def _parse_reference_line(line, reference_format):
+    """
+    Returns the (snp_id, chrom, pos, ref, alt) of a line of a reference file, or None for header lines.
+
+    - 'vcf' references: CHROM, POS, ID, REF and ALT are the first 5 columns.
+    - 'bed' references: the end of the interval (column 3) is the 1-based position and the name
+    (column 4) is the SNP ID, like in the UCSC dbSNP tables. ref and alt are not known.
+    """
+    if line[:1] == "#" or not line.strip():
+        return None
+    row = line.strip().split("\t")
+    if reference_format == "bed":
+        return row[3], row[0], row[2], "", ""
+    return row[2], row[0], row[1], row[3], row[4]
+
+
+def _chunk_arrays(chunk):
+    """ Converts the lists of a chunk of reference records (see compile_snp_index) to numpy arrays """
+    arrays = {name: np.array(chunk[name], dtype=dtype) for name, dtype in chunk_arrays.items()}
+    arrays["allele_lengths"] = np.array([len(allele) for allele in chunk["alleles"]], dtype=np.int64)
+    arrays["alleles"] = np.frombuffer(b"".join(chunk["alleles"]), dtype=np.uint8)
+    return arrays
+
+
+def _reorder_alleles(alleles, allele_lengths, order, allele_offsets):
+    """
+    Puts the concatenated alleles of the records into the given order (allele_offsets are the offsets of
+    the reordered records). The records are moved chunk_size at a time, so the index arrays of the bytes
+    are never built for all the records at once.
+    """
+    allele_starts = np.zeros(len(allele_lengths), dtype=np.int64)
+    np.cumsum(allele_lengths[:-1], out=allele_starts[1:])
+    reordered = np.empty(len(alleles), dtype=np.uint8)
+    for first in range(0, len(order), chunk_size):
+        records = order[first:first + chunk_size]
+        lengths = allele_lengths[records]
+        offsets = allele_offsets[first:first + len(records)] - allele_offsets[first]
+        positions = np.repeat(allele_starts[records] - offsets, lengths) + np.arange(lengths.sum())
+        reordered[allele_offsets[first]:allele_offsets[first + len(records)]] = alleles[positions]
+    return reordered
+
+
+def compile_snp_index(reference_files_paths, reference_format="vcf"):
+    """
+    Reads the reference files and builds the sorted arrays of the index. All the records of an ID are
+    kept, in the order of the reference files. The records are converted to numpy arrays chunk_size
+    records at a time, so only one chunk of them is kept as Python objects.
+
+    Parameters
+    ----------
+    reference_files_paths : list of str
+        paths to the reference files (plain or gzip / bgzip compressed).
+    reference_format : str
+        'vcf' or 'bed', see _parse_reference_line.
+
+    Returns
+    -------
+    A dictionary with the numpy arrays of the index (see SnpIndex).
+    """
+    chrom_codes = {}
+    chunks = []
+    chunk = {name: [] for name in list(chunk_arrays) + ["alleles"]}
+    n_records = 0
+    for reference_file in reference_files_paths:
+        with file_handler.open_file(reference_file) as reference:
+            for line in reference:
+                record = _parse_reference_line(line, reference_format)
+                if record is None:
+                    continue
+                snp_id, chrom, pos, ref, alt = record
+                number = rs_number(snp_id)
+                if number is not None:
+                    chunk["rs_keys"].append(number)
+                    chunk["rs_records"].append(n_records)
+                else:
+                    chunk["other_keys"].append(snp_id)
+                    chunk["other_records"].append(n_records)
+                chunk["chroms"].append(chrom_codes.setdefault(chrom, len(chrom_codes)))
+                chunk["positions"].append(int(pos))
+                chunk["alleles"].append(f"{ref}\t{alt}".encode("utf-8"))
+                n_records += 1
+                if len(chunk["positions"]) == chunk_size:
+                    chunks.append(_chunk_arrays(chunk))
+                    chunk = {name: [] for name in chunk}
+    chunks.append(_chunk_arrays(chunk))
+    arrays = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+    del chunks
+
+    rs_numbers, rs_order = _sort_keys(arrays["rs_keys"], arrays["rs_records"])
+    other_ids, other_order = _sort_keys(arrays["other_keys"], arrays["other_records"])
+    order = np.concatenate([rs_order, other_order])
+
+    allele_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(arrays["allele_lengths"][order], out=allele_offsets[1:])
+    return {"rs_numbers": rs_numbers,
+            "other_ids": other_ids,
+            "record_numbers": order,
+            "chroms": arrays["chroms"][order],
+            "chrom_names": np.array(list(chrom_codes), dtype=str),
+            "positions": arrays["positions"][order],
+            "allele_offsets": allele_offsets,
+            "alleles": _reorder_alleles(arrays["alleles"], arrays["allele_lengths"], order, allele_offsets)}
+
+
+def _sort_keys(keys, records):
+    """ Sorts the keys, keeping the order of the records of the same key. Returns (sorted keys, records) """
+    order = np.argsort(keys, kind="stable")
+    return keys[order], records[order]
+
+
+def _sources(reference_files_paths, reference_format):
+    """ Describes the reference files (path, size, modification time), to find out if an index is stale """
+    return {"version": index_version, "format": reference_format,
+            "files": [[os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)]
+                      for path in reference_files_paths]}
+
+
+def _load_saved_index(index_path, sources):
+    """ Memory-maps a saved index, or returns None if it does not exist or it was built from other sources """
+    sources_path = os.path.join(index_path, "sources.json")
+    if not os.path.exists(sources_path):
+        return None
+    with open(sources_path) as sources_file:
+        if json.load(sources_file) != sources:
+            return None
+    return SnpIndex(*[np.load(os.path.join(index_path, f"{name}.npy"), mmap_mode="r") for name in index_arrays])
+
+
+def load_snp_index(reference_files_paths, reference_format="vcf", index_folder=None):
+    """
+    Opens the SNP index of a set of reference files. The index is compiled once (see compile_snp_index)
+    and saved as a folder of .npy files in index_folder, named by the list of the reference files, and it
+    is rebuilt only if one of the reference files changes (size or modification time). If the index can
+    not be written, it is just kept in memory.
+
+    Parameters
+    ----------
+    reference_files_paths : list of str
+        paths to the reference files.
+    reference_format : str
+        'vcf' or 'bed', see _parse_reference_line.
+    index_folder : str
+        folder of the compiled indexes. By default default_index_folder (in the temporary folder).
+
+    Returns
+    -------
+    An instance of SnpIndex.
+    """
+    if index_folder is None:
+        index_folder = default_index_folder
+    sources = _sources(reference_files_paths, reference_format)
+    key = hashlib.sha1(json.dumps([reference_format] + [source[0] for source in sources["files"]]).encode("utf-8"))
+    index_path = os.path.join(index_folder, f"snp_index_{key.hexdigest()}")
+
+    saved_index = _load_saved_index(index_path, sources)
+    if saved_index is not None:
+        return saved_index
+
+    arrays = compile_snp_index(reference_files_paths, reference_format)
+    tmp_path = None
+    try:
+        os.makedirs(index_folder, exist_ok=True)
+        # written to a temporary folder first, as more patients can be processed in parallel
+        tmp_path = tempfile.mkdtemp(dir=index_folder, suffix=".tmp")
+        for name in index_arrays:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+        with open(os.path.join(tmp_path, "sources.json"), mode="w") as sources_file:
+            json.dump(sources, sources_file)
+        shutil.rmtree(index_path, ignore_errors=True)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        if tmp_path is not None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        # another process may have saved the same index in the meantime
+        saved_index = _load_saved_index(index_path, sources)
+        if saved_index is not None:
+            return saved_index
+        print("WARNING. Could not write the SNP index to: " + index_folder)
+    return SnpIndex(*[arrays[name] for name in index_arrays])
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import tempfile
+
+import numpy as np
+
+nox_id_regex = re.compile('[^;]+;[^;]+;([^;]+)')
+
+
+# default folder of the compiled SNP panels
+default_cache_folder = os.path.join(tempfile.gettempdir(), "isnp_snp_panel")
+
+
+class SnpPanel:
+    """
+    Sorted arrays of the SNP IDs of a SNP list, with O(log n) membership checks (binary search).
+
+    The dbSNP IDs (rs followed by a number) are stored as integers, every other ID as a string. A compiled
+    panel is cached on the disk (see load_snp_panel) and its arrays are used as they are loaded, so the SNP
+    list is parsed only once and reused for all the patients.
+    """
+
+    def __init__(self, rs_numbers, other_ids):
+        """
+        Parameters
+        ----------
+        rs_numbers : sorted numpy array (int64) of the (unique) numbers of the rs IDs in the panel.
+        other_ids : sorted numpy array (str) of the (unique) IDs in the panel which are not rs IDs.
+        """
+        self.rs_numbers = rs_numbers
+        self.other_ids = other_ids
+
+    def __contains__(self, snp_id):
+        number = rs_number(snp_id)
+        if number is not None:
+            return _in_sorted(self.rs_numbers, number)
+        return _in_sorted(self.other_ids, snp_id)
+
+    def __len__(self):
+        return len(self.rs_numbers) + len(self.other_ids)
+
+
+def _in_sorted(array, value):
+    """ True if value is in a sorted numpy array """
+    position = array.searchsorted(value)
+    return position < len(array) and bool(array[position] == value)
+
+
+def rs_number(snp_id):
+    """
+    Returns the number of an rs ID (e.g. 987423 for rs987423), or None if the ID is not in this
+    canonical form (IDs like rs000123 are kept as strings, so they are not mixed up with rs123).
+    """
+    digits = snp_id[2:]
+    if snp_id.startswith("rs") and digits.isascii() and digits.isdigit() and not digits.startswith("0"):
+        return int(digits)
+    return None
+
+
+def compile_snp_panel(path_to_snp_list):
+    """
+    Parses a SNP list file. The file can contain fully qualified NavigOmiX IDs (e.g. snp;dbsnp;rs987423)
+    or simple SNP IDs, one in each line.
+
+    Returns
+    -------
+    rs_numbers : sorted numpy array (int64) with the numbers of the rs IDs.
+    other_ids : sorted numpy array (str) with the rest of the IDs.
+    """
+    rs_numbers = []
+    other_ids = []
+    with open(path_to_snp_list) as fin:
+        for each_line in fin:
+            snp_id = each_line.strip()
+            nox_id = nox_id_regex.match(snp_id)
+            if nox_id:
+                snp_id = nox_id.group(1)
+            number = rs_number(snp_id)
+            if number is not None:
+                rs_numbers.append(number)
+            else:
+                other_ids.append(snp_id)
+    return np.unique(np.array(rs_numbers, dtype=np.int64)), np.unique(np.array(other_ids, dtype=str))
+
+
+def _file_checksum(path):
+    """ SHA-1 checksum of the content of a file """
+    checksum = hashlib.sha1()
+    with open(path, mode="rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def load_snp_panel(path_to_snp_list, cache_folder=None):
+    """
+    Loads the SNP panel of a SNP list file. The compiled panel is cached in cache_folder, keyed by the
+    checksum of the SNP list, so the SNP list is parsed only once (even if its path changes). If the cache
+    can not be written, the panel is just compiled in memory.
+
+    Parameters
+    ----------
+    path_to_snp_list : str
+        path to the SNP list file (see compile_snp_panel).
+    cache_folder : str
+        folder of the compiled panels. By default default_cache_folder (in the temporary folder).
+
+    Returns
+    -------
+    An instance of SnpPanel.
+    """
+    if cache_folder is None:
+        cache_folder = default_cache_folder
+    cache_path = os.path.join(cache_folder, f"snp_panel_{_file_checksum(path_to_snp_list)}.npz")
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as compiled:
+            return SnpPanel(compiled["rs_numbers"], compiled["other_ids"])
+
+    rs_numbers, other_ids = compile_snp_panel(path_to_snp_list)
+    tmp_path = None
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        # written to a temporary file first, as more patients can be processed in parallel
+        with tempfile.NamedTemporaryFile(dir=cache_folder, suffix=".tmp", delete=False) as tmp_file:
+            tmp_path = tmp_file.name
+            np.savez(tmp_file, rs_numbers=rs_numbers, other_ids=other_ids)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print("WARNING. Could not write the compiled SNP panel to: " + cache_folder)
+    return SnpPanel(rs_numbers, other_ids)
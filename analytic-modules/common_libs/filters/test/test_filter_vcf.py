@@ -0,0 +1,32 @@
+from common_libs.filters import filter_vcf
+
+VCF = ("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+       "1\t35\trs1\tT\tC\t32\t.\tNS=65\n"
+       "1\t150\trs2\tT\tC\t32\t.\tNS=65\n"
+       "2\t40\trs4\tG\tA\t32\t.\tNS=65\n")
+
+PROMOTER_BED = ("1\t30\t40\tgene_id:gene;ensembl;ensg1\n"
+                "2\t0\t100\tgene_id:gene;ensembl;ensg4\n")
+
+CODING_BED = ("1\t31\t39\tgene_id:gene;ensembl;ensg2\n"
+              "1\t140\t160\tgene_id:gene;ensembl;ensg3\n")
+
+
+def test_filter_vcf_multi(tmpdir):
+    vcf = tmpdir.join("input.vcf")
+    vcf.write(VCF)
+    promoter_bed = tmpdir.join("promoter.bed")
+    promoter_bed.write(PROMOTER_BED)
+    coding_bed = tmpdir.join("coding.bed")
+    coding_bed.write(CODING_BED)
+    snp_list = tmpdir.join("snp_list.txt")
+    snp_list.write("snp;dbsnp;rs1\nrs2\n")
+    promoter_out = tmpdir.join("promoter.vcf")
+    coding_out = tmpdir.join("coding.vcf")
+    filter_vcf.filter_vcf_multi(str(vcf), [str(promoter_bed), str(coding_bed)], [str(promoter_out), str(coding_out)],
+                                path_to_snp_list=str(snp_list))
+    assert promoter_out.read() == ("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+                                   "1\t35\trs1\tT\tC\t32\t.\tNS=65\t1\t30\t40\tgene_id:gene;ensembl;ensg1\n")
+    assert coding_out.read() == ("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+                                 "1\t35\trs1\tT\tC\t32\t.\tNS=65\t1\t31\t39\tgene_id:gene;ensembl;ensg2\n"
+                                 "1\t150\trs2\tT\tC\t32\t.\tNS=65\t1\t140\t160\tgene_id:gene;ensembl;ensg3\n")
@@ -0,0 +1,100 @@
+import gzip
+
+import pytest
+from common_libs.filters import intersect
+
+VCF = ("##fileformat=VCFv4.0\n"
+       "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+       "1\t35\trs1\tT\tC\t32\t.\tNS=65\n"
+       "1\t150\trs2\tTA\tC\t32\t.\tNS=65\n"
+       "1\t600\trs3\tT\tC\t32\t.\tNS=65\n"
+       "2\t40\trs4\tG\tA\t32\t.\tNS=65\n")
+
+BED = ("track name=test\n"
+       "1\t30\t40\tgene_id:gene;ensembl;ensg1\n"
+       "1\t31\t39\tgene_id:gene;ensembl;ensg2\n"
+       "1\t150\t160\tgene_id:gene;ensembl;ensg3\n"
+       "2\t0\t100\tgene_id:gene;ensembl;ensg4\n")
+
+UNSORTED_BED = ("2\t0\t100\tgene_id:gene;ensembl;ensg4\n"
+                "1\t150\t160\tgene_id:gene;ensembl;ensg3\n"
+                "1\t30\t40\tgene_id:gene;ensembl;ensg1\n"
+                "1\t31\t39\tgene_id:gene;ensembl;ensg2\n")
+
+RECORD_1 = "1\t35\trs1\tT\tC\t32\t.\tNS=65"
+RECORD_2 = "1\t150\trs2\tTA\tC\t32\t.\tNS=65"
+RECORD_4 = "2\t40\trs4\tG\tA\t32\t.\tNS=65"
+
+
+@pytest.mark.parametrize('bed_content', [BED, UNSORTED_BED])
+def test_intersect_wb(tmpdir, bed_content):
+    vcf = tmpdir.join("input.vcf")
+    vcf.write(VCF)
+    bed = tmpdir.join("annotation.bed")
+    bed.write(bed_content)
+    out = tmpdir.join("output.vcf")
+    intersect.intersect(str(vcf), str(bed), str(out), header=False, bed_info=True)
+    expected = [RECORD_1 + "\t1\t30\t40\tgene_id:gene;ensembl;ensg1",
+                RECORD_1 + "\t1\t31\t39\tgene_id:gene;ensembl;ensg2",
+                RECORD_2 + "\t1\t150\t160\tgene_id:gene;ensembl;ensg3",
+                RECORD_4 + "\t2\t0\t100\tgene_id:gene;ensembl;ensg4"]
+    assert out.read().splitlines() == expected
+
+
+def test_intersect_collapse(tmpdir):
+    vcf = tmpdir.join("input.vcf")
+    vcf.write(VCF)
+    bed = tmpdir.join("annotation.bed")
+    bed.write(BED)
+    out = tmpdir.join("output.vcf")
+    intersect.intersect(str(vcf), str(bed), str(out), header=False, bed_info=True, collapse_annotations=True)
+    assert out.read().splitlines()[0] == \
+        RECORD_1 + "\t1\t30\t40\tgene_id:gene;ensembl;ensg1,gene_id:gene;ensembl;ensg2"
+
+
+
+def test_intersect_collapse_bed6(tmpdir):
+    vcf = tmpdir.join("input.vcf")
+    vcf.write(VCF)
+    bed = tmpdir.join("annotation.bed")
+    bed.write("1\t30\t40\tgene_id:gene;ensembl;ensg1\t0\t+\n"
+              "1\t31\t39\tgene_id:gene;ensembl;ensg2\t0\t-\n")
+    out = tmpdir.join("output.vcf")
+    intersect.intersect(str(vcf), str(bed), str(out), header=False, bed_info=True, collapse_annotations=True)
+    assert out.read().splitlines() == \
+        [RECORD_1 + "\t1\t30\t40\tgene_id:gene;ensembl;ensg1,gene_id:gene;ensembl;ensg2\t0\t+"]
+
+def test_intersect_unique_with_header(tmpdir):
+    vcf = tmpdir.join("input.vcf")
+    vcf.write(VCF)
+    bed = tmpdir.join("annotation.bed")
+    bed.write(BED)
+    out = tmpdir.join("output.vcf")
+    intersect.intersect(str(vcf), str(bed), str(out), header=True, bed_info=False)
+    assert out.read() == ("##fileformat=VCFv4.0\n"
+                          "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n" +
+                          RECORD_1 + "\n" + RECORD_2 + "\n" + RECORD_4 + "\n")
+
+
+def test_unsorted_vcf_falls_back_to_index(tmpdir):
+    vcf = tmpdir.join("input.vcf")
+    vcf.write(RECORD_4 + "\n" + RECORD_2 + "\n" + RECORD_1 + "\n")
+    bed = tmpdir.join("annotation.bed")
+    bed.write(BED)
+    hits = [(line.split("\t")[2], [fields[3] for fields in hits])
+            for line, hits in intersect.iter_intersections(str(vcf), str(bed))]
+    assert hits == [("rs4", ["gene_id:gene;ensembl;ensg4"]),
+                    ("rs2", ["gene_id:gene;ensembl;ensg3"]),
+                    ("rs1", ["gene_id:gene;ensembl;ensg1", "gene_id:gene;ensembl;ensg2"])]
+
+
+def test_intersect_gzip_inputs(tmpdir):
+    vcf = tmpdir.join("input.vcf.gz")
+    with gzip.open(str(vcf), mode="wt") as fout:
+        fout.write(VCF)
+    bed = tmpdir.join("annotation.bed.gz")
+    with gzip.open(str(bed), mode="wt") as fout:
+        fout.write(BED)
+    out = tmpdir.join("output.vcf")
+    intersect.intersect(str(vcf), str(bed), str(out), header=False, bed_info=False)
+    assert out.read() == RECORD_1 + "\n" + RECORD_2 + "\n" + RECORD_4 + "\n"
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+from common_libs.filters import snp_index
+
+REFERENCE_VCF = ("##fileformat=VCFv4.0\n"
+                 "1\t10177\trs367896724\tA\tAC\t.\t.\tRS=367896724\n"
+                 "1\t10352\trs555500075\tT\tTA\t.\t.\tRS=555500075\n"
+                 "2\t500\tccc-2-500-G-A\tG\tA\t.\t.\t.\n")
+
+
+def test_snp_index_lookup(tmpdir):
+    reference = tmpdir.join("reference.vcf")
+    reference.write(REFERENCE_VCF)
+    index = snp_index.load_snp_index([str(reference)], index_folder=str(tmpdir))
+    assert len(index) == 3
+    assert index.lookup("rs555500075") == ("1", "10352", "T", "TA")
+    assert index.lookup("ccc-2-500-G-A") == ("2", "500", "G", "A")
+    assert index.lookup("rs1") is None
+    assert "rs367896724" in index and "rs36789672" not in index
+
+
+def test_snp_index_later_files_override(tmpdir):
+    reference_1 = tmpdir.join("reference_1.bed")
+    reference_1.write("chr21\t100\t101\trs2837891\t0\t+\nchr21\t200\t201\trs8127758\t0\t+\n")
+    reference_2 = tmpdir.join("reference_2.bed")
+    reference_2.write("chr21\t300\t301\trs2837891\t0\t+\n")
+    index = snp_index.load_snp_index([str(reference_1), str(reference_2)], reference_format="bed",
+                                      index_folder=str(tmpdir))
+    assert index.lookup("rs2837891") == ("chr21", "301", "", "")
+    assert index.lookup("rs8127758") == ("chr21", "201", "", "")
+
+
+def test_snp_index_is_persisted(tmpdir):
+    reference = tmpdir.join("reference.vcf")
+    reference.write(REFERENCE_VCF)
+    index_folder = tmpdir.mkdir("index")
+    snp_index.load_snp_index([str(reference)], index_folder=str(index_folder))
+    saved = os.listdir(str(index_folder))
+    assert len(saved) == 1 and saved[0].startswith("snp_index_")
+    index = snp_index.load_snp_index([str(reference)], index_folder=str(index_folder))
+    assert isinstance(index.positions, np.memmap)
+    assert index.lookup("rs367896724") == ("1", "10177", "A", "AC")
+
+
+def test_snp_index_all_records(tmpdir):
+    reference = tmpdir.join("reference.vcf")
+    reference.write(REFERENCE_VCF + "3\t700\trs367896724\tA\tG\t.\t.\t.\n")
+    index = snp_index.load_snp_index([str(reference)], index_folder=str(tmpdir))
+    assert index.lookup("rs367896724") == ("3", "700", "A", "G")
+    assert index.lookup_all("rs367896724") == [(0, ("1", "10177", "A", "AC")), (3, ("3", "700", "A", "G"))]
+    assert index.lookup_all("rs1") == []
+
+
+def test_snp_index_chunks(tmpdir, monkeypatch):
+    reference = tmpdir.join("reference.vcf")
+    reference.write(REFERENCE_VCF + "3\t700\trs367896724\tACGT\tG\t.\t.\t.\n" + "4\t800\tccc-4\tC\t\t.\t.\t.\n")
+    expected = snp_index.compile_snp_index([str(reference)])
+    monkeypatch.setattr(snp_index, "chunk_size", 2)
+    arrays = snp_index.compile_snp_index([str(reference)])
+    assert all(np.array_equal(arrays[name], expected[name]) for name in snp_index.index_arrays)
+    index = snp_index.SnpIndex(*[arrays[name] for name in snp_index.index_arrays])
+    assert index.lookup_all("rs367896724") == [(0, ("1", "10177", "A", "AC")), (3, ("3", "700", "ACGT", "G"))]
+    assert index.lookup("ccc-4") == ("4", "800", "C", "")
+
+def test_snp_index_failed_write(tmpdir, monkeypatch):
+    reference = tmpdir.join("reference.vcf")
+    reference.write(REFERENCE_VCF)
+    index_folder = tmpdir.mkdir("index")
+
+    def failing_save(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(np, "save", failing_save)
+    index = snp_index.load_snp_index([str(reference)], index_folder=str(index_folder))
+    assert index.lookup("rs367896724") == ("1", "10177", "A", "AC")
+    assert os.listdir(str(index_folder)) == []
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+from common_libs.filters import snp_panel
+
+
+def test_snp_panel_membership(tmpdir):
+    snp_list = tmpdir.join("snp_list.txt")
+    snp_list.write("snp;dbsnp;rs987423\nrs18363\nrs000003\nchr1:12345\n")
+    panel = snp_panel.load_snp_panel(str(snp_list), str(tmpdir.mkdir("cache")))
+    assert len(panel) == 4
+    assert "rs987423" in panel
+    assert "rs18363" in panel
+    assert "rs000003" in panel
+    assert "chr1:12345" in panel
+    assert "rs3" not in panel
+    assert "rs98742" not in panel
+
+
+def test_snp_panel_cache(tmpdir):
+    snp_list = tmpdir.join("snp_list.txt")
+    snp_list.write("rs1\nrs2\n")
+    cache_folder = tmpdir.mkdir("cache")
+    snp_panel.load_snp_panel(str(snp_list), str(cache_folder))
+    cached = os.listdir(str(cache_folder))
+    assert len(cached) == 1 and cached[0].startswith("snp_panel_")
+    panel = snp_panel.load_snp_panel(str(snp_list), str(cache_folder))
+    assert panel.rs_numbers.dtype == np.int64
+    assert "rs2" in panel and "rs3" not in panel and "rs0" not in panel
+
+
+def test_snp_panel_failed_write(tmpdir, monkeypatch):
+    snp_list = tmpdir.join("snp_list.txt")
+    snp_list.write("rs1\nrs2\n")
+    cache_folder = tmpdir.mkdir("cache")
+
+    def failing_savez(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(np, "savez", failing_savez)
+    panel = snp_panel.load_snp_panel(str(snp_list), str(cache_folder))
+    assert "rs1" in panel and "rs3" not in panel
+    assert os.listdir(str(cache_folder)) == []
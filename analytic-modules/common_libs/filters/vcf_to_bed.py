@@ -1,6 +1,8 @@
 import os
 import sys
 
+from common_libs.file_handler import file_handler
+
 
 class ProcessVcf:
     """
@@ -28,7 +30,7 @@ class ProcessVcf:
 
     def vcf2bed(self, out_path, region_length, chr_decorator="chr"):
         with open(out_path, mode="w") as fout:
-            with open(self.path) as fin:
+            with file_handler.open_file(self.path) as fin:
                 for this_line in fin:
                     if not this_line.startswith("#"):
                         my_snp = self._read_snp_line(this_line)
@@ -0,0 +1,270 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from common_libs.file_handler import file_handler
+from common_libs.file_handler import plink_reader
+
+matrix_arrays = ("data", "indices", "indptr", "patients", "snps")
+
+# number of PLINK variants / MAF rows processed at a time
+block_size = 100000
+
+
+class GenotypeMatrix:
+    """
+    Sparse patients x SNPs genotype matrix of a cohort, in CSR (compressed sparse row) format.
+
+    Only the non-reference genotypes are stored: the value of a (patient, SNP) cell is the number of
+    alternative alleles (1 heterozygous, 2 homozygous alternative). The row of a patient lists its SNPs
+    (sorted by the SNP index), so the SNPs of a patient are a slice of the indices / data arrays. The
+    SNP IDs are sorted, so a SNP is found with a binary search.
+
+    The matrix is saved as a folder of .npy files (see save) and memory-mapped by load_genotype_matrix.
+    """
+
+    def __init__(self, data, indices, indptr, patients, snps):
+        """
+        Parameters
+        ----------
+        data : numpy array (int8), the alternative allele counts of the non-reference genotypes.
+        indices : numpy array (int32), the SNP (column) index of each value.
+        indptr : numpy array (int64), the values of patient i are data[indptr[i]:indptr[i + 1]].
+        patients : numpy array (str), the patient IDs (rows).
+        snps : sorted numpy array (str), the SNP IDs (columns).
+        """
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.patients = patients
+        self.snps = snps
+        self._patient_rows = None
+        # column (SNP) index of the matrix, built by the first carriers call (see _column_index)
+        self._carrier_rows = None
+        self._column_indptr = None
+
+    @property
+    def shape(self):
+        return len(self.patients), len(self.snps)
+
+    def snp_index(self, snp_id):
+        """ Returns the column of a SNP ID, or None if the SNP is not in the matrix """
+        position = int(np.searchsorted(self.snps, snp_id))
+        if position < len(self.snps) and self.snps[position] == snp_id:
+            return position
+        return None
+
+    def patient_index(self, patient_id):
+        """ Returns the row of a patient ID, or None if the patient is not in the matrix """
+        if self._patient_rows is None:
+            self._patient_rows = {str(patient): row for row, patient in enumerate(self.patients)}
+        return self._patient_rows.get(patient_id)
+
+    def patient_genotypes(self, patient_id):
+        """ Returns a dictionary SNP ID -> alternative allele count of the non-reference SNPs of a patient """
+        row = self.patient_index(patient_id)
+        if row is None:
+            return {}
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return dict(zip(self.snps[self.indices[start:end]].tolist(), self.data[start:end].tolist()))
+
+    def _column_index(self):
+        """
+        Builds the column (CSC) index of the matrix once: the rows of the patients carrying SNP j are
+        _carrier_rows[_column_indptr[j]:_column_indptr[j + 1]] (in the order of the patients).
+        """
+        if self._carrier_rows is None:
+            rows = np.repeat(np.arange(len(self.patients)), np.diff(self.indptr))
+            self._carrier_rows = rows[np.argsort(self.indices, kind="stable")]
+            self._column_indptr = np.zeros(len(self.snps) + 1, dtype=np.int64)
+            np.cumsum(self.carrier_counts(), out=self._column_indptr[1:])
+
+    def carriers(self, snp_id):
+        """ Returns the IDs of the patients carrying a SNP (with at least one alternative allele) """
+        column = self.snp_index(snp_id)
+        if column is None:
+            return []
+        self._column_index()
+        start, end = self._column_indptr[column], self._column_indptr[column + 1]
+        return self.patients[self._carrier_rows[start:end]].tolist()
+
+    def carrier_counts(self):
+        """ Returns the number of patients carrying each SNP (in the order of the snps array) """
+        return np.bincount(self.indices, minlength=len(self.snps))
+
+    def to_scipy(self):
+        """ Returns the matrix as a scipy.sparse.csr_matrix (scipy is only needed for this method) """
+        from scipy.sparse import csr_matrix
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def save(self, folder):
+        """
+        Saves the matrix as a folder of .npy files. The folder is written to a temporary folder first
+        and then moved to its place, so a half written matrix is never seen by the readers. If the folder
+        can not be written (e.g. another process saved a matrix there in the meantime), the temporary folder
+        is removed and the OSError raised.
+        """
+        parent = os.path.dirname(os.path.abspath(folder))
+        tmp_folder = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+        try:
+            for name in matrix_arrays:
+                np.save(os.path.join(tmp_folder, f"{name}.npy"), np.asarray(getattr(self, name)))
+            shutil.rmtree(folder, ignore_errors=True)
+            os.replace(tmp_folder, folder)
+        except OSError:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            raise
+
+
+def load_genotype_matrix(folder, mmap=True):
+    """
+    Loads a matrix saved by GenotypeMatrix.save. With mmap = True (default) the arrays are memory-mapped,
+    so only the parts used are read from the disk.
+    """
+    mmap_mode = "r" if mmap else None
+    return GenotypeMatrix(*[np.load(os.path.join(folder, f"{name}.npy"), mmap_mode=mmap_mode)
+                            for name in matrix_arrays])
+
+
+def _to_csr(rows, columns, values, patients, snp_ids):
+    """
+    Builds a GenotypeMatrix from coordinate lists. The SNP IDs are sorted (and the columns renumbered),
+    and if a (patient, SNP) cell occurs more times, its first value is kept.
+    """
+    rows = np.concatenate(rows).astype(np.int64) if rows else np.zeros(0, dtype=np.int64)
+    columns = np.concatenate(columns).astype(np.int64) if columns else np.zeros(0, dtype=np.int64)
+    values = np.concatenate(values).astype(np.int8) if values else np.zeros(0, dtype=np.int8)
+
+    snps = np.array(snp_ids, dtype=str)
+    order = np.argsort(snps, kind="stable")
+    new_columns = np.empty(len(snps), dtype=np.int64)
+    new_columns[order] = np.arange(len(snps))
+    columns = new_columns[columns]
+
+    cells = np.lexsort((columns, rows))
+    rows, columns, values = rows[cells], columns[cells], values[cells]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+    rows, columns, values = rows[first], columns[first], values[first]
+
+    indptr = np.zeros(len(patients) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(patients)), out=indptr[1:])
+    return GenotypeMatrix(values, columns.astype(np.int32), indptr, np.array(patients, dtype=str), snps[order])
+
+
+class _SnpIds:
+    """ Interns the SNP IDs, numbering them in the order of their first appearance """
+
+    def __init__(self):
+        self.columns = {}
+
+    def column(self, snp_id):
+        return self.columns.setdefault(snp_id, len(self.columns))
+
+    def ids(self):
+        return list(self.columns)
+
+
+def _alternative_allele_count(genotype):
+    """ Number of non-reference alleles in the GT field of a genotype (e.g. 2 for 1|1:35, 0 for ./.) """
+    alleles = genotype.split(":", 1)[0].replace("|", "/").split("/")
+    return sum(1 for allele in alleles if allele not in ("0", "."))
+
+
+def from_vcfs(vcf_paths):
+    """
+    Builds the genotype matrix from VCF files (plain or gzip / bgzip compressed), reading each file once.
+    Each sample column is a patient: single-sample files are named by the file name (without the .vcf /
+    .vcf.gz extension, e.g. iteration-3), the samples of multi-sample files by their column headers. The
+    SNPs are identified by the ID column, or by chrom:pos:ref:alt if the ID is missing ('.').
+    """
+    snp_ids = _SnpIds()
+    patients, rows, columns, values = [], [], [], []
+    for vcf_path in vcf_paths:
+        samples = []
+        n_samples = 0
+        file_rows, file_columns, file_values = [], [], []
+        with file_handler.open_file(vcf_path) as vcf:
+            for line in vcf:
+                if line.startswith("##"):
+                    continue
+                fields = line.rstrip("\r\n").split("\t")
+                if line.startswith("#"):
+                    samples = fields[9:]
+                    continue
+                if len(fields) < 10:
+                    continue
+                n_samples = max(n_samples, len(fields) - 9)
+                snp_id = fields[2] if fields[2] != "." else ":".join(fields[0:2] + fields[3:5])
+                for sample, genotype in enumerate(fields[9:]):
+                    count = _alternative_allele_count(genotype)
+                    if count:
+                        file_rows.append(len(patients) + sample)
+                        file_columns.append(snp_ids.column(snp_id))
+                        file_values.append(min(count, 2))
+        if len(samples) <= 1:
+            name = os.path.basename(vcf_path)
+            for suffix in (".vcf.gz", ".vcf.bgz", ".vcf"):
+                if name.endswith(suffix):
+                    name = name[:-len(suffix)]
+                    break
+            # files without a header line are named by the file name (and the number of the column)
+            samples = [name] if n_samples <= 1 else [f"{name}_{sample + 1}" for sample in range(n_samples)]
+        patients.extend(samples)
+        rows.append(np.array(file_rows, dtype=np.int64))
+        columns.append(np.array(file_columns, dtype=np.int64))
+        values.append(np.array(file_values, dtype=np.int8))
+    return _to_csr(rows, columns, values, patients, snp_ids.ids())
+
+
+def from_maf(maf_path, skiprows=5):
+    """
+    Builds the genotype matrix from a MAF file, read in chunks. The cases (case_id) are the patients and
+    the mutations with a dbSNP ID the SNPs. The alternative allele count is computed like in maf2vcf: the
+    reference allele is compared with tumour allele 2, and tumour allele 1 with tumour allele 2.
+    """
+    maf_columns = ["case_id", "dbSNP_RS", "Reference_Allele", "Tumor_Seq_Allele1", "Tumor_Seq_Allele2"]
+    snp_ids = _SnpIds()
+    patient_rows = {}
+    rows, columns, values = [], [], []
+    for maf_frame in pd.read_csv(maf_path, skiprows=skiprows, delimiter="\t", usecols=maf_columns,
+                                 index_col=False, chunksize=block_size):
+        maf_frame = maf_frame.dropna()
+        maf_frame = maf_frame[maf_frame.dbSNP_RS.astype(str).str.startswith("rs")]
+        allele_2 = maf_frame.Tumor_Seq_Allele2.astype(str)
+        counts = ((maf_frame.Reference_Allele.astype(str) != allele_2).astype(np.int8) +
+                  (maf_frame.Tumor_Seq_Allele1.astype(str) != allele_2).astype(np.int8))
+        rows.append(np.array([patient_rows.setdefault(case, len(patient_rows)) for case in maf_frame.case_id],
+                             dtype=np.int64)[counts.values > 0])
+        columns.append(np.array([snp_ids.column(snp_id) for snp_id in maf_frame.dbSNP_RS],
+                                dtype=np.int64)[counts.values > 0])
+        values.append(counts.values[counts.values > 0])
+    return _to_csr(rows, columns, values, list(patient_rows), snp_ids.ids())
+
+
+def from_plink(plink_file_paths):
+    """
+    Builds the genotype matrix from PLINK 1 binary files (the .bed, .bim and .fam paths, in any order).
+    The patients are named FID_IID (like in the VCF files of vcf_iterator), A2 is the reference allele.
+    The .bed file is memory-mapped and decoded in blocks of variants.
+    """
+    bed_path, bim_path, fam_path = plink_reader.find_plink_files(plink_file_paths)
+    samples = plink_reader.read_fam(fam_path)
+    variants = plink_reader.read_bim(bim_path)
+    bed = plink_reader.PlinkBed(bed_path, len(samples), len(variants))
+    snp_ids = _SnpIds()
+    variant_columns = np.array([snp_ids.column(variant_id if variant_id != "." else f"{chrom}:{position}:{a2}:{a1}")
+                                for chrom, variant_id, position, a1, a2 in variants], dtype=np.int64)
+    rows, columns, values = [], [], []
+    for variant_start in range(0, len(variants), block_size):
+        variant_end = min(variant_start + block_size, len(variants))
+        counts = plink_reader.ALT_ALLELE_COUNTS[bed.genotype_codes(variant_start, variant_end)]
+        variant_offsets, sample_rows = np.nonzero(counts > 0)
+        rows.append(sample_rows)
+        columns.append(variant_columns[variant_offsets + variant_start])
+        values.append(counts[variant_offsets, sample_rows])
+    patients = [f"{family_id}_{individual_id}" for family_id, individual_id in samples]
+    return _to_csr(rows, columns, values, patients, snp_ids.ids())
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+from common_libs.genotype_matrix import genotype_matrix
+
+HEADER = "##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t"
+
+
+def write_vcfs(tmpdir):
+    patient_1 = tmpdir.join("iteration-1.vcf")
+    patient_1.write(HEADER + "P1\n"
+                    "1\t10\trs5\tA\tG\t.\t.\tPR\tGT\t0/1\n"
+                    "1\t20\trs2\tC\tT\t.\t.\tPR\tGT\t0/0\n"
+                    "2\t30\t.\tG\tA\t.\t.\tPR\tGT\t1|1\n")
+    cohort = tmpdir.join("cohort.vcf")
+    cohort.write(HEADER + "P2\tP3\n"
+                 "1\t20\trs2\tC\tT\t.\t.\tPR\tGT:DP\t1/1:3\t./.:0\n"
+                 "1\t10\trs5\tA\tG\t.\t.\tPR\tGT:DP\t0/0:4\t0/1:5\n")
+    return [str(patient_1), str(cohort)]
+
+
+def test_from_vcfs(tmpdir):
+    matrix = genotype_matrix.from_vcfs(write_vcfs(tmpdir))
+    assert matrix.patients.tolist() == ["iteration-1", "P2", "P3"]
+    assert matrix.snps.tolist() == ["2:30:G:A", "rs2", "rs5"]
+    assert matrix.patient_genotypes("iteration-1") == {"rs5": 1, "2:30:G:A": 2}
+    assert matrix.patient_genotypes("P2") == {"rs2": 2}
+    assert matrix.carriers("rs5") == ["iteration-1", "P3"]
+    assert matrix.carrier_counts().tolist() == [1, 1, 2]
+    assert (matrix.to_scipy().toarray() == np.array([[2, 0, 1], [0, 2, 0], [0, 0, 1]])).all()
+
+
+def test_save_and_load(tmpdir):
+    matrix = genotype_matrix.from_vcfs(write_vcfs(tmpdir))
+    folder = str(tmpdir.join("matrix"))
+    matrix.save(folder)
+    loaded = genotype_matrix.load_genotype_matrix(folder)
+    assert isinstance(loaded.indices, np.memmap)
+    assert loaded.shape == (3, 3)
+    assert loaded.patient_genotypes("P3") == {"rs5": 1}
+    assert [loaded.carriers(snp) for snp in ["2:30:G:A", "rs2", "rs5", "rs1"]] == \
+        [["iteration-1"], ["P2"], ["iteration-1", "P3"], []]
+    assert loaded.snp_index("rs1") is None
+
+
+def test_failed_save(tmpdir, monkeypatch):
+    matrix = genotype_matrix.from_vcfs(write_vcfs(tmpdir))
+    folder = tmpdir.mkdir("matrices")
+
+    def failing_replace(*args):
+        raise OSError("Directory not empty")
+    monkeypatch.setattr(genotype_matrix.os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        matrix.save(str(folder.join("matrix")))
+    assert os.listdir(str(folder)) == []
+
+
+def test_from_maf(tmpdir):
+    maf = tmpdir.join("cohort.maf")
+    maf.write("#version 2.4\n" * 5 +
+              "case_id\tdbSNP_RS\tReference_Allele\tTumor_Seq_Allele1\tTumor_Seq_Allele2\n"
+              "C1\trs1\tA\tA\tG\n"
+              "C1\tnovel\tA\tA\tG\n"
+              "C2\trs1\tA\tG\tG\n"
+              "C2\trs2\tT\tT\tT\n")
+    matrix = genotype_matrix.from_maf(str(maf))
+    assert matrix.patients.tolist() == ["C1", "C2"]
+    assert matrix.patient_genotypes("C1") == {"rs1": 2}
+    assert matrix.patient_genotypes("C2") == {"rs1": 1}
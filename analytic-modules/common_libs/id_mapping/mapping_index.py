@@ -0,0 +1,341 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+# arrays of a mapping table (prefixed with the name of the table in the saved index)
+table_arrays = ("keys", "key_offsets", "value_indptr", "values", "value_offsets")
+table_names = ("mapping", "uniquename")
+
+# the from ID of a raw mapping line, found without parsing the JSON (see compile_mapping_index)
+from_id_pattern = re.compile(r'"from_id"\s*:\s*"([^"\\]*)"')
+
+# number of mapping pairs converted to numpy arrays at a time (see _PairArrays)
+chunk_size = 1 << 20
+
+# default folder of the compiled indexes
+default_index_folder = os.path.join(tempfile.gettempdir(), "isnp_mapping_index")
+
+
+class MappingTable:
+    """
+    Sorted string table of an ID mapping: from ID -> list of to IDs. The keys and the values are stored as
+    UTF-8 bytes concatenated in two numpy (uint8) arrays with offsets arrays, so the table can be
+    memory-mapped from the disk (see load_mapping_index) and only the pages touched by the lookups are
+    read. Each lookup is a binary search (O(log n)) over the sorted keys.
+
+    The table can be used like the mapping dictionaries it replaces: table[from_id] is the set of the to
+    IDs (empty if there is no mapping), and table.get(from_id) is the last to ID in the order of the
+    mapping files (like a dictionary filled line by line).
+
+    A memory-mapped table is pickled as the paths of its files (files), so it can be passed to worker
+    processes, which memory-map the same files.
+    """
+
+    def __init__(self, keys, key_offsets, value_indptr, values, value_offsets):
+        """
+        Parameters
+        ----------
+        keys : numpy array (uint8), the sorted keys (UTF-8), concatenated.
+        key_offsets : numpy array (int64), key i is keys[key_offsets[i]:key_offsets[i + 1]].
+        value_indptr : numpy array (int64), the values of key i are values value_indptr[i] .. value_indptr[i + 1].
+        values : numpy array (uint8), the values (UTF-8, in the order of the mapping files), concatenated.
+        value_offsets : numpy array (int64), value j is values[value_offsets[j]:value_offsets[j + 1]].
+        """
+        arrays = [keys, key_offsets, value_indptr, values, value_offsets]
+        self.files = None
+        if all(isinstance(array, np.memmap) and array.filename for array in arrays):
+            self.files = [array.filename for array in arrays]
+        # plain ndarray views of the memory-mapped arrays, as slicing a np.memmap is much slower
+        self.keys, self.key_offsets, self.value_indptr, self.values, self.value_offsets = \
+            [np.asarray(array) for array in arrays]
+
+    def __len__(self):
+        return len(self.key_offsets) - 1
+
+    def __getstate__(self):
+        if self.files is not None:
+            return {"files": self.files}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if state.get("files") is not None:
+            self.__init__(*[_load_array(path) for path in state["files"]])
+        else:
+            self.__dict__.update(state)
+
+    def _key(self, position):
+        start, end = self.key_offsets[position:position + 2]
+        return self.keys[start:end].tobytes()
+
+    def _find(self, from_id):
+        key = from_id.encode("utf-8")
+        sorted_keys = _SortedKeys(self)
+        position = bisect.bisect_left(sorted_keys, key)
+        if position < len(self) and sorted_keys[position] == key:
+            return position
+        return None
+
+    def lookup(self, from_id):
+        """ Returns the to IDs of a from ID (in the order of the mapping files), or an empty list """
+        position = self._find(from_id)
+        if position is None:
+            return []
+        start, end = self.value_indptr[position], self.value_indptr[position + 1]
+        offsets = self.value_offsets[start:end + 1].tolist()
+        values = self.values[offsets[0]:offsets[-1]].tobytes()
+        base = offsets[0]
+        return [values[offsets[i] - base:offsets[i + 1] - base].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    def __contains__(self, from_id):
+        return self._find(from_id) is not None
+
+    def __getitem__(self, from_id):
+        return set(self.lookup(from_id))
+
+    def get(self, from_id, default=None):
+        to_ids = self.lookup(from_id)
+        return to_ids[-1] if to_ids else default
+
+
+class _SortedKeys:
+    """ Sequence view of the keys of a MappingTable, for the bisect module """
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, position):
+        return self.table._key(position)
+
+
+class MappingIndex:
+    """
+    Compiled ID mapping of a set of mapping files (JSON lines with from_id_type, to_id_type, from_id and
+    to_id) for one target ID type, see compile_mapping_index. All the IDs are lowercase.
+
+    mapping : MappingTable, from ID -> to IDs of the target ID type.
+    uniquename : MappingTable, from ID -> to IDs (of any type) of the lines with uniquename from ID type.
+    """
+
+    def __init__(self, mapping, uniquename):
+        self.mapping = mapping
+        self.uniquename = uniquename
+
+
+class _PairArrays:
+    """
+    Collects (from ID, to ID) pairs into two numpy arrays of UTF-8 byte strings. The pairs are converted
+    chunk_size pairs at a time, so only one chunk of them is kept as Python objects.
+    """
+
+    def __init__(self):
+        self.from_ids = []
+        self.to_ids = []
+        self.chunks = []
+
+    def append(self, from_id, to_id):
+        self.from_ids.append(from_id.encode("utf-8"))
+        self.to_ids.append(to_id.encode("utf-8"))
+        if len(self.from_ids) == chunk_size:
+            self._convert()
+
+    def _convert(self):
+        if self.from_ids:
+            self.chunks.append((np.array(self.from_ids, dtype=bytes), np.array(self.to_ids, dtype=bytes)))
+            self.from_ids, self.to_ids = [], []
+
+    def arrays(self):
+        """ Returns the from IDs and the to IDs (numpy arrays of byte strings, in the order of the pairs) """
+        self._convert()
+        if not self.chunks:
+            return np.zeros(0, dtype="S1"), np.zeros(0, dtype="S1")
+        return tuple(np.concatenate([chunk[column] for chunk in self.chunks]) for column in range(2))
+
+
+def _concatenate(strings):
+    """ Concatenates a numpy array of byte strings into a uint8 array, returns it with the offsets of the strings """
+    lengths = np.char.str_len(strings).astype(np.int64)
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    width = strings.dtype.itemsize
+    characters = np.ascontiguousarray(strings).view(np.uint8).reshape(len(strings), width)
+    return characters[np.arange(width) < lengths[:, None]], offsets
+
+
+def _build_table(from_ids, to_ids):
+    """
+    Builds the arrays of a MappingTable from the (from ID, to ID) pairs (numpy arrays of UTF-8 byte strings),
+    keeping the order of the pairs per key. The pairs are sorted by a (stable) argsort of their key codes.
+    """
+    keys, key_codes = np.unique(from_ids, return_inverse=True)
+    key_codes = key_codes.reshape(-1)
+    order = np.argsort(key_codes, kind="stable")
+    value_indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(key_codes, minlength=len(keys)), out=value_indptr[1:])
+    keys, key_offsets = _concatenate(keys)
+    values, value_offsets = _concatenate(to_ids[order])
+    return {"keys": keys, "key_offsets": key_offsets, "value_indptr": value_indptr, "values": values,
+            "value_offsets": value_offsets}
+
+
+def compile_mapping_index(mapping_file_paths, target_id_type, from_ids=None):
+    """
+    Reads the mapping files once, and builds the arrays of the mapping tables of a MappingIndex (the
+    mapping to the target ID type and the uniquename mapping). Lines which are not valid JSON are skipped.
+
+    If from_ids is given (a set of lowercase IDs), only the lines of these from IDs are kept. The from ID
+    is matched on the raw line first (see from_id_pattern), so the other lines are never parsed as JSON.
+
+    Returns
+    -------
+    A dictionary of the arrays, named <table>_<array> (e.g. mapping_keys, uniquename_value_offsets).
+    """
+    target_id_type = target_id_type.lower()
+    pairs = {table_name: _PairArrays() for table_name in table_names}
+    for mapping_file_path in mapping_file_paths:
+        with open(mapping_file_path, "r") as mapping_file:
+            for line in mapping_file:
+                if from_ids is not None:
+                    match = from_id_pattern.search(line)
+                    # lines of an unexpected format are checked after parsing them
+                    if match is not None and match.group(1).lower() not in from_ids:
+                        continue
+                try:
+                    map_line = json.loads(line.strip())
+                except json.JSONDecodeError:
+                    continue
+                if from_ids is not None and map_line["from_id"].lower() not in from_ids:
+                    continue
+                if map_line["to_id_type"].lower() == target_id_type:
+                    pairs["mapping"].append(map_line["from_id"].lower(), map_line["to_id"].lower())
+                if map_line["from_id_type"].lower() == "uniquename":
+                    pairs["uniquename"].append(map_line["from_id"].lower(), map_line["to_id"].lower())
+
+    arrays = {}
+    for table_name in table_names:
+        for name, array in _build_table(*pairs[table_name].arrays()).items():
+            arrays[f"{table_name}_{name}"] = array
+    return arrays
+
+
+def _tables(arrays):
+    return MappingIndex(*[MappingTable(*[arrays[f"{table_name}_{name}"] for name in table_arrays])
+                          for table_name in table_names])
+
+
+def _load_array(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # empty arrays can not be memory-mapped by older numpy versions
+        return np.load(path)
+
+
+def _load_tables(folder):
+    return _tables({f"{table_name}_{name}": _load_array(os.path.join(folder, f"{table_name}_{name}.npy"))
+                    for table_name in table_names for name in table_arrays})
+
+
+def _sources(mapping_file_paths, target_id_type):
+    """ Describes the mapping files (path, size, modification time), to find out if an index is stale """
+    return {"target_id_type": target_id_type.lower(),
+            "files": [[os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)]
+                      for path in mapping_file_paths]}
+
+
+def _load_saved_index(index_path, sources):
+    """ Opens a saved index if it exists and was compiled from the given sources, otherwise returns None """
+    sources_path = os.path.join(index_path, "sources.json")
+    if not os.path.exists(sources_path):
+        return None
+    with open(sources_path) as sources_file:
+        if json.load(sources_file) != sources:
+            return None
+    return _load_tables(index_path)
+
+
+def load_mapping_index(mapping_file_paths, target_id_type, index_folder=None):
+    """
+    Opens the compiled ID mapping of a set of mapping files for a target ID type. The index is compiled
+    once (see compile_mapping_index) and saved as a folder of .npy files in index_folder, named by the
+    mapping files and the target ID type, and it is rebuilt only if one of the mapping files changes
+    (size or modification time). The saved index is memory-mapped, so opening it takes milliseconds. If
+    the index can not be written, it is just kept in memory.
+
+    Parameters
+    ----------
+    mapping_file_paths : list of str
+        paths to the mapping files (JSON lines).
+    target_id_type : str
+        the target ID type (case insensitive), e.g. uniprotac.
+    index_folder : str
+        folder of the compiled indexes. By default default_index_folder (in the temporary folder).
+
+    Returns
+    -------
+    An instance of MappingIndex.
+    """
+    if index_folder is None:
+        index_folder = default_index_folder
+    sources = _sources(mapping_file_paths, target_id_type)
+    key = hashlib.sha1(json.dumps([sources["target_id_type"]] + [source[0] for source in sources["files"]])
+                       .encode("utf-8"))
+    index_path = os.path.join(index_folder, f"mapping_index_{key.hexdigest()}")
+
+    saved_index = _load_saved_index(index_path, sources)
+    if saved_index is not None:
+        return saved_index
+
+    arrays = compile_mapping_index(mapping_file_paths, target_id_type)
+    tmp_path = None
+    try:
+        os.makedirs(index_folder, exist_ok=True)
+        # written to a temporary folder first, as more processes can compile the same index in parallel
+        tmp_path = tempfile.mkdtemp(dir=index_folder, suffix=".tmp")
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "sources.json"), mode="w") as sources_file:
+            json.dump(sources, sources_file)
+        shutil.rmtree(index_path, ignore_errors=True)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        if tmp_path is not None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        # another process may have saved the same index in the meantime
+        saved_index = _load_saved_index(index_path, sources)
+        if saved_index is not None:
+            return saved_index
+        print("WARNING. Could not write the ID mapping index to: " + index_folder)
+        return _tables(arrays)
+    return _load_tables(index_path)
+
+
+def load_selected_mapping_index(mapping_file_paths, target_id_type, from_ids):
+    """
+    Reads only the mapping of the given from IDs (e.g. the nodes of a network) from the mapping files,
+    without compiling and saving the whole mapping. The mapping files are streamed once and only the
+    lines of the selected from IDs are parsed and kept in memory, see compile_mapping_index.
+
+    Parameters
+    ----------
+    mapping_file_paths : list of str
+        paths to the mapping files (JSON lines).
+    target_id_type : str
+        the target ID type (case insensitive), e.g. uniprotac.
+    from_ids : iterable of str
+        the from IDs to keep (case insensitive).
+
+    Returns
+    -------
+    An instance of MappingIndex (in memory).
+    """
+    from_ids = {from_id.lower() for from_id in from_ids}
+    return _tables(compile_mapping_index(mapping_file_paths, target_id_type, from_ids))
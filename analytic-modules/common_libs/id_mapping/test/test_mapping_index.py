@@ -0,0 +1,90 @@
+import os
+import pickle
+import shutil
+
+from common_libs.id_mapping import mapping_index
+
+MAPPING_LINES = [
+    '{"from_id_type": "ensembl", "to_id_type": "uniprotac", "from_id": "ENSG1", "to_id": "P00001"}',
+    '{"from_id_type": "ensembl", "to_id_type": "uniprotac", "from_id": "ensg2", "to_id": "p00002"}',
+    '{"from_id_type": "ensembl", "to_id_type": "genename", "from_id": "ensg1", "to_id": "tp53"}',
+    'not a json line',
+    '{"from_id_type": "ensembl", "to_id_type": "uniprotac", "from_id": "ensg1", "to_id": "p00003"}',
+    '{"from_id_type": "uniquename", "to_id_type": "uniprotac", "from_id": "TP53", "to_id": "p04637"}',
+]
+
+
+def write_mapping_file(tmpdir):
+    mapping_file = tmpdir.join("mapping.json")
+    mapping_file.write("\n".join(MAPPING_LINES) + "\n")
+    return str(mapping_file)
+
+
+def test_mapping_index_lookup(tmpdir):
+    index = mapping_index.load_mapping_index([write_mapping_file(tmpdir)], "UniProtAC")
+    assert index.mapping.files is not None
+    assert len(index.mapping) == 3  # ensg1, ensg2, tp53
+    assert index.mapping.lookup("ensg1") == ["p00001", "p00003"]
+    assert index.mapping["ensg2"] == {"p00002"}
+    assert index.mapping["ensg3"] == set()
+    assert index.mapping.get("ensg1") == "p00003"
+    assert index.mapping.get("brca2") is None
+    assert "tp53" in index.uniquename and "ensg1" not in index.uniquename
+    assert index.uniquename["tp53"] == {"p04637"}
+    # the index is not written next to the mapping file
+    assert not tmpdir.listdir(lambda path: path.basename.startswith("mapping_index_"))
+
+
+def test_mapping_index_chunks(tmpdir, monkeypatch):
+    mapping_file = write_mapping_file(tmpdir)
+    expected = mapping_index.compile_mapping_index([mapping_file], "uniprotac")
+    monkeypatch.setattr(mapping_index, "chunk_size", 2)
+    arrays = mapping_index.compile_mapping_index([mapping_file], "uniprotac")
+    assert all((arrays[name] == expected[name]).all() for name in expected)
+
+
+def test_mapping_index_is_rebuilt_and_pickled(tmpdir):
+    mapping_file = write_mapping_file(tmpdir)
+    index = mapping_index.load_mapping_index([mapping_file], "genename", index_folder=str(tmpdir))
+    assert index.mapping.lookup("ensg1") == ["tp53"]
+
+    with open(mapping_file, "a") as mapping:
+        mapping.write('{"from_id_type": "ensembl", "to_id_type": "genename", "from_id": "ensg9", "to_id": "brca1"}\n')
+    index = mapping_index.load_mapping_index([mapping_file], "genename", index_folder=str(tmpdir))
+    assert index.mapping.lookup("ensg9") == ["brca1"]
+
+    unpickled = pickle.loads(pickle.dumps(index.mapping))
+    assert len(pickle.dumps(index.mapping)) < 1000
+    assert unpickled.lookup("ensg9") == ["brca1"]
+
+
+def test_mapping_index_saved_by_another_process(tmpdir, monkeypatch):
+    mapping_file = write_mapping_file(tmpdir)
+    index_folder = tmpdir.mkdir("index")
+
+    def concurrent_replace(tmp_path, index_path):
+        # another process saves the same index first, so the folder can not be replaced
+        shutil.copytree(tmp_path, index_path)
+        raise OSError("Directory not empty")
+    monkeypatch.setattr(mapping_index.os, "replace", concurrent_replace)
+    index = mapping_index.load_mapping_index([mapping_file], "uniprotac", index_folder=str(index_folder))
+    assert index.mapping.files is not None
+    assert index.mapping.lookup("ensg1") == ["p00001", "p00003"]
+    assert [name for name in os.listdir(str(index_folder)) if name.endswith(".tmp")] == []
+
+
+def test_empty_mapping(tmpdir):
+    empty = tmpdir.join("empty.json")
+    empty.write("")
+    index = mapping_index.load_mapping_index([str(empty)], "uniprotac")
+    assert len(index.mapping) == 0
+    assert index.mapping["p00001"] == set()
+
+
+def test_selected_mapping(tmpdir):
+    mapping_file = write_mapping_file(tmpdir)
+    index = mapping_index.load_selected_mapping_index([mapping_file], "uniprotac", ["ENSG1", "tp53"])
+    assert index.mapping.lookup("ensg1") == ["p00001", "p00003"]
+    assert "ensg2" not in index.mapping
+    assert index.uniquename["tp53"] == {"p04637"}
+    assert not tmpdir.listdir(lambda path: path.basename.startswith("mapping_index_"))
@@ -0,0 +1,37 @@
+import pandas as pd
+from common_libs.id_mapping import uniprot_format
+
+
+def interactor():
+    ids = pd.Series(["mirbase:hsa-mir-99b-5p", "uniprotac:o95150-1", "uniprotac:p15172", "uniprotac:o95150-1"])
+    alts = pd.Series(["mirbase:hsa-mir-99b-5p", "name:alx3", "-", "-"])
+    annotations = pd.Series(["start:micro rna;mirbase;hsa-mir-99b-5p", "start:gene;uniprotac;o95150-1",
+                             "start:protein;uniprotac;p15172", "start:gene;uniprotac;o95150-1"])
+    return ids, alts, annotations
+
+
+def test_format_interactor():
+    ids, alts, annotations = uniprot_format.format_interactor(*interactor(), True, True)
+    assert ids.tolist() == ["mirbase:hsa-mir-99b-5p", "uniprotac:O95150", "uniprotac:P15172", "uniprotac:O95150"]
+    assert alts.tolist() == ["mirbase:hsa-mir-99b-5p", "name:alx3|uniprotac:O95150-1", "-", "uniprotac:O95150-1"]
+    assert annotations.tolist() == ["start:micro rna;mirbase;hsa-mir-99b-5p", "start:gene;uniprotac;O95150",
+                                    "start:protein;uniprotac;P15172", "start:gene;uniprotac;O95150"]
+
+    ids, alts, annotations = uniprot_format.format_interactor(*interactor(), True, None)
+    assert ids.tolist()[1] == "uniprotac:O95150-1"
+    assert alts.tolist() == interactor()[1].tolist()
+
+    assert [column.tolist() for column in uniprot_format.format_interactor(*interactor(), None, None)] == \
+        [column.tolist() for column in interactor()]
+
+
+def test_format_network():
+    ids, alts, annotations = interactor()
+    network = pd.DataFrame({column: ["-"] * 4 for column in range(42)})
+    network[1], network[3], network[26] = ids, alts, annotations.str.replace("start:", "end:")
+    formatted = uniprot_format.format_network(network, None, True)
+    assert formatted[1].tolist() == ["mirbase:hsa-mir-99b-5p", "uniprotac:o95150", "uniprotac:p15172",
+                                     "uniprotac:o95150"]
+    assert formatted[26].tolist()[1] == "end:gene;uniprotac;o95150"
+    assert formatted[0].tolist() == ["-"] * 4
+    assert network[1].tolist() == ids.tolist()
@@ -0,0 +1,91 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# e.g. having the uniprot ID: uniprotac:P2E7D5-54, the groups are:
+# group 1: P2E7D5-54 (the original ID), group 2: P2E7D5 (the ID without the isoform), group 3: D5, group 4: -54
+uniprot_pattern = re.compile(r"uniprotac\S(([A-Za-z][0-9]([A-Za-z0-9][A-Za-z0-9]){2,4})(-[0-9]{1,2})?)")
+
+# (0-based) columns of a MITAB line which can contain UniProt IDs, for interactor A and B: the IDs, the
+# alternative IDs (where the isoforms are kept) and the annotations (NOX fully qualified IDs)
+id_columns = (0, 1)
+alt_columns = (2, 3)
+annotation_columns = (25, 26)
+
+
+def format_interactor(ids, alts, annotations, upper_case, no_isoform):
+    """
+    Formats the UniProt IDs of one interactor (A or B) of MITAB lines, vectorised.
+
+    If no_isoform is given, the isoforms are removed from the IDs and the annotations, and the original IDs
+    (with the isoform) are added to the alternative IDs. If upper_case is given, the UniProt IDs are
+    uppercase. Otherwise the IDs are not changed.
+
+    Parameters
+    ----------
+    ids: pandas Series of str, the IDs of the interactor (e.g. uniprotac:a6pvc2-1)
+    alts: pandas Series of str, the alternative IDs of the interactor
+    annotations: pandas Series of str, the annotations of the interactor (e.g. start:protein;uniprotac;a6pvc2-1)
+    upper_case: boolean
+    no_isoform: boolean
+
+    Returns
+    -------
+    The formatted ids, alts and annotations (pandas Series)
+    """
+    if not (upper_case or no_isoform):
+        return ids, alts, annotations
+
+    def new_ids(matches):
+        new_id = matches[1] if no_isoform else matches[0]
+        return new_id.str.upper() if upper_case else new_id
+
+    def format_ids(distinct_ids):
+        matches = distinct_ids.str.extract(uniprot_pattern)
+        original_ids = matches[0].str.upper() if upper_case else matches[0]
+        return pd.DataFrame({"id": distinct_ids.where(matches[0].isna(), "uniprotac:" + new_ids(matches)),
+                             "isoform": ("uniprotac:" + original_ids).where(matches[3].notna())})
+
+    def format_annotations(distinct_annotations):
+        matches = distinct_annotations.str.extract(uniprot_pattern)
+        parts = distinct_annotations.str.split(";")
+        # the molecule type and the ID type of the annotation are kept
+        formatted = parts.str[0] + ";" + parts.str[1] + ";" + new_ids(matches)
+        return distinct_annotations.where(formatted.isna(), formatted)
+
+    formatted_ids = _distinct(ids, format_ids)
+
+    formatted_alts = alts
+    if no_isoform:
+        # the original IDs with an isoform are added to the alternative IDs
+        isoforms = formatted_ids["isoform"]
+        alt_ids = pd.Series(np.where(alts != "-", alts + "|", ""), index=alts.index) + isoforms
+        formatted_alts = alts.where(isoforms.isna(), alt_ids)
+
+    return formatted_ids["id"], formatted_alts, _distinct(annotations, format_annotations)
+
+
+def _distinct(values, function):
+    """ Calls a vectorised function on the distinct values only (the nodes are repeated in a network) """
+    codes, distinct_values = pd.factorize(values)
+    result = function(pd.Series(distinct_values, dtype=object))
+    return result.iloc[codes].set_axis(values.index, axis=0)
+
+
+def format_network(network, upper_case, no_isoform):
+    """
+    Formats the UniProt IDs of a MITAB dataframe (e.g. MiTabHandler.network), vectorised. Only the columns
+    which can contain UniProt IDs are read (see format_interactor).
+
+    Returns
+    -------
+    The formatted dataframe (a copy)
+    """
+    network = network.copy()
+    for columns in zip(id_columns, alt_columns, annotation_columns):
+        labels = [network.columns[column] for column in columns]
+        formatted = format_interactor(*[network[label].astype(str) for label in labels], upper_case, no_isoform)
+        for label, values in zip(labels, formatted):
+            network[label] = values
+    return network
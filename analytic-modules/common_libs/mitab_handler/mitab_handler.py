@@ -355,6 +355,37 @@ class MiTabHandler:
             raise IndexError
 
 
+class MiTabWriter:
+
+    """
+    A streaming writer for the MiTab 2.7 format. The interactions are formatted the same
+    way as MiTabHandler.serialise_mitab formats them (missing values are written as "-"
+    and all values are converted to lowercase), but every interaction is written as soon
+    as it is added, so no dataframe has to be built. Duplicates are not removed, the
+    caller has to take care of them.
+    """
+
+    def __init__(self, output_file, add_header=False):
+        """
+        Parameters
+        ----------
+        output_file: file object opened for writing in text mode
+        add_header: boolean, if the file should add the mitab header information
+        """
+        # the same column names as in MiTabHandler (writer.uidA, writer.annotInter, ...)
+        MiTabHandler._map_mitab(self)
+        self.writer = csv.writer(output_file, delimiter='\t', lineterminator='\n')
+        if add_header:
+            self.writer.writerow(mitab_header)
+
+    def write_interaction(self, interaction):
+        """ Write an interaction (a dictionary created by MiTabHandler.new_interaction) """
+        self.writer.writerow(['-' if interaction[column] is None else str(interaction[column]).lower()
+                              for column in mitab_header])
+
+    new_interaction = staticmethod(MiTabHandler.new_interaction)
+
+
 # CLASS ERRORS
 class MiTabError(Exception):
     pass
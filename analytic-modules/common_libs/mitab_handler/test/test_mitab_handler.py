@@ -77,3 +77,19 @@ def test_sherlock_serialise(tmpdir):
     adict = [ob for ob in act]
 
     assert edict == adict
+
+
+def test_mitab_writer(tmpdir):
+    output_file = tmpdir.join("network.tsv")
+    with open(output_file.strpath, "w") as output:
+        writer = mitab_handler.MiTabWriter(output)
+        interaction = writer.new_interaction()
+        interaction[writer.uidA] = "UniProtAC:P00001"
+        interaction[writer.uidB] = "uniprotac:p00002"
+        interaction[writer.annotInter] = ""
+        writer.write_interaction(interaction)
+
+    line = output_file.read().rstrip("\n").split("\t")
+    assert len(line) == len(mitab_handler.mitab_header)
+    assert line[:3] == ["uniprotac:p00001", "uniprotac:p00002", "-"]
+    assert line[27] == ""
@@ -1,5 +1,7 @@
 import os
 
+from common_libs.file_handler import file_handler
+
 
 def generate(path_to_fasta, path_to_vcf, out_path, read_length):
     """
@@ -46,8 +48,8 @@ def generate(path_to_fasta, path_to_vcf, out_path, read_length):
     if not os.path.exists(path_to_vcf):
         raise FileNotFoundError("VCF file not found: " + path_to_vcf)
 
-    with open(path_to_fasta) as my_fasta:
-        with open(path_to_vcf) as my_vcf:
+    with file_handler.open_file(path_to_fasta) as my_fasta:
+        with file_handler.open_file(path_to_vcf) as my_vcf:
             with open(out_path, mode="w") as fout:
                 my_iterator = fasta_iterator(my_fasta)
                 for vcf_line in my_vcf:
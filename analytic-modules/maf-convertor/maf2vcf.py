@@ -5,6 +5,7 @@ import sys
 import pandas as pd
 import numpy as np
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 
 # VCF Header information
@@ -41,6 +42,9 @@ vcf_header = \
 MAF_COLUMNS = ["case_id", "Tumor_Sample_Barcode", "Chromosome", "Start_Position", "dbSNP_RS", "Reference_Allele",
                "Tumor_Seq_Allele1", "Tumor_Seq_Allele2"]
 
+# Number of MAF rows read at a time
+MAF_CHUNK_SIZE = 1000000
+
 # VCF file column headings
 VCF_COLUMNS = ["CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
 
@@ -66,6 +70,8 @@ def check_args(args=None):
         --maf -m <path to the original maf file (.maf)> [mandatory]
         --patientvcf -vcf <path to where the patient vcf files should be saved> [mandatory]
         --clinical -c <str, a path to where the patient clinical data is being held> [optional] 
+        --chunk-size -n <int, number of rows of the maf file read at a time> [optional, default is 1000000]
+        --workers -w <int, number of threads writing the patient vcf files> [optional, default is the number of CPUs]
         --verbose -v <boolean, whether to display verbose information> [optional, default is False]
         """
 
@@ -108,6 +114,22 @@ def check_args(args=None):
                         action="store",
                         required=False)
 
+    # Chunk size
+    parser.add_argument("-n", "--chunk-size",
+                        help="<number of rows of the maf file read at a time (Default: 1000000)> [optional]",
+                        dest="chunk_size",
+                        type=int,
+                        action="store",
+                        default=MAF_CHUNK_SIZE)
+
+    # Number of writer threads
+    parser.add_argument("-w", "--workers",
+                        help="<number of threads writing the patient vcf files (Default: number of CPUs)> [optional]",
+                        dest="workers",
+                        type=int,
+                        action="store",
+                        default=None)
+
     # Verbosity level
     parser.add_argument("-v", "--verbose",
                         help="Verbosity level (Default: False)",
@@ -118,7 +140,8 @@ def check_args(args=None):
     # Get arguments
     results = parser.parse_args(args)
 
-    return results.maf, results.output, results.clinical_file, results.threshold, results.reference, results.verbose
+    return results.maf, results.output, results.clinical_file, results.threshold, results.reference, results.verbose, \
+        results.chunk_size, results.workers
 
 
 def map_maf_files_to_clinical(patient_id, clinical_file, output_path):
@@ -152,103 +175,118 @@ def map_maf_files_to_clinical(patient_id, clinical_file, output_path):
     raw_clinical_file.to_csv(output_path, sep='\t')
 
 
-def _create_patient_vcf_file(patient_vcf_data, patient_folder, patient_id):
+def _snv_records(maf_frame):
     """
-    From the pre-indexed patient maf file create a vcf file for the patient. The SNPs are
-    filtered and only point mutations are taken. Frame-shift and large deletions are
-    ignored from the somatic mutations listed in the MAF files. The case-id is used as the
-    patient_id and then QUAL and FILTER are placed a blank as default of a VCF file. To
-    determine the genotype information the reference allele is compared against the tumour
-    allele 1 and tumour allele 2. If they match a 0 is placed down and if they are different
-    a 1 is put placed in the genotype string.
+    Selects the point mutations of a MAF dataframe and builds their VCF records in a vectorised way. Only
+    the SNVs with a dbSNP ID, not on chromosome X and with single base reference and tumour alleles are
+    kept; frame-shifts and large deletions are ignored. To determine the genotype information the reference
+    allele is compared against the tumour allele 1 and tumour allele 2: if they match a 0 is placed down and
+    if they are different a 1 is put placed in the genotype string.
 
     Parameters
     ----------
-    patient_vcf_data : Pandas DataFrame, a dataframe holding the
-    patient_folder : str, path to the folder where the patient vcf files should be written too
-    patient_id : list, list of a string containing the tumour-id showing the case (patient)
+    maf_frame : Pandas DataFrame, MAF rows (with the MAF_COLUMNS)
 
     Returns
     -------
-    snp_identifiers : list, a  list of SNPs (dbSNP) found in the patient
+    records : Pandas DataFrame, with the case_id, the dbSNP_RS and the VCF line of each SNV
+    """
+    reference = maf_frame.Reference_Allele.astype(str)
+    allele_1 = maf_frame.Tumor_Seq_Allele1.astype(str)
+    allele_2 = maf_frame.Tumor_Seq_Allele2.astype(str)
+    snv = (maf_frame.dbSNP_RS.astype(str).str.startswith("rs") & (maf_frame.Chromosome != "chrX") &
+           (reference.str.len() == 1) & (allele_2.str.len() == 1) & (reference != "-"))
+    maf_frame, reference, allele_1, allele_2 = maf_frame[snv], reference[snv], allele_1[snv], allele_2[snv]
+
+    genotype = (pd.Series(np.where(reference != allele_2, "1", "0"), index=maf_frame.index) + "/" +
+                pd.Series(np.where(allele_1 != allele_2, "1", "0"), index=maf_frame.index))
+    alternative = allele_2.where(allele_2 != "-", "*")
+    lines = (maf_frame.Chromosome.astype(str) + "\t" + maf_frame.Start_Position.astype(np.int64).astype(str) + "\t" +
+             maf_frame.dbSNP_RS.astype(str) + "\t" + reference + "\t" + alternative + "\t.\t.\tPR\tGT\t" +
+             genotype + "\t\n")
+    return pd.DataFrame({"case_id": maf_frame.case_id, "dbSNP_RS": maf_frame.dbSNP_RS, "line": lines})
+
+
+def _create_patient_vcf_file(patient_lines, patient_folder, patient_id):
+    """
+    Writes the vcf file of a patient. The case-id is used as the patient_id and then QUAL and FILTER are
+    placed a blank as default of a VCF file.
+
+    Parameters
+    ----------
+    patient_lines : list, the VCF records of the patient (see _snv_records)
+    patient_folder : str, path to the folder where the patient vcf files should be written too
+    patient_id : str, the case (patient) id
     """
     patient_file_name = os.path.join(patient_folder, f"{patient_id}.vcf")
     tumour_id = f"{patient_id}_{patient_id}"
     vcf_cols = VCF_COLUMNS + [tumour_id]
-    snp_identifiers = []
 
     with open(patient_file_name, "w") as vcf_file:
         # Write header and contig information
         vcf_file.writelines(vcf_header)
         vcf_file.writelines([col + "\t" for col in vcf_cols])
         vcf_file.write("\n")
+        vcf_file.writelines(patient_lines)
+
 
-        # Create new vcf columns
-        new_row = dict.fromkeys(vcf_cols)
-        for row in patient_vcf_data.itertuples():
-            if str(row.dbSNP_RS).startswith("rs") and row.Chromosome != "chrX":
-                if len(row.Reference_Allele) == 1 and len(row.Tumor_Seq_Allele2) == 1 and row.Reference_Allele != "-":
-                    # Process the genotype
-                    genotype_value = ["0", "/", "0"]
-                    if row.Reference_Allele != row.Tumor_Seq_Allele2:
-                        genotype_value[0] = "1"
-                    if row.Tumor_Seq_Allele1 != row.Tumor_Seq_Allele2:
-                        genotype_value[2] = "1"
-                    genotype_value = "".join(genotype_value)
-
-                    # Create new entry
-                    new_row["CHROM"] = row.Chromosome
-                    new_row["POS"] = row.Start_Position
-                    new_row["ID"] = row.dbSNP_RS
-                    new_row["REF"] = row.Reference_Allele
-                    if row.Tumor_Seq_Allele2 == "-":
-                        new_row["ALT"] = "*"
-                    else:
-                        new_row["ALT"] = row.Tumor_Seq_Allele2
-                    new_row["QUAL"] = "."
-                    new_row["FILTER"] = "."
-                    new_row["INFO"] = "PR"
-                    new_row["FORMAT"] = "GT"
-                    new_row[tumour_id] = genotype_value
-
-                    for item in new_row.items():
-                        vcf_file.write(f"{item[1]}\t")
-
-                    vcf_file.write("\n")
-                    snp_identifiers.append(row.dbSNP_RS)
-
-    return snp_identifiers
-
-
-def convert_maf_to_vcf(maf, patient_folder, verbose):
+def read_maf(maf, chunk_size=MAF_CHUNK_SIZE):
     """
-    For each of the tumour samples and therefore cases found in the MAF file, iterate over these
-    and create a vcf from the subset indexed on the tumour id. Then call the internal function
-    _create_patient_vcf_file() to create the individual vcf files. This will return a list of
-    SNPs found in the patient.
+    Reads a MAF file in chunks of chunk_size rows, keeping only the SNVs (see _snv_records) of each chunk,
+    so very large MAF files do not have to fit in the memory. Rows with missing values and novel SNPs
+    are removed.
+
+    Returns
+    -------
+    records : Pandas DataFrame, the SNV records of the MAF file (see _snv_records)
+    patient_ids : list, the case ids of the MAF file in the order of their first appearance
+    """
+    chunks = []
+    patient_ids = {}
+    for maf_frame in pd.read_csv(maf, skiprows=5, delimiter="\t", usecols=MAF_COLUMNS, index_col=False,
+                                 chunksize=chunk_size):
+        maf_frame = maf_frame.dropna()
+        maf_frame = maf_frame[~maf_frame.dbSNP_RS.astype(str).str.contains("novel")]
+        patient_ids.update(dict.fromkeys(pd.unique(maf_frame[MAF_COLUMNS[0]])))
+        chunks.append(_snv_records(maf_frame))
+    records = pd.concat(chunks) if chunks else pd.DataFrame(columns=["case_id", "dbSNP_RS", "line"])
+    return records, list(patient_ids)
+
+
+def convert_maf_to_vcf(maf, patient_folder, verbose, chunk_size=MAF_CHUNK_SIZE, workers=None):
+    """
+    Reads the MAF file (see read_maf), groups the SNVs by the cases (patients) in a single pass and
+    writes the vcf file of each patient with _create_patient_vcf_file() in parallel threads. Patients
+    without SNVs get a vcf file with only the header.
 
     Parameters
     ----------
     maf : str, path to the maf file
     patient_folder : str, to the folder of the patients
     verbose : boolean, to display verbose details or not
+    chunk_size : int, number of rows of the maf file read at a time
+    workers : int, number of threads writing the vcf files (default: the number of CPUs)
 
     Returns
     -------
-    maf_frame : Pandas dataframe, containing a tabulated MAF file
+    snp_identifiers : list, a list of SNPs (dbSNP) found in the patients
+    patient_ids : list, the case ids of the patients
     """
-    snp_identifiers = []
-    maf_frame = pd.read_csv(maf, skiprows=5, delimiter="\t", usecols=MAF_COLUMNS, index_col=False)
-    maf_frame = maf_frame.dropna()
-    maf_frame = maf_frame[~maf_frame.dbSNP_RS.str.contains("novel")]
-    patient_ids = pd.unique(maf_frame[MAF_COLUMNS[0]])
+    records, patient_ids = read_maf(maf, chunk_size)
+    patient_groups = {case: group for case, group in records.groupby("case_id", sort=False)}
+    patient_lines = {case: group.line.tolist() for case, group in patient_groups.items()}
+    if verbose:
+        print(f"{len(records)} SNVs found for {len(patient_ids)} patients")
 
-    for case in patient_ids:
-        patient_frame = maf_frame[MAF_COLUMNS[0]].isin([case])
-        patient_frame = maf_frame[patient_frame]
-        snp_list = _create_patient_vcf_file(patient_frame, patient_folder, case)
-        snp_identifiers.extend(snp_list)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for _ in executor.map(lambda case: _create_patient_vcf_file(patient_lines.get(case, []), patient_folder, case),
+                              patient_ids):
+            pass
 
+    snp_identifiers = []
+    for case in patient_ids:
+        if case in patient_groups:
+            snp_identifiers.extend(patient_groups[case].dbSNP_RS.tolist())
     return snp_identifiers, patient_ids
 
 
@@ -344,10 +382,10 @@ def _create_output_dir(output_path):
 def main(argv):
     """ Main method for converting the maf file to vcf files"""
     try:
-        maf, output_folder, clinical_file, threshold, reference, verbose = check_args(argv)
+        maf, output_folder, clinical_file, threshold, reference, verbose, chunk_size, workers = check_args(argv)
         check_file_format(maf, output_folder)
         cohort_path, clinical_path, snp_path = _create_output_dir(output_folder)
-        snp_identifiers, patient_ids = convert_maf_to_vcf(maf, cohort_path, verbose)
+        snp_identifiers, patient_ids = convert_maf_to_vcf(maf, cohort_path, verbose, chunk_size, workers)
         create_snp_identifiers_list(snp_identifiers, snp_path, reference, threshold)
         if clinical_file:
             map_maf_files_to_clinical(patient_ids, clinical_file, clinical_path)
@@ -428,7 +428,8 @@ def extract_results(predictions):
 def create_network_file(mirna_preds, sequence_info, output):
     """
     A method to create the network file with the newly predicted interactions using the
-    mitab handler from the common libs
+    mitab handler from the common libs. If the sequence belongs to more genes (listed in the
+    sequence id separated by ','), an interaction is created for each of the genes.
 
     Parameters
     ----------
@@ -441,28 +442,32 @@ def create_network_file(mirna_preds, sequence_info, output):
     mitab = mitab_handler.MiTabHandler()
     inner_structure = {}
 
-    for idx, mirna in enumerate(mirna_preds):
-
-        interaction = mitab.new_interaction()
+    idx = 0
+    for mirna in mirna_preds:
 
         # Clean and extract data
         mirna_interaction_score = f"score: {mirna.Max_Score}; energy: {mirna.Max_Energy}"
         mirna_interaction_score = mirna_interaction_score.rstrip(';')
-        mirna_target = f'uniprotac:{mirna.Seq2.split(";")[2]}'
 
-        # Add Interactor A and B
-        interaction[mitab.uidA] = f'mirbase:{mirna.Seq1}'
-        interaction[mitab.uidB] = f'{mirna_target}'
-        interaction[mitab.taxA] = "taxid:9606('homo sapiens')"
-        interaction[mitab.taxB] = "taxid:9906('homo sapiens')"
+        for gene in mirna.Seq2.split(","):
+
+            interaction = mitab.new_interaction()
+            mirna_target = f'uniprotac:{gene.split(";")[2]}'
+
+            # Add Interactor A and B
+            interaction[mitab.uidA] = f'mirbase:{mirna.Seq1}'
+            interaction[mitab.uidB] = f'{mirna_target}'
+            interaction[mitab.taxA] = "taxid:9606('homo sapiens')"
+            interaction[mitab.taxB] = "taxid:9906('homo sapiens')"
 
-        # Add meta-data
-        interaction[mitab.annotA] = f'start:micro rna;mirbase;{mirna.Seq1}'
-        interaction[mitab.annotB] = f'end:{mirna.Seq2.split(":")[1]}'
-        interaction[mitab.annotInter] = f'origin:snp;dbsnp;{sequence_info[mirna.Seq2][0].split(":")[1]}' \
-                                        f' | {mirna_interaction_score} | {sequence_info[mirna.Seq2][1]}'
+            # Add meta-data
+            interaction[mitab.annotA] = f'start:micro rna;mirbase;{mirna.Seq1}'
+            interaction[mitab.annotB] = f'end:{gene.split(":")[1]}'
+            interaction[mitab.annotInter] = f'origin:snp;dbsnp;{sequence_info[mirna.Seq2][0].split(":")[1]}' \
+                                            f' | {mirna_interaction_score} | {sequence_info[mirna.Seq2][1]}'
 
-        inner_structure[idx] = interaction
+            inner_structure[idx] = interaction
+            idx += 1
 
     mitab.build_network_frame(inner_structure=inner_structure)
 
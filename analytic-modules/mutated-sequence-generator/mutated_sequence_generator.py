@@ -28,13 +28,19 @@ def check_args(args=None):
         will not be added to the output FASTA files (meaning there will be no "empty" sequence
         in the output).
 
+        More region classes (e.g. protein coding and promoter regions) can be processed in a
+        single run, by giving comma separated lists for --input_vcf, --output_wild_type,
+        --output_mutated and --region_length (with the same number of elements). In this case
+        each genomic span is read only once from the genome, even if it is needed by more SNPs
+        or region classes.
+
         """
 
     # New argument Parser
     parser = argparse.ArgumentParser(description=help_text)
 
     parser.add_argument("--input_vcf",
-                        help="<path to the input VCF file)> [mandatory]",
+                        help="<path to the input VCF file, or comma separated list of VCF files)> [mandatory]",
                         dest="input",
                         action="store",
                         required=True)
@@ -46,27 +52,39 @@ def check_args(args=None):
                         required=True)
 
     parser.add_argument("--output_wild_type",
-                        help="<path to the new output FASTA file with wild type sequences)> [mandatory]",
+                        help="<path to the new output FASTA file with wild type sequences, or comma separated "
+                             "list of paths (one for each input VCF)> [mandatory]",
                         dest="output_wild_type",
                         action="store",
                         required=True)
 
     parser.add_argument("--output_mutated",
-                        help="<path to the new output FASTA file with mutated sequences> [mandatory]",
+                        help="<path to the new output FASTA file with mutated sequences, or comma separated "
+                             "list of paths (one for each input VCF)> [mandatory]",
                         dest="output_mutated",
                         action="store",
                         required=True)
 
     parser.add_argument("--region_length",
-                        help="<0..1000: using e.g. 100 will fetch region: [X-100, x, x+100] with total length of 201> [mandatory]",
-                        type=int,
+                        help="<0..1000: using e.g. 100 will fetch region: [X-100, x, x+100] with total length of 201, "
+                             "or comma separated list of lengths (one for each input VCF)> [mandatory]",
                         dest="region_length",
                         action="store",
                         required=True)
 
     # Get arguments
     results = parser.parse_args(args)
-    return results.input, results.genome, results.output_wild_type, results.output_mutated, results.region_length
+    input_vcfs = results.input.split(",")
+    output_wild_types = results.output_wild_type.split(",")
+    output_mutateds = results.output_mutated.split(",")
+    try:
+        region_lengths = list(map(int, results.region_length.split(",")))
+    except ValueError:
+        parser.error("--region_length must be an integer or a comma separated list of integers")
+    if not len(input_vcfs) == len(output_wild_types) == len(output_mutateds) == len(region_lengths):
+        parser.error("--input_vcf, --output_wild_type, --output_mutated and --region_length "
+                     "must have the same number of elements")
+    return input_vcfs, results.genome, output_wild_types, output_mutateds, region_lengths
 
 
 def check_pars(input_vcf, genome, output_wild_type, output_mutated, region_length):
@@ -103,23 +121,40 @@ def mutate(input_vcf, genome, output_wild_type, output_mutated, region_length):
     """
     Mutate a sequence
     """
+    mutate_regions([input_vcf], genome, [output_wild_type], [output_mutated], [region_length])
+
+
+def mutate_regions(input_vcfs, genome, output_wild_types, output_mutateds, region_lengths):
+    """
+    Mutate the sequences of more region classes (e.g. protein coding and promoter regions), reading
+    each genomic span only once from the genome. The i-th input VCF is processed with the i-th region
+    length and written to the i-th wild type and mutated output FASTA files.
+    """
     # Check the arguments
-    check_pars(input_vcf, genome, output_wild_type, output_mutated, region_length)
+    for input_vcf, output_wild_type, output_mutated, region_length in zip(input_vcfs, output_wild_types,
+                                                                          output_mutateds, region_lengths):
+        check_pars(input_vcf, genome, output_wild_type, output_mutated, region_length)
+
+    # Convert the region .vcf files to .bed
+    for input_vcf, output_wild_type, region_length in zip(input_vcfs, output_wild_types, region_lengths):
+        region_VCF = vcf_to_bed.ProcessVcf(input_vcf, verbose=False)
+        region_VCF.vcf2bed(output_wild_type + ".tmp.bed", region_length, chr_decorator="")
 
-    # Convert the promoter .vcf to .bed
-    promoter_VCF = vcf_to_bed.ProcessVcf(input_vcf, verbose=False)
-    promoter_VCF.vcf2bed(output_wild_type + ".tmp.bed", region_length, chr_decorator="")
+    # Extract the FASTA genome sequences for all the region .bed files at once
+    filter_fasta.extract_genome_windows(genome,
+                                        [output_wild_type + ".tmp.bed" for output_wild_type in output_wild_types],
+                                        [output_wild_type + ".old.fasta" for output_wild_type in output_wild_types])
 
-    # Extract the FASTA genome sequences using the promoter .bed
-    filter_fasta.extract_genome(genome, output_wild_type + ".tmp.bed", output_wild_type + ".old.fasta")
-    filter_fasta.transform_the_wild_type_fasta(output_wild_type + ".old.fasta", input_vcf, output_wild_type)
-    os.remove(output_wild_type + ".tmp.bed")
-    os.remove(output_wild_type + ".old.fasta")
+    for input_vcf, output_wild_type, output_mutated, region_length in zip(input_vcfs, output_wild_types,
+                                                                          output_mutateds, region_lengths):
+        filter_fasta.transform_the_wild_type_fasta(output_wild_type + ".old.fasta", input_vcf, output_wild_type)
+        os.remove(output_wild_type + ".tmp.bed")
+        os.remove(output_wild_type + ".old.fasta")
 
-    # Mutate the promoter sequence
-    get_mutated_sequence.generate(output_wild_type, input_vcf, output_mutated, region_length)
+        # Mutate the region sequence
+        get_mutated_sequence.generate(output_wild_type, input_vcf, output_mutated, region_length)
 
 
 if __name__ == "__main__":
-    input_vcf, genome, output_wild_type, output_mutated, region_length = check_args()
-    mutate(input_vcf, genome, output_wild_type, output_mutated, region_length)
+    input_vcfs, genome, output_wild_types, output_mutateds, region_lengths = check_args()
+    mutate_regions(input_vcfs, genome, output_wild_types, output_mutateds, region_lengths)
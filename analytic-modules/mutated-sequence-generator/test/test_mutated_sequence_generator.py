@@ -1,6 +1,7 @@
 import os
 import pytest
 import mutated_sequence_generator as mut
+from common_libs.filters import filter_fasta
 
 input_vcf = "./test/sample_shorter.vcf"
 genome = "./test/human-annotation_renamed.fasta"
@@ -100,3 +101,17 @@ def test_mutate_sequence():
 
 
 
+
+
+def test_extract_genome_windows(tmpdir):
+    with open(genome) as fin:
+        chr1 = "".join(line.strip() for line in fin.read().split(">chr2")[0].splitlines()[1:])
+    bed_short = tmpdir.join("short.bed")
+    bed_long = tmpdir.join("long.bed")
+    bed_short.write("chr1\t0\t11\tsnp1\t\nchr1\t25\t36\tsnp2\t\nchr1\t995\t1006\tout_of_range\t\n")
+    bed_long.write("chr1\t20\t41\tsnp2\t\nchr1\t0\t201\tsnp3\t\nchr9\t0\t11\tunknown_chromosome\t\n")
+    out_short = tmpdir.join("short.fasta")
+    out_long = tmpdir.join("long.fasta")
+    filter_fasta.extract_genome_windows(genome, [str(bed_short), str(bed_long)], [str(out_short), str(out_long)])
+    assert out_short.read() == ">snp1\n" + chr1[0:11] + "\n>snp2\n" + chr1[25:36] + "\n"
+    assert out_long.read() == ">snp2\n" + chr1[20:41] + "\n>snp3\n" + chr1[0:201] + "\n"
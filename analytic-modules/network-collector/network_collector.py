@@ -1,20 +1,103 @@
 import argparse
+import io
 import os
 import sys
 import tarfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.file_handler import shard_manifest
+from common_libs.file_handler.file_handler import BgzfWriter
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-def collect_networks(input_file_list, output_file):
-    with tarfile.open(output_file, "w:gz") as tar:
-        for name in input_file_list:
-            tar.add(name)
+# compression level of each codec: (default, minimum, maximum)
+codec_levels = {"gzip": (6, 1, 9), "zstd": (3, 1, 22), "none": (None, None, None)}
 
 
-def check_params(input_file_list):
+def _read_file(name):
+    with open(name, mode="rb") as fin:
+        return fin.read()
+
+
+def prefetch_files(input_file_list, executor, max_pending):
+    """
+    Yields the (name, content) of the input files in order, while the next files (at most max_pending)
+    are read by the thread pool, so reading the inputs overlaps with the compression.
+    """
+    pending = deque()
+    for name in input_file_list:
+        pending.append((name, executor.submit(_read_file, name)))
+        if len(pending) > max_pending:
+            name, future = pending.popleft()
+            yield name, future.result()
+    while pending:
+        name, future = pending.popleft()
+        yield name, future.result()
+
+
+def _open_output(output_file, codec, level, threads):
+    """ Opens the compressed output stream of the tar archive """
+    if codec == "gzip":
+        return BgzfWriter(output_file, level, threads)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level, threads=threads).stream_writer(open(output_file, mode="wb"))
+    return open(output_file, mode="wb")
+
+
+def collect_networks(input_file_list, output_file, codec="gzip", level=None, threads=None):
+    """
+    Collects the network files into a tar archive. The input files are read by a thread pool, and the
+    archive is compressed in parallel: with the gzip codec as BGZF blocks (readable by gzip and tar, like
+    the output of pigz), with the zstd codec by the multi-threaded zstandard compressor.
+
+    Parameters
+    ----------
+    input_file_list: list of str, paths to the network files
+    output_file: str, path to the output archive
+    codec: str, gzip (default), zstd or none
+    level: int, compression level, by default 6 for gzip and 3 for zstd
+    threads: int, number of threads reading and compressing, by default the number of CPUs
+    """
+    threads = threads or os.cpu_count() or 1
+    if level is None:
+        level = codec_levels[codec][0]
+    with _open_output(output_file, codec, level, threads) as output, \
+            ThreadPoolExecutor(max_workers=threads) as readers, \
+            tarfile.open(fileobj=output, mode="w|") as tar:
+        for name, content in prefetch_files(input_file_list, readers, threads * 2):
+            tarinfo = tar.gettarinfo(name)
+            if tarinfo.isreg():
+                tarinfo.size = len(content)
+                tar.addfile(tarinfo, io.BytesIO(content))
+            else:
+                tar.addfile(tarinfo)
+
+
+def order_by_manifest(input_file_list, manifest_file):
+    """ Orders the network files by the shards of a manifest (see shard_manifest.order_by_manifest) """
+    try:
+        return shard_manifest.order_by_manifest(input_file_list, shard_manifest.read_manifest(manifest_file))
+    except (OSError, shard_manifest.InvalidManifest) as error:
+        print(f"ERROR! {error}")
+        sys.exit(3)
+
+
+def check_params(input_file_list, codec="gzip", level=None):
     for input_file in input_file_list:
         if not os.path.isfile(input_file):
             print("ERROR! the specified input file doesn't exists: " + input_file)
             sys.exit(1)
+    if codec == "zstd" and zstandard is None:
+        print("ERROR! the zstd codec needs the zstandard python package")
+        sys.exit(2)
+    _, min_level, max_level = codec_levels[codec]
+    if level is not None and (min_level is None or not min_level <= level <= max_level):
+        print(f"ERROR! invalid compression level for the {codec} codec: {level}")
+        sys.exit(2)
 
 
 def parse_args(args=None):
@@ -33,6 +116,10 @@ def parse_args(args=None):
 
     --input-files <comma separated list of network files from each iteration> [mandatory]
     --output-file <path to the output tar.gz network set file> [mandatory]   
+    --codec <compression of the network set file: gzip, zstd or none> [optional, default: gzip]
+    --level <compression level, 1-9 for gzip, 1-22 for zstd> [optional, default: 6 for gzip, 3 for zstd]
+    --threads <number of threads reading and compressing the files> [optional, default: number of CPUs]
+    --manifest <path to the manifest file of the sharded iterations> [optional]
     """
 
     parser = argparse.ArgumentParser(description=description)
@@ -50,17 +137,53 @@ def parse_args(args=None):
                         action='store',
                         required=True)
 
+    # Compression codec
+    parser.add_argument("-c",
+                        "--codec",
+                        dest='codec',
+                        action='store',
+                        choices=sorted(codec_levels),
+                        default="gzip",
+                        required=False)
+
+    # Compression level
+    parser.add_argument("-l",
+                        "--level",
+                        dest='level',
+                        type=int,
+                        action='store',
+                        required=False)
+
+    # Number of threads
+    parser.add_argument("-t",
+                        "--threads",
+                        dest='threads',
+                        type=int,
+                        action='store',
+                        default=os.cpu_count(),
+                        required=False)
+
+    # Manifest of the sharded iterations
+    parser.add_argument("-m",
+                        "--manifest",
+                        dest='manifest',
+                        action='store',
+                        required=False)
+
     results = parser.parse_args(args)
 
-    return results.input_files, results.output_file
+    return (results.input_files, results.output_file, results.codec, results.level, results.threads,
+            results.manifest)
 
 
 def main():
     """ Run module """
-    input_files, output_file = parse_args(sys.argv[1:])
+    input_files, output_file, codec, level, threads, manifest_file = parse_args(sys.argv[1:])
     input_file_list = input_files.split(',')
-    check_params(input_file_list)
-    collect_networks(input_file_list, output_file)
+    check_params(input_file_list, codec, level)
+    if manifest_file:
+        input_file_list = order_by_manifest(input_file_list, manifest_file)
+    collect_networks(input_file_list, output_file, codec, level, threads)
 
 
 if __name__ == "__main__":
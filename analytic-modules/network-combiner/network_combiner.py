@@ -1,9 +1,16 @@
 import argparse
 import sys
 import os
+import re
+import heapq
+import itertools
+import tempfile
 sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
 from common_libs.mitab_handler import mitab_handler
 
+# buffer size of the run files of the external sort
+run_buffer_size = 1024 * 1024
+
 
 def parse_args(args):
     help_text = \
@@ -18,7 +25,9 @@ def parse_args(args):
 
         At least one input network file must be provided. If all the input files are representing 
         empty networks, then an output file will be also empty. The output network will contain no 
-        duplicate links. We are treating all the links in the input files as undirected.
+        duplicate links. We are treating all the links in the input files as undirected. A link is
+        written in the orientation of its first appearance, with the metadata of the input lines in the
+        same orientation.
 
         When the 'union' method is chosen, then all those links will appear in the output networks,
         which were present in any of the input networks. For the 'intersection' method, only the links
@@ -29,6 +38,19 @@ def parse_args(args):
         If there is only a single network as an input, then the union and the intersection will be equal 
         to the input file, while the difference is an empty network.
 
+        The 'K-of-n' method (e.g. '2-of-n') keeps the links present in at least K of the input networks, so 
+        '1-of-n' is the union. The 'count' method writes the union, with the number of input networks 
+        containing the link in the confidence score column (e.g. networks:3).
+
+        The undirected links are identified by integer keys of their two nodes, and the links of all the 
+        input networks are counted in a single pass, so every method takes linear time in the size of the 
+        inputs. The output is written with a single streaming writer.
+
+        If the links of the inputs do not fit in the memory, the --memory-limit option switches to an 
+        external sort-merge: the links are sorted in runs of the given size, written to temporary files next 
+        to the output file, and the runs are merged while the links are counted and written. The output is 
+        the same as without the option, only the molecule types of the nodes are kept in the memory.
+
         The metadata stored for the input files for the nodes or links will not be preserved in the 
         output file.
 
@@ -39,13 +61,16 @@ def parse_args(args):
 
         --output-file <path to an output network set file> [mandatory]   
 
-        --method <method name: union|intersection|difference> [mandatory]
+        --method <method name: union|intersection|difference|K-of-n|count> [mandatory]
+
+        --memory-limit <memory used for sorting the links, e.g. 500M or 4G> [optional]
         
         
         **Exit codes:**
 
         Exit code 1: One of the specified input file doesn't exists!
         Exit code 2: The method doesn't exists!
+        Exit code 3: The memory limit is not valid!
         """
 
     parser = argparse.ArgumentParser(description=help_text)
@@ -67,36 +92,75 @@ def parse_args(args):
 
     # Method
     parser.add_argument("-m", "--method",
-                        help="<union or intersection or difference> [mandatory]",
+                        help="<union or intersection or difference or K-of-n or count> [mandatory]",
                         type=str,
                         dest="method",
                         action="store",
                         required=True)
 
-    results = parser.parse_args(args)
-    return results.input_files, results.output_file, results.method
-
+    # Memory limit of the external sort
+    parser.add_argument("-l", "--memory-limit",
+                        help="<memory used for sorting the links, e.g. 500M or 4G> [optional]",
+                        type=str,
+                        dest="memory_limit",
+                        action="store",
+                        required=False)
 
-def check_params(input_file_list, method):
+    results = parser.parse_args(args)
+    return results.input_files, results.output_file, results.method, results.memory_limit
+
+
+def network_filter(method, n_networks):
+    """
+    Returns a function deciding from the number of input networks containing a link, whether the link
+    should be in the output network of the method.
+
+    Parameters
+    ----------
+    method : str
+        union | intersection | difference | count | K-of-n (e.g. 2-of-n).
+    n_networks : int
+        number of input networks.
+    """
+    if method in ("union", "count"):
+        return lambda count: True
+    if method == "intersection":
+        return lambda count: count == n_networks
+    if method == "difference":
+        return lambda count: count < n_networks
+    min_networks = int(method.split("-", 1)[0])
+    return lambda count: count >= min_networks
+
+
+def check_params(input_file_list, method, memory_limit=None):
     for input_file in input_file_list:
         if not os.path.isfile(input_file):
             sys.stderr.write(f"ERROR! one of the specified input file doesn't exists: {input_file}")
             sys.exit(1)
 
-    methods = ["union", "intersection", "difference"]
-    if method not in methods:
+    methods = ["union", "intersection", "difference", "count"]
+    if method not in methods and not re.fullmatch(r"[1-9][0-9]*-of-n", method):
         sys.stderr.write(f"ERROR! the method doesn't exists: {method}")
         sys.exit(2)
 
+    if memory_limit is not None and not parse_memory_limit(memory_limit):
+        sys.stderr.write(f"ERROR! the memory limit is not valid: {memory_limit}")
+        sys.exit(3)
+
 
 def one_input_file(input_file, output_file, method):
 
+    keep = network_filter(method, 1)(1)
+
     with open(input_file, "r") as input_network, open(output_file, "w") as output_network:
+        if not keep:
+            return
+
+        mitab = mitab_handler.MiTabWriter(output_network)
+
         for line in input_network:
             info = line.strip().split("\t")
 
-            mitab = mitab_handler.MiTabHandler()
-
             interaction = mitab.new_interaction()
 
             interaction[mitab.uidA] = f'{info[0]}'
@@ -106,140 +170,275 @@ def one_input_file(input_file, output_file, method):
             interaction[mitab.annotA] = f'{info[25]}'
             interaction[mitab.annotB] = f'{info[26]}'
             interaction[mitab.annotInter] = f'{info[27]}'
-
-            mitab.add_interaction(interaction)
-
-            if method == "union":
-                mitab.serialise_mitab(output_network, add_header=False)
-
-            elif method == "intersection":
-                mitab.serialise_mitab(output_network, add_header=False)
-
-            elif method == "difference":
-                output_network.write("")
-
-        output_network.close()
-
-
-def parse_network_files(input_files_path, meta_data, snp_meta_data):
-
-    results = []
+            if method == "count":
+                interaction[mitab.confidence] = f'networks:1'
+
+            mitab.write_interaction(interaction)
+
+
+def parse_network_files(input_files_path):
+    """
+    Reads the input networks, each file once. The node IDs are interned to integers, and every
+    undirected link gets an integer key from its two (ordered) node numbers, so the links of the
+    networks are counted with a single dictionary lookup per line.
+
+    Returns
+    -------
+    nodes : list of (node ID, molecule type) tuples, indexed by the node numbers. The molecule type is
+        the one of the first appearance of the node.
+    edges : dictionary link key -> [node number A, node number B, number of networks containing the link,
+        list of the distinct link metadata]. The link is oriented as it first appeared in the inputs, and
+        only the metadata of the lines in this orientation (A-B, not B-A) are kept.
+    """
+    node_numbers = {}
+    nodes = []
+    edges = {}
+
+    def node_number(interactor, annotation):
+        number = node_numbers.get(interactor)
+        if number is None:
+            number = node_numbers[interactor] = len(nodes)
+            nodes.append((interactor, annotation.split(":")[1].split(";")[0]))
+        return number
 
     for file in input_files_path:
 
-        output = set()
+        edges_of_file = set()
 
         with open(file, "r") as input_network:
 
             for line in input_network:
 
                 info = line.strip().split("\t")
-                interactor_a = f'{info[0]}'
-                interactor_b = f'{info[1]}'
-                molecule_type_a = f'{info[25].split(":")[1].split(";")[0]}'
-                molecule_type_b = f'{info[26].split(":")[1].split(";")[0]}'
-                metadata = f'{info[27]}'
-
-                if (interactor_a, interactor_b) not in snp_meta_data:
-                    snp_meta_data[interactor_a, interactor_b] = []
-                snp_meta_data[interactor_a, interactor_b].append(metadata)
-
-                if interactor_a not in meta_data:
-                    meta_data[interactor_a] = []
-                meta_data[interactor_a].append(molecule_type_a)
-
-                if interactor_b not in meta_data:
-                    meta_data[interactor_b] = []
-                meta_data[interactor_b].append(molecule_type_b)
-
-                tuples = (f'{interactor_a}', f'{interactor_b}')
-                tuples_reverse = (f'{interactor_b}', f'{interactor_a}')
-
-                if [item for item in results if tuples_reverse in item]:
-
-                    if tuples_reverse in output:
-                        continue
-
-                    else:
-                        output.add(tuples_reverse)
-
+                if len(info) < 28:
+                    continue
+                number_a = node_number(info[0], info[25])
+                number_b = node_number(info[1], info[26])
+                metadata = info[27]
+
+                if number_a < number_b:
+                    key = number_a << 32 | number_b
                 else:
-                    if tuples_reverse in output:
-                        continue
-
-                    else:
-                        output.add(tuples)
-
-            results.append(output)
-
-    return results
-
-
-def write_to_file(output_file, input_method_array, meta_data, snp_meta_data):
+                    key = number_b << 32 | number_a
+
+                edge = edges.get(key)
+                if edge is None:
+                    edge = edges[key] = [number_a, number_b, 0, []]
+                if key not in edges_of_file:
+                    edges_of_file.add(key)
+                    edge[2] += 1
+                if number_a == edge[0] and metadata not in edge[3]:
+                    edge[3].append(metadata)
+
+    return nodes, edges
+
+
+def write_to_file(output_file, links, with_counts=False):
+    """
+    Writes the links with one streaming MiTab writer.
+
+    Parameters
+    ----------
+    output_file : str
+        path to the output network file.
+    links : iterable of (interactor A, molecule type A, interactor B, molecule type B, number of networks
+        containing the link, list of the distinct link metadata) tuples, in the order of the output.
+    with_counts : bool
+        write the number of networks containing the link to the confidence score column.
+    """
     with open(output_file, "w") as output_network:
-        for interactions in input_method_array:
 
-            mitab = mitab_handler.MiTabHandler()
+        mitab = mitab_handler.MiTabWriter(output_network)
+
+        for interactor_a, molecule_type_a, interactor_b, molecule_type_b, count, metadata_array in links:
 
             interaction = mitab.new_interaction()
 
-            interaction[mitab.uidA] = f'{interactions[0]}'
-            interaction[mitab.uidB] = f'{interactions[1]}'
+            interaction[mitab.uidA] = f'{interactor_a}'
+            interaction[mitab.uidB] = f'{interactor_b}'
             interaction[mitab.taxA] = f'taxid:9606(Homo Sapiens)'
             interaction[mitab.taxB] = f'taxid:9606(Homo Sapiens)'
-            metadata_a = interactions[0].split(":")
-            interaction[mitab.annotA] = f'start:{meta_data[interactions[0]][0]};{metadata_a[0]};{metadata_a[1]}'
-            metadata_b = interactions[1].split(":")
-            interaction[mitab.annotB] = f'end:{meta_data[interactions[1]][0]};{metadata_b[0]};{metadata_b[1]}'
-
-            metadata_array = []
-            if interactions in snp_meta_data:
-                for snp_metadata in snp_meta_data[interactions]:
-                    if snp_metadata not in metadata_array:
-                        metadata_array.append(snp_metadata)
+            metadata_a = interactor_a.split(":")
+            interaction[mitab.annotA] = f'start:{molecule_type_a};{metadata_a[0]};{metadata_a[1]}'
+            metadata_b = interactor_b.split(":")
+            interaction[mitab.annotB] = f'end:{molecule_type_b};{metadata_b[0]};{metadata_b[1]}'
 
             delimiter = "|"
             interaction[mitab.annotInter] = delimiter.join(metadata_array)
+            if with_counts:
+                interaction[mitab.confidence] = f'networks:{count}'
+
+            mitab.write_interaction(interaction)
+
 
-            mitab.add_interaction(interaction)
+def comparing_networks(input_files, output_file, method):
+    nodes, edges = parse_network_files(input_files)
 
-            mitab.serialise_mitab(output_network, add_header=False)
+    keep = network_filter(method, len(input_files))
+    selected = [edge for edge in edges.values() if keep(edge[2])]
+    selected.sort(key=lambda edge: (nodes[edge[0]][0], nodes[edge[1]][0]))
 
-    output_network.close()
+    links = (nodes[number_a] + nodes[number_b] + (count, metadata_array)
+             for number_a, number_b, count, metadata_array in selected)
+    write_to_file(output_file, links, with_counts=method == "count")
 
 
-def comparing_networks(input_files, output_file, method, meta_data, snp_meta_data):
-    results = parse_network_files(input_files, meta_data, snp_meta_data)
+def parse_memory_limit(memory_limit):
+    """ Converts a memory limit (number of bytes, or a number with a K, M or G suffix) to bytes, or None """
+    match = re.fullmatch(r"([0-9]+(?:\.[0-9]+)?)([kmg]?)b?", memory_limit.strip().lower())
+    if not match:
+        return None
+    multiplier = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}[match.group(2)]
+    return int(float(match.group(1)) * multiplier)
 
-    union = set.union(*results)
-    intersection = set.intersection(*results)
-    difference = union - intersection
 
-    union_array = sorted(union)
-    intersection_array = sorted(intersection)
-    difference_array = sorted(difference)
+class ExternalSorter:
+    """
+    Sorts more lines than fit in the memory: the lines are collected until their size reaches the
+    memory limit, then sorted and written to a run file. At the end the runs are merged (max_runs at a
+    time, with intermediate merges if there are more runs), so the files are only read and written
+    sequentially.
+    """
 
-    if method == "union":
-        write_to_file(output_file, union_array, meta_data, snp_meta_data)
+    # at most this many run files are merged (and kept open) at the same time
+    max_runs = 64
 
-    elif method == "intersection":
-        write_to_file(output_file, intersection_array, meta_data, snp_meta_data)
+    def __init__(self, folder, memory_limit, key):
+        """
+        Parameters
+        ----------
+        folder : str
+            folder of the run files.
+        memory_limit : int
+            number of bytes of the lines collected before they are written to a run.
+        key : function
+            sort key of the lines.
+        """
+        self.folder = folder
+        self.memory_limit = memory_limit
+        self.key = key
+        self.lines = []
+        self.size = 0
+        self.runs = []
+        self.run_count = 0
+
+    def add(self, line):
+        """ Adds a line (without the line break) """
+        self.lines.append(line)
+        # the line, its place in the list and its sort key
+        self.size += 3 * sys.getsizeof(line)
+        if self.size >= self.memory_limit:
+            self._write_run(sorted(self.lines, key=self.key))
+            self.lines = []
+            self.size = 0
+
+    def _write_run(self, lines):
+        run_path = os.path.join(self.folder, f"run-{id(self)}-{self.run_count}.txt")
+        self.run_count += 1
+        with open(run_path, "w", buffering=run_buffer_size) as run:
+            for line in lines:
+                run.write(line + "\n")
+        self.runs.append(run_path)
+
+    def _merge(self, run_paths):
+        runs = [open(run_path, "r", buffering=run_buffer_size) for run_path in run_paths]
+        try:
+            for line in heapq.merge(*[(line.rstrip("\n") for line in run) for run in runs], key=self.key):
+                yield line
+        finally:
+            for run in runs:
+                run.close()
+            for run_path in run_paths:
+                os.remove(run_path)
+
+    def sorted_lines(self):
+        """ Yields all the added lines in sorted order """
+        if not self.runs:
+            yield from sorted(self.lines, key=self.key)
+            return
+        if self.lines:
+            self._write_run(sorted(self.lines, key=self.key))
+            self.lines = []
+        while len(self.runs) > self.max_runs:
+            merged = self.runs[:self.max_runs]
+            self.runs = self.runs[self.max_runs:]
+            self._write_run(self._merge(merged))
+        yield from self._merge(self.runs)
+
+
+def _link_record_key(line):
+    node_1, node_2, sequence, _ = line.split("\t", 3)
+    return node_1, node_2, int(sequence)
+
+
+def _output_record_key(line):
+    interactor_a, interactor_b, _ = line.split("\t", 2)
+    return interactor_a, interactor_b
+
+
+def external_comparing_networks(input_files, output_file, method, memory_limit):
+    """
+    Sort-merge version of comparing_networks for inputs that do not fit in the memory. Every line of the
+    inputs is written as a record of the canonical link key (the smaller and the greater node ID) and
+    the line number, and these records are sorted with an ExternalSorter. Merging the sorted runs brings
+    all the lines of a link together, so a link is counted, filtered and aggregated at once. The output
+    links are sorted with a second ExternalSorter by the node IDs (the order of comparing_networks). Only
+    the molecule types of the nodes are kept in the memory.
+    """
+    keep = network_filter(method, len(input_files))
+    molecule_types = {}
+
+    # the second sorter is filled while the last run of the first one is merged, so they share the memory limit
+    output_folder = os.path.dirname(os.path.abspath(output_file))
+    with tempfile.TemporaryDirectory(dir=output_folder, prefix=".network_combiner_") as run_folder:
+        link_records = ExternalSorter(run_folder, memory_limit // 2, _link_record_key)
+        sequence = 0
+        for file_index, file in enumerate(input_files):
+            with open(file, "r") as input_network:
+                for line in input_network:
+                    info = line.strip().split("\t")
+                    if len(info) < 28:
+                        continue
+                    interactor_a, interactor_b = info[0], info[1]
+                    if interactor_a not in molecule_types:
+                        molecule_types[interactor_a] = info[25].split(":")[1].split(";")[0]
+                    if interactor_b not in molecule_types:
+                        molecule_types[interactor_b] = info[26].split(":")[1].split(";")[0]
+                    node_1, node_2 = sorted((interactor_a, interactor_b))
+                    link_records.add(f"{node_1}\t{node_2}\t{sequence}\t{file_index}\t{interactor_a}\t"
+                                     f"{interactor_b}\t{info[27]}")
+                    sequence += 1
+
+        output_records = ExternalSorter(run_folder, memory_limit // 2, _output_record_key)
+        records = (line.split("\t") for line in link_records.sorted_lines())
+        for _, link_lines in itertools.groupby(records, key=lambda record: (record[0], record[1])):
+            link_lines = list(link_lines)
+            count = len(set(record[3] for record in link_lines))
+            if not keep(count):
+                continue
+            # the link is oriented as it first appeared in the inputs, with the metadata of this orientation
+            interactor_a, interactor_b = link_lines[0][4], link_lines[0][5]
+            metadata_array = []
+            for record in link_lines:
+                if record[4] == interactor_a and record[6] not in metadata_array:
+                    metadata_array.append(record[6])
+            output_records.add(f"{interactor_a}\t{interactor_b}\t{count}\t{'|'.join(metadata_array)}")
 
-    elif method == "difference":
-        write_to_file(output_file, difference_array, meta_data, snp_meta_data)
+        links = ((interactor_a, molecule_types[interactor_a], interactor_b, molecule_types[interactor_b],
+                  count, metadata.split("|"))
+                 for interactor_a, interactor_b, count, metadata in
+                 (line.split("\t") for line in output_records.sorted_lines()))
+        write_to_file(output_file, links, with_counts=method == "count")
 
 
 def main():
 
-    input_files, output_file, method = parse_args(sys.argv[1:])
+    input_files, output_file, method, memory_limit = parse_args(sys.argv[1:])
     input_file_list = input_files.split(',')
 
     method = method.lower()
 
-    meta_data = {}
-    snp_meta_data = {}
-
-    check_params(input_file_list, method)
+    check_params(input_file_list, method, memory_limit)
 
     if len(input_file_list) == 1:
         if os.stat(input_file_list[0]).st_size == 0:
@@ -257,8 +456,11 @@ def main():
         if len(input_file_list) == len(empty_files):
             open(output_file, "a").close()
 
+        elif memory_limit is not None:
+            external_comparing_networks(input_file_list, output_file, method, parse_memory_limit(memory_limit))
+
         else:
-            comparing_networks(input_file_list, output_file, method, meta_data, snp_meta_data)
+            comparing_networks(input_file_list, output_file, method)
 
     print(f"====== Network combiner finished successfully! ======")
 
@@ -16,7 +16,7 @@ not_empty_input_files = "example_files/test1.tsv,example_files/test2.tsv"
 @mock.patch.object(network_combiner, 'parse_args')
 def test_vcf_files_exists(args):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = ['file', False, 'asdasd']
+        args.return_value = ['file', False, 'asdasd', None]
         network_combiner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -26,7 +26,7 @@ def test_vcf_files_exists(args):
 @mock.patch.object(network_combiner, 'parse_args')
 def test_method_exists(args):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [params_list[0], False, 'asdasd']
+        args.return_value = [params_list[0], False, 'asdasd', None]
         network_combiner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -37,7 +37,7 @@ def test_method_exists(args):
 def test_one_emtpy_input_file(args, tmpdir):
     fake_file = tmpdir.join("wrong_file.tsv")
     fake_file.write("")
-    args.return_value = [str(fake_file), params_list[1], params_list[2]]
+    args.return_value = [str(fake_file), params_list[1], params_list[2], None]
     network_combiner.main()
 
     assert os.stat(fake_file).st_size == 0
@@ -47,7 +47,7 @@ def test_one_emtpy_input_file(args, tmpdir):
 def test_number_of_lines_in_output_file(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
     output_file.write("")
-    args.return_value = [not_empty_input_files, output_file, params_list[2]]
+    args.return_value = [not_empty_input_files, output_file, params_list[2], None]
     network_combiner.main()
 
     num_lines = sum(1 for line in open(output_file))
@@ -66,7 +66,7 @@ def test_number_of_lines_in_output_file(args, tmpdir):
 def test_if_one_of_the_input_file_is_empty(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
     output_file.write("")
-    args.return_value = [params_list[0], output_file, params_list[2]]
+    args.return_value = [params_list[0], output_file, params_list[2], None]
     network_combiner.main()
 
     num_lines = sum(1 for line in open(output_file))
@@ -85,7 +85,7 @@ def test_if_one_of_the_input_file_is_empty(args, tmpdir):
 def test_snp_metadata(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
     output_file.write("")
-    args.return_value = [not_empty_input_files, output_file, params_list[2]]
+    args.return_value = [not_empty_input_files, output_file, params_list[2], None]
     network_combiner.main()
 
     num_lines = sum(1 for line in open(output_file))
@@ -106,3 +106,104 @@ def test_snp_metadata(args, tmpdir):
 
             index = index + 1
 
+
+
+example_files = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_files")
+all_input_files = ",".join(os.path.join(example_files, name) for name in ("test1.tsv", "test2.tsv", "test3.tsv"))
+
+
+def read_links(output_file):
+    with open(output_file) as output:
+        return [tuple(line.rstrip("\n").split("\t")[i] for i in (0, 1, 14, 27)) for line in output]
+
+
+@mock.patch.object(network_combiner, 'parse_args')
+def test_intersection_and_difference(args, tmpdir):
+    output_file = str(tmpdir.join("output.tsv"))
+    args.return_value = [all_input_files, output_file, "intersection", None]
+    network_combiner.main()
+    assert [link[:2] for link in read_links(output_file)] == [("uniprotac:p00001", "uniprotac:p00003"),
+                                                              ("uniprotac:p00002", "uniprotac:p00001")]
+
+    args.return_value = [all_input_files, output_file, "difference", None]
+    network_combiner.main()
+    assert [link[:2] for link in read_links(output_file)] == [("uniprotac:p00001", "uniprotac:p00004"),
+                                                              ("uniprotac:p00002", "uniprotac:p00005"),
+                                                              ("uniprotac:p00003", "uniprotac:p00006")]
+
+
+@mock.patch.object(network_combiner, 'parse_args')
+def test_k_of_n_and_count(args, tmpdir):
+    output_file = str(tmpdir.join("output.tsv"))
+    args.return_value = [all_input_files, output_file, "2-of-n", None]
+    network_combiner.main()
+    assert [link[:2] for link in read_links(output_file)] == [("uniprotac:p00001", "uniprotac:p00003"),
+                                                              ("uniprotac:p00001", "uniprotac:p00004"),
+                                                              ("uniprotac:p00002", "uniprotac:p00001"),
+                                                              ("uniprotac:p00002", "uniprotac:p00005"),
+                                                              ("uniprotac:p00003", "uniprotac:p00006")]
+
+    args.return_value = [all_input_files, output_file, "count", None]
+    network_combiner.main()
+    assert read_links(output_file)[3:] == [
+        ("uniprotac:p00002", "uniprotac:p00005", "networks:2", "origin:snp;dbsnp;rs00007|origin:snp;dbsnp;rs00009"),
+        ("uniprotac:p00003", "uniprotac:p00006", "networks:2", "origin:snp;dbsnp;rs00017|origin:snp;dbsnp;rs00013")]
+
+
+@mock.patch.object(network_combiner, 'parse_args')
+def test_invalid_k_of_n(args):
+    with pytest.raises(SystemExit) as pytest_wrapped_e:
+        args.return_value = [all_input_files, False, "0-of-n", None]
+        network_combiner.main()
+
+    assert pytest_wrapped_e.value.code == 2
+
+
+@pytest.mark.parametrize("method", ["union", "intersection", "difference", "2-of-n", "count"])
+@mock.patch.object(network_combiner.ExternalSorter, 'max_runs', 3)
+@mock.patch.object(network_combiner, 'parse_args')
+def test_external_sort_merge(args, tmpdir, method):
+    input_files = all_input_files + "," + os.path.join(example_files, "empty.tsv")
+    in_memory_output = str(tmpdir.join("in_memory.tsv"))
+    args.return_value = [input_files, in_memory_output, method, None]
+    network_combiner.main()
+
+    external_output = str(tmpdir.join("external.tsv"))
+    # a few lines per run, so the runs are merged in more rounds
+    args.return_value = [input_files, external_output, method, "1K"]
+    network_combiner.main()
+
+    assert open(external_output).read() == open(in_memory_output).read()
+    assert sorted(os.listdir(str(tmpdir))) == ["external.tsv", "in_memory.tsv"]
+
+
+def test_parse_memory_limit():
+    assert network_combiner.parse_memory_limit("512") == 512
+    assert network_combiner.parse_memory_limit("1.5K") == 1536
+    assert network_combiner.parse_memory_limit("4G") == 4 * 1024 ** 3
+    assert network_combiner.parse_memory_limit("lots") is None
+
+
+def _network_line(interactor_a, interactor_b, metadata):
+    info = ["-"] * 42
+    info[0], info[1] = interactor_a, interactor_b
+    info[25] = f"start:protein;{interactor_a.replace(':', ';')}"
+    info[26] = f"end:protein;{interactor_b.replace(':', ';')}"
+    info[27] = metadata
+    return "\t".join(info) + "\n"
+
+
+@pytest.mark.parametrize("memory_limit", [None, "1K"])
+@mock.patch.object(network_combiner, 'parse_args')
+def test_metadata_of_both_orientations(args, tmpdir, memory_limit):
+    network_1 = tmpdir.join("network_1.tsv")
+    network_1.write(_network_line("uniprotac:a", "uniprotac:b", "origin:snp;dbsnp;rs1"))
+    network_2 = tmpdir.join("network_2.tsv")
+    network_2.write(_network_line("uniprotac:b", "uniprotac:a", "origin:snp;dbsnp;rs2") +
+                    _network_line("uniprotac:a", "uniprotac:b", "origin:snp;dbsnp;rs3"))
+    output_file = str(tmpdir.join("output.tsv"))
+    args.return_value = [f"{network_1},{network_2}", output_file, "count", memory_limit]
+    network_combiner.main()
+
+    assert read_links(output_file) == [("uniprotac:a", "uniprotac:b", "networks:2",
+                                        "origin:snp;dbsnp;rs1|origin:snp;dbsnp;rs3")]
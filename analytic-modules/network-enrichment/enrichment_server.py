@@ -0,0 +1,208 @@
+""" Network Enrichment Server """
+import sys
+
+import os
+import json
+import socket
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+
+import network_enrichment as ne
+
+# the reference index of the worker processes (see _init_worker)
+_reference_index = None
+
+
+def parse_args(argv=None):
+    help_text = \
+        """
+        === Network Enrichment Server ===
+        Name of the tool: Network Enrichment Server.
+        \nDescription:
+        Loads a reference network once, and enriches patient networks on request, so the patient
+        runs do not load the reference network each. The index of the reference network is saved to
+        shared memory (/dev/shm) and memory-mapped read-only by the worker processes. The requests
+        are sent to a Unix socket, by network_enrichment.py --server <socket> or by
+        network_enrichment.request_enrichment. A request is a batch of patient networks, which are
+        enriched in parallel. If the reference network changes while the server runs, the requests
+        are rejected (the server must be restarted).
+
+        \nParameters:
+        --reference-net <path to the reference network> [mandatory]
+        --socket <path to the Unix socket of the server> [mandatory]
+        --workers <number of worker processes> [optional, default: number of CPUs]
+        --index-folder <folder of the saved reference index> [optional, default: /dev/shm]
+        """
+
+    # New argument Parser
+    parser = argparse.ArgumentParser(description=help_text)
+
+    # Reference Network
+    parser.add_argument("-r", "--reference-net",
+                        help="<path to the reference network> [mandatory]",
+                        dest="reference_network",
+                        action="store",
+                        required=True)
+
+    # Unix socket
+    parser.add_argument("-s", "--socket",
+                        help="<path to the Unix socket of the server> [mandatory]",
+                        dest="socket",
+                        action="store",
+                        required=True)
+
+    # Worker processes
+    parser.add_argument("-w", "--workers",
+                        help="<number of worker processes> [optional]",
+                        dest="workers",
+                        type=int,
+                        action="store",
+                        default=os.cpu_count(),
+                        required=False)
+
+    # Folder of the index
+    parser.add_argument("-f", "--index-folder",
+                        help="<folder of the saved reference index> [optional]",
+                        dest="index_folder",
+                        action="store",
+                        required=False)
+
+    results = parser.parse_args(argv)
+
+    return results
+
+
+def _init_worker(reference_network, index_folder):
+    """ Memory-maps the saved reference index in a worker process """
+    global _reference_index
+    _reference_index = ne.load_reference_index(reference_network, index_folder)
+
+
+def _enrich(request):
+    """ Enriches a patient network in a worker process, returns the result of the request """
+    try:
+        ne._check_args(request["input"], request["distance"], request["reference"], request["output"],
+                       request.get("max_degree"), request.get("top_k"), request.get("edge_budget"))
+        stats = {}
+        ne.enrich_to_file(request["input"], _reference_index, request["output"], request["distance"],
+                          request.get("max_degree"), request.get("top_k"), request.get("edge_budget"), stats)
+        return {"output": request["output"], "status": "ok", "stats": stats}
+    except Exception as error:
+        return {"output": request["output"], "status": "error", "error": f"{type(error).__name__} {error}"}
+
+
+class EnrichmentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server of the enrichment requests. Every line received is a JSON object: a batch of
+    requests ({"requests": [...]}, see network_enrichment.request_enrichment), answered with a line of
+    the results, or {"shutdown": true} to stop the server.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, reference_network, executor, reference_source=None):
+        """
+        reference_source: the source of the index of the workers (see network_enrichment.reference_source).
+        If the reference network file changes (size or modification time), the requests are rejected.
+        """
+        self.reference_network = os.path.abspath(reference_network)
+        self.reference_source = reference_source
+        self.executor = executor
+        super().__init__(socket_path, EnrichmentRequestHandler)
+
+    def reference_changed(self):
+        """ True if the reference network file is not the one the index of the workers was built from """
+        if self.reference_source is None:
+            return False
+        try:
+            return ne.reference_source(self.reference_network) != self.reference_source
+        except OSError:
+            return True
+
+    def process_batch(self, requests):
+        """ Enriches the networks of a batch in the worker processes """
+        results = [None] * len(requests)
+        futures = {}
+        reference_changed = self.reference_changed()
+        for position, request in enumerate(requests):
+            reference = request.get("reference", self.reference_network)
+            if reference != self.reference_network:
+                results[position] = {"output": request.get("output"), "status": "error",
+                                     "error": f"The reference network of the server is {self.reference_network}"}
+            elif reference_changed:
+                results[position] = {"output": request.get("output"), "status": "error",
+                                     "error": f"The reference network changed since the server started, the server "
+                                              f"must be restarted: {self.reference_network}"}
+            else:
+                request["reference"] = reference
+                futures[position] = self.executor.submit(_enrich, request)
+        for position, future in futures.items():
+            results[position] = future.result()
+        return results
+
+
+class EnrichmentRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            message = json.loads(line.decode("utf-8"))
+            if message.get("shutdown"):
+                self.wfile.write(b'{"results": []}\n')
+                threading.Thread(target=self.server.shutdown).start()
+                return
+            results = self.server.process_batch(message.get("requests", []))
+            self.wfile.write((json.dumps({"results": results}) + "\n").encode("utf-8"))
+
+
+def serve(reference_network, socket_path, workers=None, index_folder=None):
+    """
+    Saves (or reuses) the index of the reference network, starts the worker processes and serves the
+    requests until a shutdown request.
+
+    Parameters
+    ----------
+    reference_network: str, path to the reference network
+    socket_path: str, path to the Unix socket of the server
+    workers: int, number of worker processes
+    index_folder: str, folder of the saved reference index, see network_enrichment.load_reference_index
+
+    """
+    # the index is saved once, before the workers memory-map it
+    reference_index = ne.load_reference_index(reference_network, index_folder)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(reference_network, index_folder)) as executor:
+        with EnrichmentServer(socket_path, reference_network, executor, reference_index.source) as server:
+            print(f'====== Enrichment server is listening on: {socket_path} ======')
+            sys.stdout.flush()
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(socket_path)
+
+
+def shutdown(socket_path):
+    """ Stops a running enrichment server """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(b'{"shutdown": true}\n')
+        connection.recv(1024)
+
+
+def main(argv):
+    """ Main method - waits for exit code """
+    args = parse_args(argv)
+    if not os.path.exists(args.reference_network):
+        raise FileNotFoundError
+    serve(args.reference_network, args.socket, args.workers, args.index_folder)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -2,7 +2,13 @@
 import sys
 
 import os
+import json
+import mmap
+import shutil
+import socket
+import hashlib
 import argparse
+import tempfile
 import numpy as np
 import pandas as pd
 
@@ -15,6 +21,27 @@ class InvalidNumberOfHops(Exception):
     pass
 
 
+class InvalidExpansionLimit(Exception):
+    """ Raised if the max degree, top-k or edge budget is < 0 or not an integer """
+    pass
+
+
+class EnrichmentServerError(Exception):
+    """ Raised if the enrichment server could not process a request """
+    pass
+
+
+# arrays of a saved reference index (see ReferenceIndex.save)
+index_arrays = ("sorted_nodes", "node_order", "sources", "targets", "confidence", "edge_rows", "ranked_rows",
+                "indptr", "degrees", "line_offsets")
+
+# version of the saved index, saved indexes of other versions are rebuilt
+index_version = 2
+
+# number of times a saved index is opened again if it is rebuilt while it is opened (see load_reference_index)
+open_attempts = 3
+
+
 def parse_args(argv=None):
     help_text = \
         """
@@ -29,6 +56,11 @@ def parse_args(argv=None):
         --mirna <path to an existing file> [mandatory]
         --genomic <path to the new output file> [mandatory]
         --output <path to the output file for the enriched network> [mandatory]
+        --max-degree <nodes with more links in the reference network are not expanded> [optional]
+        --top-k <number of links with the highest confidence score added per expanded node> [optional]
+        --edge-budget <total number of links added from the reference network> [optional]
+        --server <path to the Unix socket of an enrichment server (see enrichment_server.py), the
+                  inputs and outputs can be comma separated lists> [optional]
         """
 
     # New argument Parser
@@ -63,12 +95,44 @@ def parse_args(argv=None):
                         action="store",
                         required=True)
 
+    # Maximum degree of the expanded nodes
+    parser.add_argument("--max-degree",
+                        help="<nodes with more links in the reference network are not expanded> [optional]",
+                        dest="max_degree",
+                        type=int,
+                        action="store",
+                        required=False)
+
+    # Number of links per expanded node
+    parser.add_argument("--top-k",
+                        help="<number of links with the highest confidence score added per expanded node> "
+                             "[optional]",
+                        dest="top_k",
+                        type=int,
+                        action="store",
+                        required=False)
+
+    # Global number of links
+    parser.add_argument("--edge-budget",
+                        help="<total number of links added from the reference network> [optional]",
+                        dest="edge_budget",
+                        type=int,
+                        action="store",
+                        required=False)
+
+    # Enrichment server
+    parser.add_argument("--server",
+                        help="<path to the Unix socket of an enrichment server> [optional]",
+                        dest="server",
+                        action="store",
+                        required=False)
+
     results = parser.parse_args(argv)
 
     return results
 
 
-def _check_args(network, distance, reference_network, output):
+def _check_args(network, distance, reference_network, output, max_degree=None, top_k=None, edge_budget=None):
     """
     A function to check the arguments parsed from the CLI
 
@@ -78,11 +142,15 @@ def _check_args(network, distance, reference_network, output):
     distance: int, number of hops to enrich the network
     reference_network: str, path to the reference network
     output: str, path to the output file
+    max_degree: int, nodes with a higher degree in the reference network are not expanded (optional)
+    top_k: int, number of links added per expanded node (optional)
+    edge_budget: int, total number of links added from the reference network (optional)
 
     Raises
     -------
     FileNotFoundError: rasied if any of the paths do not exisit
     InvalidNumberOfHops: raised if the distance is < 0 or > 100 or not an integer
+    InvalidExpansionLimit: raised if any of the limits is < 0 or not an integer
 
     """
     if not os.path.exists(network):
@@ -100,15 +168,296 @@ def _check_args(network, distance, reference_network, output):
     if distance > 100:
         raise InvalidNumberOfHops
 
+    for limit in (max_degree, top_k, edge_budget):
+        if limit is not None and (not isinstance(limit, int) or limit < 0):
+            raise InvalidExpansionLimit
+
+
+def confidence_scores(confidence_column):
+    """
+    Parses the confidence score column of a MiTab network (e.g. "intact-miscore:0.56|score:3") to the
+    highest numeric score of each link. Links without a numeric score get -inf.
+    """
+    scores = confidence_column.astype(str).str.extractall(r":\s*([0-9]*\.?[0-9]+(?:e[-+]?[0-9]+)?)")[0]
+    scores = pd.to_numeric(scores, errors="coerce").groupby(level=0).max()
+    return scores.reindex(confidence_column.index).fillna(-np.inf).values
+
 
-def get_neighbours(ref_network, vertex_list, n_neighbours=1):
+class ReferenceIndex:
     """
+    Adjacency index of the reference network, built once per run. The node IDs are interned to
+    integers, and the links are stored in CSR (compressed sparse row) format: the rows of the reference
+    network starting from node i (as interactor A) are edge_rows[indptr[i]:indptr[i + 1]], so the
+    neighbours of a set of nodes are found without scanning the whole reference network. The links of
+    a node are in the order of the reference network. ranked_rows lists the same rows, but the links of
+    a node are ordered by decreasing confidence score, so its top-k links are the first k.
+
+    The index can be saved as a folder of .npy files and the lines of the reference network (see save),
+    and memory-mapped read-only by any number of processes (see load_reference_index). A loaded index
+    has no dataframe, the reference links are copied to the output as their lines (see enrich_to_file).
+    """
+
+    def __init__(self, reference_network=None, arrays=None, lines=None, source=None):
+        """
+        Parameters
+        ----------
+        reference_network: pandas dataframe, the reference network in MiTab format
+        arrays: dictionary of the index_arrays, used instead of the reference network by load_reference_index
+        lines: the lines of the reference network (memory-mapped), used with the arrays
+        source: dictionary, the reference network file of a loaded index (path, size, modification time)
+        """
+        self.network = None
+        self.lines = lines
+        self.source = source
+        if arrays is not None:
+            for name in index_arrays:
+                setattr(self, name, arrays[name])
+            return
+
+        inter_a = h.mitab_header[0]
+        inter_b = h.mitab_header[1]
+        confidence = h.mitab_header[14]
+
+        self.network = reference_network.reset_index(drop=True)
+        n_edges = len(self.network)
+        codes, nodes = pd.factorize(pd.concat([self.network[inter_a], self.network[inter_b]], ignore_index=True))
+        nodes = np.asarray(nodes).astype(str)
+        # the node IDs are looked up by binary search in the sorted IDs
+        self.node_order = np.argsort(nodes, kind="stable")
+        self.sorted_nodes = nodes[self.node_order]
+        self.line_offsets = None
+        self.sources = codes[:n_edges]
+        self.targets = codes[n_edges:]
+        if confidence in self.network:
+            self.confidence = confidence_scores(self.network[confidence])
+        else:
+            self.confidence = np.zeros(n_edges)
+        self.edge_rows = np.argsort(self.sources, kind="stable")
+        self.ranked_rows = np.lexsort((-self.confidence, self.sources))
+        self.indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.sources, minlength=len(nodes)), out=self.indptr[1:])
+        # number of links of the nodes in the reference network (in both directions)
+        self.degrees = np.bincount(codes, minlength=len(nodes))
+
+    @property
+    def n_nodes(self):
+        return len(self.sorted_nodes)
+
+    def lookup(self, vertex_list):
+        """ Returns the integer codes of the vertices, -1 for the vertices not in the reference network """
+        vertices = np.asarray(vertex_list).astype(str)
+        if self.n_nodes == 0:
+            return np.full(len(vertices), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_nodes, vertices), self.n_nodes - 1)
+        found = self.sorted_nodes[positions] == vertices
+        return np.where(found, self.node_order[positions], -1)
+
+    def node_codes(self, vertex_list):
+        """ Returns the integer codes of the vertices present in the reference network """
+        codes = self.lookup(vertex_list)
+        return np.unique(codes[codes >= 0])
+
+    def out_degrees(self, node_codes):
+        """ Returns the number of rows of the reference network starting from each of the given nodes """
+        return self.indptr[node_codes + 1] - self.indptr[node_codes]
+
+    def out_edges(self, node_codes, top_k=None):
+        """
+        Returns the rows of the reference network starting from the given nodes (in this order), at most
+        top_k rows (with the highest confidence scores) per node. The rows of a node are in the order of the
+        reference network.
+        """
+        starts = self.indptr[node_codes]
+        lengths = self.out_degrees(node_codes)
+        if top_k is None:
+            offsets = np.cumsum(lengths) - lengths
+            return self.edge_rows[np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())]
+        lengths = np.minimum(lengths, top_k)
+        offsets = np.cumsum(lengths) - lengths
+        rows = self.ranked_rows[np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())]
+        # the top-k rows of each node back in the order of the reference network
+        return rows[np.lexsort((rows, np.repeat(np.arange(len(lengths)), lengths)))]
+
+    def expand(self, vertex_list, distance, max_degree=None, top_k=None, edge_budget=None, stats=None):
+        """
+        Breadth-first search from the vertices: every node is expanded at most once, at the hop it is
+        first reached, and only the newly reached nodes form the frontier of the next hop.
+
+        The expansion can be capped, so that hubs of the reference network do not pull in thousands of
+        links: nodes with more than max_degree links are not expanded, at most top_k links (with the
+        highest confidence scores) are added per expanded node, and at most edge_budget links are added
+        in total (at the hop reaching the budget, the links with the highest confidence scores are kept).
+
+        Parameters
+        ----------
+        vertex_list: list, the vertices to start the search from
+        distance: int, number of hops
+        max_degree: int, maximum degree of the expanded nodes (optional)
+        top_k: int, maximum number of links added per expanded node (optional)
+        edge_budget: int, maximum number of links added in total (optional)
+        stats: dict, if given, it is filled with the number of links added ("links"), the number of hubs
+            not expanded ("hubs") and the number of links dropped by the caps ("dropped_hub_links",
+            "dropped_top_k_links" and "dropped_budget_links")
+
+        Returns
+        -------
+        edge_rows: numpy array, the rows of the reference network found, hop by hop
+        """
+        counts = dict.fromkeys(["links", "hubs", "dropped_hub_links", "dropped_top_k_links",
+                                "dropped_budget_links"], 0)
+        visited = np.zeros(self.n_nodes, dtype=bool)
+        frontier = self.node_codes(vertex_list)
+        found = []
+
+        for _ in range(distance):
+            if len(frontier) == 0:
+                break
+            visited[frontier] = True
+            if max_degree is not None:
+                hubs = self.degrees[frontier] > max_degree
+                counts["hubs"] += int(hubs.sum())
+                counts["dropped_hub_links"] += int(self.out_degrees(frontier[hubs]).sum())
+                frontier = frontier[~hubs]
+            rows = self.out_edges(frontier, top_k)
+            if top_k is not None:
+                counts["dropped_top_k_links"] += int(self.out_degrees(frontier).sum()) - len(rows)
+            if edge_budget is not None and counts["links"] + len(rows) > edge_budget:
+                remaining = edge_budget - counts["links"]
+                counts["dropped_budget_links"] += len(rows) - remaining
+                rows = rows[np.sort(np.argsort(-self.confidence[rows], kind="stable")[:remaining])]
+            counts["links"] += len(rows)
+            found.append(rows)
+            targets = self.targets[rows]
+            frontier = np.unique(targets[~visited[targets]])
+
+        if stats is not None:
+            stats.update(counts)
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+
+    def save(self, folder, source=None):
+        """
+        Saves the index (and the lines of the reference network, as serialise_mitab writes them) to a
+        folder. The folder is written to a temporary folder first and then moved to its place. The
+        source (if given) is saved as source.json. If the folder can not be written (e.g. another process
+        saved the same index in the meantime), the temporary folder is removed and the OSError raised.
+        """
+        parent = os.path.dirname(os.path.abspath(folder))
+        tmp_folder = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+        try:
+            lines_path = os.path.join(tmp_folder, "reference.tsv")
+            handler = h.MiTabHandler()
+            handler.network = self.network
+            handler.serialise_mitab(lines_path)
+            with open(lines_path, "rb") as lines:
+                line_ends = np.flatnonzero(np.frombuffer(lines.read(), dtype=np.uint8) == ord("\n")) + 1
+            self.line_offsets = np.concatenate([[0], line_ends]).astype(np.int64)
+            for name in index_arrays:
+                np.save(os.path.join(tmp_folder, f"{name}.npy"), np.asarray(getattr(self, name)))
+            if source is not None:
+                with open(os.path.join(tmp_folder, "source.json"), mode="w") as source_file:
+                    json.dump(source, source_file)
+            shutil.rmtree(folder, ignore_errors=True)
+            os.replace(tmp_folder, folder)
+        except OSError:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            raise
+
+    def reference_lines(self, edge_rows):
+        """ Returns the lines of the reference network of a loaded index, for the given rows """
+        starts = self.line_offsets[edge_rows].tolist()
+        ends = self.line_offsets[np.asarray(edge_rows) + 1].tolist()
+        return b"".join(self.lines[start:end] for start, end in zip(starts, ends))
+
+
+def _saved_index_is_valid(index_path, source):
+    """ True if a saved index exists and was built from the given source (path, size, modification time) """
+    source_path = os.path.join(index_path, "source.json")
+    if not os.path.exists(source_path):
+        return False
+    with open(source_path) as source_file:
+        return json.load(source_file) == source
+
+
+def _open_saved_index(index_path):
+    """
+    Memory-maps the arrays and the lines of a saved index, and reads its source. Returns None if the index
+    is missing or it was replaced (rebuilt by another process) while its files were opened, so the arrays
+    and the lines always belong to the same index.
+    """
+    try:
+        folder_inode = os.stat(index_path).st_ino
+        arrays = {name: np.load(os.path.join(index_path, f"{name}.npy"), mmap_mode="r") for name in index_arrays}
+        with open(os.path.join(index_path, "reference.tsv"), "rb") as lines_file:
+            lines = mmap.mmap(lines_file.fileno(), 0, access=mmap.ACCESS_READ) if arrays["line_offsets"][-1] else b""
+        with open(os.path.join(index_path, "source.json")) as source_file:
+            source = json.load(source_file)
+        if os.stat(index_path).st_ino != folder_inode or len(lines) != arrays["line_offsets"][-1]:
+            return None
+    except FileNotFoundError:
+        return None
+    return arrays, lines, source
+
+
+def reference_source(reference_network):
+    """ Describes a reference network file (path, size, modification time), to find out if an index is stale """
+    reference_path = os.path.abspath(reference_network)
+    reference_stat = os.stat(reference_path)
+    return {"path": reference_path, "size": reference_stat.st_size, "mtime": reference_stat.st_mtime,
+            "version": index_version}
+
+
+def load_reference_index(reference_network, index_folder=None):
+    """
+    Opens the saved index of a reference network file, memory-mapped read-only, so the processes using
+    the same index share one copy of it. The index is saved once (in index_folder, named by the path of
+    the reference network) and it is rebuilt only if the reference network changes (size or
+    modification time). The arrays and the lines of the index are opened together, so a loaded index is
+    not affected if the index is rebuilt later.
 
     Parameters
     ----------
-    ref_network: str, path to the reference network
+    reference_network: str, path to the reference network
+    index_folder: str, folder of the saved indexes. By default /dev/shm (shared memory) if it exists,
+        otherwise the temporary folder of the system
+
+    Returns
+    -------
+    ref_index: ReferenceIndex, the memory-mapped index
+    """
+    if index_folder is None:
+        index_folder = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    reference_path = os.path.abspath(reference_network)
+    key = hashlib.sha1(reference_path.encode("utf-8")).hexdigest()
+    index_path = os.path.join(index_folder, f"network_enrichment_{key}")
+
+    # another process can rebuild the index while it is opened, then it is opened again
+    for _ in range(open_attempts):
+        source = reference_source(reference_path)
+        if not _saved_index_is_valid(index_path, source):
+            try:
+                ReferenceIndex(load_network(reference_path)).save(index_path, source)
+            except OSError:
+                # another process may have saved the same index in the meantime
+                if not _saved_index_is_valid(index_path, source):
+                    raise
+        saved_index = _open_saved_index(index_path)
+        if saved_index is not None and saved_index[2] == source:
+            arrays, lines, source = saved_index
+            return ReferenceIndex(arrays=arrays, lines=lines, source=source)
+    raise OSError(f"The saved index of the reference network kept changing while it was opened: {index_path}")
+
+
+def get_neighbours(ref_index, vertex_list, n_neighbours=1, max_degree=None, top_k=None, edge_budget=None,
+                   stats=None):
+    """
+
+    Parameters
+    ----------
+    ref_index: ReferenceIndex, the index of the reference network
     vertex_list: list, a list of vertices to be considered by the search
-    n_neighbours: int, current level neighbours to consider
+    n_neighbours: int, number of hops to consider
+    max_degree, top_k, edge_budget, stats: the caps of the expansion, see ReferenceIndex.expand
 
     Returns
     -------
@@ -116,30 +465,38 @@ def get_neighbours(ref_network, vertex_list, n_neighbours=1):
 
     """
 
+    edge_rows = ref_index.expand(vertex_list, n_neighbours, max_degree, top_k, edge_budget, stats)
+    return ref_index.network.iloc[edge_rows]
+
+
+def drop_duplicate_links(network):
+    """
+    Removes the duplicate undirected links of a network, keeping the first occurrence. The interactors
+    are interned to integers, and each link gets the key (smaller code, greater code).
+    """
+
     inter_a = h.mitab_header[0]
     inter_b = h.mitab_header[1]
 
-    vertex_frame = pd.DataFrame(vertex_list, columns=[inter_a])
-    new_edges = pd.DataFrame.merge(vertex_frame, ref_network, how="left")
-    new_edges = new_edges.dropna()
-    n_neighbours -= 1
+    n_edges = len(network)
+    codes, nodes = pd.factorize(pd.concat([network[inter_a], network[inter_b]], ignore_index=True))
+    codes_a = codes[:n_edges].astype(np.int64)
+    codes_b = codes[n_edges:].astype(np.int64)
+    keys = np.minimum(codes_a, codes_b) * len(nodes) + np.maximum(codes_a, codes_b)
 
-    if n_neighbours > 0:
-        new_vertex = list(set(new_edges[inter_b]))
-        edges_2 = get_neighbours(ref_network, new_vertex, n_neighbours)
-        new_edges = pd.DataFrame.append(new_edges, edges_2)
+    return network[~pd.Series(keys).duplicated().values]
 
-    return new_edges
 
-
-def enrich_network(network, reference_network, distance):
+def enrich_network(network, reference_network, distance, max_degree=None, top_k=None, edge_budget=None,
+                   stats=None):
     """
 
     Parameters
     ----------
-    network: str, path to the patient network file
-    reference_network: str, path to the reference network
+    network: pandas Dataframe, the patient network
+    reference_network: pandas Dataframe or ReferenceIndex, the reference network
     distance: int, number of hops to enrich the network
+    max_degree, top_k, edge_budget, stats: the caps of the expansion, see ReferenceIndex.expand
 
     Returns
     -------
@@ -150,19 +507,95 @@ def enrich_network(network, reference_network, distance):
     inter_a = h.mitab_header[0]
     inter_b = h.mitab_header[1]
 
+    if not isinstance(reference_network, ReferenceIndex):
+        reference_network = ReferenceIndex(reference_network)
+
     aa_vertex = pd.unique(network[[inter_a, inter_b]].values.ravel('K'))
-    aa_vertex = list(set(aa_vertex))
 
-    out = get_neighbours(reference_network, aa_vertex, distance)
+    # the links of the first neighbours are always added (a distance of 0 is expanded like 1)
+    out = get_neighbours(reference_network, aa_vertex, max(distance, 1), max_degree, top_k, edge_budget, stats)
 
-    full_net = pd.DataFrame.append(network, out)
-    full_net['interaction_id'] = full_net.apply(lambda row: "".join(sorted([row[inter_a], row[inter_b]])), axis=1)
-    full_net = full_net.drop_duplicates(subset='interaction_id')
-    del(full_net['interaction_id'])
+    full_net = pd.concat([network, out])
+    full_net = drop_duplicate_links(full_net)
 
     return full_net
 
 
+def enrich_to_file(network, ref_index, output, distance, max_degree=None, top_k=None, edge_budget=None,
+                   stats=None):
+    """
+    Enriches a network with a saved / loaded ReferenceIndex (which has no dataframe) and writes it to
+    the output. The output is the same as the output of run: the links of the network, then the new
+    links of the reference network (copied as their lines), without duplicate links.
+
+    Parameters
+    ----------
+    network: str, path to the patient network file
+    ref_index: ReferenceIndex, a loaded index (see load_reference_index)
+    output: str, path to the output file
+    distance: int, number of hops to enrich the network
+    max_degree, top_k, edge_budget, stats: the caps of the expansion, see ReferenceIndex.expand
+
+    """
+
+    inter_a = h.mitab_header[0]
+    inter_b = h.mitab_header[1]
+
+    if os.stat(network).st_size == 0:
+        open(output, "a").close()
+        return
+
+    net = load_network(network).reset_index(drop=True)
+    aa_vertex = pd.unique(net[[inter_a, inter_b]].values.ravel('K'))
+    edge_rows = ref_index.expand(aa_vertex, max(distance, 1), max_degree, top_k, edge_budget, stats)
+
+    # the nodes missing from the reference network get new codes after the codes of the reference nodes
+    n_edges = len(net)
+    net_nodes = pd.concat([net[inter_a], net[inter_b]], ignore_index=True)
+    codes = ref_index.lookup(net_nodes).astype(np.int64)
+    missing = codes < 0
+    codes[missing] = ref_index.n_nodes + pd.factorize(net_nodes[missing])[0]
+    n_codes = ref_index.n_nodes + int(missing.sum())
+
+    codes_a = np.concatenate([codes[:n_edges], ref_index.sources[edge_rows]]).astype(np.int64)
+    codes_b = np.concatenate([codes[n_edges:], ref_index.targets[edge_rows]]).astype(np.int64)
+    keys = np.minimum(codes_a, codes_b) * n_codes + np.maximum(codes_a, codes_b)
+    keep = ~pd.Series(keys).duplicated().values
+
+    with open(output, "w") as output_file:
+        new_handler = h.MiTabHandler()
+        new_handler.network = net[keep[:n_edges]]
+        new_handler.serialise_mitab(output_file)
+        output_file.write(ref_index.reference_lines(edge_rows[keep[n_edges:]]).decode("utf-8"))
+
+
+def request_enrichment(server, requests):
+    """
+    Sends a batch of enrichment requests to an enrichment server (see enrichment_server.py) over its
+    Unix socket, and waits for the results.
+
+    Parameters
+    ----------
+    server: str, path to the Unix socket of the server
+    requests: list of dictionaries with the keys input, output, distance, reference (optional, checked
+        against the reference network of the server), max_degree, top_k, edge_budget (optional)
+
+    Returns
+    -------
+    results: list of dictionaries (one per request) with the keys output, status ("ok" or "error"),
+        stats (the statistics of the expansion) or error (the error message)
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(server)
+        with connection.makefile("rw", encoding="utf-8") as stream:
+            stream.write(json.dumps({"requests": requests}) + "\n")
+            stream.flush()
+            response = stream.readline()
+    if not response:
+        raise EnrichmentServerError("The enrichment server closed the connection: " + server)
+    return json.loads(response)["results"]
+
+
 def load_network(network_file):
     """
     A helper method to parse the network(s) to a usable dataframe
@@ -181,7 +614,7 @@ def load_network(network_file):
     return handler.network
 
 
-def run(network, distance, reference_network, output):
+def run(network, distance, reference_network, output, max_degree=None, top_k=None, edge_budget=None):
     """
     This function that controls the logic.
     args --> check_args --> run (load_network + enrich_network + serialise) --> exit
@@ -192,6 +625,9 @@ def run(network, distance, reference_network, output):
     distance: int, number of hops to enrich the network
     reference_network: str, path to the reference network
     output: str, path to the output file
+    max_degree: int, nodes with a higher degree in the reference network are not expanded (optional)
+    top_k: int, number of links added per expanded node (optional)
+    edge_budget: int, total number of links added from the reference network (optional)
 
     """
 
@@ -204,20 +640,78 @@ def run(network, distance, reference_network, output):
 
         try:
             net = load_network(network)
-            ref_net = load_network(reference_network)
-            enriched_network = enrich_network(net, ref_net, distance)
+            ref_index = ReferenceIndex(load_network(reference_network))
+            stats = {}
+            enriched_network = enrich_network(net, ref_index, distance, max_degree, top_k, edge_budget, stats)
             new_handler = h.MiTabHandler()
             new_handler.network = enriched_network
             new_handler.serialise_mitab(output)
         except RuntimeError:
             raise RuntimeError()
 
+        print_stats(stats)
+
+
+def print_stats(stats):
+    """ Prints the number of links added and truncated by the caps of the expansion """
+    if not stats:
+        return
+    dropped = stats["dropped_hub_links"] + stats["dropped_top_k_links"] + stats["dropped_budget_links"]
+    print(f'====== {stats["links"]} links added from the reference network, {dropped} links truncated '
+          f'(hubs not expanded: {stats["hubs"]} with {stats["dropped_hub_links"]} links, '
+          f'top-k: {stats["dropped_top_k_links"]} links, '
+          f'edge budget: {stats["dropped_budget_links"]} links) ======')
+
+
+def run_on_server(server, networks, distance, reference_network, outputs, max_degree=None, top_k=None,
+                  edge_budget=None):
+    """
+    Sends the networks to an enrichment server as one batch, instead of loading the reference network.
+
+    Parameters
+    ----------
+    server: str, path to the Unix socket of the enrichment server
+    networks: list, paths to the patient network files
+    distance: int, number of hops to enrich the networks
+    reference_network: str, path to the reference network (it must be the reference network of the server)
+    outputs: list, paths to the output files (one per network)
+    max_degree, top_k, edge_budget: the caps of the expansion, see ReferenceIndex.expand
+
+    Raises
+    -------
+    EnrichmentServerError: raised if the server could not enrich one of the networks
+
+    """
+    if len(networks) != len(outputs):
+        raise EnrichmentServerError("The number of the input and the output files are different")
+
+    requests = [{"input": os.path.abspath(network), "output": os.path.abspath(output), "distance": distance,
+                 "reference": os.path.abspath(reference_network), "max_degree": max_degree, "top_k": top_k,
+                 "edge_budget": edge_budget}
+                for network, output in zip(networks, outputs)]
+    for result in request_enrichment(server, requests):
+        if result["status"] != "ok":
+            raise EnrichmentServerError(f'{result["output"]}: {result["error"]}')
+        print_stats(result["stats"])
+
 
 def main(argv):
     """ Main method - waits for exit code """
     args = parse_args(argv)
-    _check_args(args.input, args.distance, args.reference_network, args.output)
-    run(args.input, args.distance, args.reference_network, args.output)
+    if args.server:
+        networks = args.input.split(",")
+        outputs = args.output.split(",")
+        for network, output in zip(networks, outputs):
+            _check_args(network, args.distance, args.reference_network, output,
+                        args.max_degree, args.top_k, args.edge_budget)
+        run_on_server(args.server, networks, args.distance, args.reference_network, outputs,
+                      args.max_degree, args.top_k, args.edge_budget)
+        return 0
+
+    _check_args(args.input, args.distance, args.reference_network, args.output,
+                args.max_degree, args.top_k, args.edge_budget)
+    run(args.input, args.distance, args.reference_network, args.output,
+        args.max_degree, args.top_k, args.edge_budget)
 
     return 0
 
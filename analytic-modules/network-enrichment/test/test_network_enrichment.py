@@ -1,7 +1,9 @@
 """ Network Enrichment Module Tests """
 import os
+import shutil
 
 import network_enrichment as ne
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -172,3 +174,152 @@ def test_enrich_network_alternatives(tmpdir, create_example_networks):
     assert "321" not in output_frame.values
     assert len(output_frame[~output_frame.iloc[:, 2].str.contains('-')]) == expected_num_neighbours[1]
 
+
+
+def test_reference_index_expands_every_node_once():
+    """ A unit test of the breadth-first search on the CSR index of the reference network """
+    reference_network = pd.DataFrame({inter_a: ["a", "b", "c", "b", "d", "x"],
+                                      inter_b: ["b", "c", "a", "d", "e", "y"]})
+    ref_index = ne.ReferenceIndex(reference_network)
+
+    assert ref_index.expand(["a"], 1).tolist() == [0]
+    assert ref_index.expand(["a"], 2).tolist() == [0, 1, 3]
+    # "a" is not expanded again at the third hop, only "c" and "d"
+    assert ref_index.expand(["a"], 3).tolist() == [0, 1, 3, 2, 4]
+    assert ref_index.expand(["unknown"], 3).tolist() == []
+
+
+def test_drop_duplicate_links():
+    """ A unit test of the removal of the duplicate undirected links """
+    network = pd.DataFrame({inter_a: ["a", "b", "ab", "a", "c"],
+                            inter_b: ["b", "a", "c", "bc", "ab"]})
+
+    deduplicated = ne.drop_duplicate_links(network)
+
+    assert deduplicated[inter_a].tolist() == ["a", "ab", "a"]
+    assert deduplicated[inter_b].tolist() == ["b", "c", "bc"]
+
+
+def test_capped_expansion():
+    """ A unit test of the hub-aware caps of the expansion """
+    confidence = h.mitab_header[14]
+    reference_network = pd.DataFrame({inter_a: ["a", "hub", "hub", "hub", "hub", "a", "b"],
+                                      inter_b: ["hub", "h1", "h2", "h3", "h4", "b", "c"],
+                                      confidence: ["score:0.1", "score:0.2", "score:0.9", "-", "score:0.5",
+                                                   "score:0.3", "miscore:0.4|score:0.8"]})
+    ref_index = ne.ReferenceIndex(reference_network)
+
+    stats = {}
+    assert ref_index.expand(["a"], 2, max_degree=3, stats=stats).tolist() == [0, 5, 6]
+    assert stats["hubs"] == 1
+    assert stats["dropped_hub_links"] == 4
+
+    # the links with the highest confidence scores are kept, in the order of the reference network
+    assert ref_index.expand(["a"], 2, top_k=2, stats=stats).tolist() == [0, 5, 2, 4, 6]
+    assert ref_index.expand(["hub"], 1, top_k=3, stats=stats).tolist() == [1, 2, 4]
+    assert stats["dropped_top_k_links"] == 1
+
+    assert ref_index.expand(["a"], 2, edge_budget=4, stats=stats).tolist() == [0, 5, 2, 6]
+    assert stats["links"] == 4
+    assert stats["dropped_budget_links"] == 3
+
+
+
+def test_uncapped_expansion_keeps_reference_order():
+    """ Without caps, the links are found in the order of the reference network (whatever their scores) """
+    confidence = h.mitab_header[14]
+    reference_network = pd.DataFrame({inter_a: ["a", "a", "a"],
+                                      inter_b: ["b", "c", "b"],
+                                      confidence: ["score:0.1", "score:0.5", "score:0.9"]})
+    ref_index = ne.ReferenceIndex(reference_network)
+
+    assert ref_index.expand(["a"], 1).tolist() == [0, 1, 2]
+    # the first of the duplicate links is kept
+    neighbours = ne.drop_duplicate_links(ne.get_neighbours(ref_index, ["a"], 1))
+    assert neighbours[confidence].tolist() == ["score:0.1", "score:0.5"]
+
+@pytest.mark.parametrize('number_of_hops', [1, 3])
+def test_enrich_to_file_with_saved_index(tmpdir, create_example_networks, number_of_hops):
+    """ A component test to check that the saved (memory-mapped) index gives the same output as run """
+    _, _, network_path, reference_path = create_example_networks
+    expected_file = os.path.join(str(tmpdir), "expected.tsv")
+    output_file = os.path.join(str(tmpdir), "example_enriched.tsv")
+    ne.run(network=network_path, distance=number_of_hops, reference_network=reference_path, output=expected_file)
+
+    ref_index = ne.load_reference_index(reference_path, index_folder=str(tmpdir))
+    ne.enrich_to_file(network_path, ref_index, output_file, number_of_hops)
+
+    assert open(output_file).read() == open(expected_file).read()
+    # the saved index is reused
+    assert ne.load_reference_index(reference_path, index_folder=str(tmpdir)).line_offsets.filename is not None
+
+
+def test_reference_index_saved_by_another_process(tmpdir, create_example_networks, monkeypatch):
+    """ If another process saves the same index first, its index is used and the temporary folder removed """
+    _, _, _, reference_path = create_example_networks
+    index_folder = tmpdir.mkdir("index")
+
+    def concurrent_replace(tmp_folder, index_path):
+        shutil.copytree(tmp_folder, index_path)
+        raise OSError("Directory not empty")
+    monkeypatch.setattr(ne.os, "replace", concurrent_replace)
+    ref_index = ne.load_reference_index(reference_path, index_folder=str(index_folder))
+    assert ref_index.line_offsets.filename is not None
+    assert [name for name in os.listdir(str(index_folder)) if name.endswith(".tmp")] == []
+
+
+def test_saved_index_rebuilt_after_loading(tmpdir, create_example_networks):
+    """ A loaded index keeps its own lines if the index is rebuilt later """
+    _, _, network_path, reference_path = create_example_networks
+    rows = np.arange(len(ne.load_network(reference_path)))
+    expected = ne.load_reference_index(reference_path, index_folder=str(tmpdir.mkdir("other"))).reference_lines(rows)
+    ref_index = ne.load_reference_index(reference_path, index_folder=str(tmpdir))
+
+    # a link is inserted at the beginning of the reference network, so the offsets of the lines change
+    with open(reference_path) as reference:
+        lines = reference.read()
+    with open(reference_path, "w") as reference:
+        reference.write("\t".join(["Y", "Z"] + ["-"] * (len(h.mitab_header) - 2)) + "\n" + lines)
+    os.utime(reference_path, (0, 0))
+    rebuilt_index = ne.load_reference_index(reference_path, index_folder=str(tmpdir))
+
+    assert len(rebuilt_index.sources) == len(rows) + 1
+    assert ref_index.reference_lines(rows) == expected
+
+def test_enrichment_server(tmpdir, create_example_networks):
+    """ A component test of the enrichment server and the --server option """
+    import threading
+    import time
+    import enrichment_server
+
+    _, _, network_path, reference_path = create_example_networks
+    socket_path = os.path.join(str(tmpdir), "enrichment.sock")
+    server = threading.Thread(target=enrichment_server.serve, args=(reference_path, socket_path, 2, str(tmpdir)))
+    server.start()
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+
+        outputs = [os.path.join(str(tmpdir), f"enriched_{patient}.tsv") for patient in range(3)]
+        ne.main(["-i", ",".join([network_path] * 3), "-o", ",".join(outputs), "-d", "2", "-r", reference_path,
+                 "--server", socket_path])
+
+        expected_file = os.path.join(str(tmpdir), "expected.tsv")
+        ne.run(network=network_path, distance=2, reference_network=reference_path, output=expected_file)
+        for output in outputs:
+            assert open(output).read() == open(expected_file).read()
+
+        results = ne.request_enrichment(socket_path, [{"input": network_path, "output": outputs[0], "distance": 1,
+                                                       "reference": os.path.join(str(tmpdir), "other.tsv")}])
+        assert results[0]["status"] == "error"
+
+        # the reference network changes, the index of the workers is stale
+        with open(reference_path, "a") as reference:
+            reference.write("\t".join(["Y", "Z"] + ["-"] * (len(h.mitab_header) - 2)) + "\n")
+        results = ne.request_enrichment(socket_path, [{"input": network_path, "output": outputs[0], "distance": 1}])
+        assert results[0]["status"] == "error" and "changed" in results[0]["error"]
+    finally:
+        enrichment_server.shutdown(socket_path)
+        server.join()
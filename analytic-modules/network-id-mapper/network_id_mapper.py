@@ -1,14 +1,19 @@
 import argparse
-import json
 import os
 import sys
 sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
-from collections import defaultdict
 
+import numpy as np
 import pandas as pd
 
+from common_libs.id_mapping import mapping_index, uniprot_format
 from common_libs.mitab_handler import mitab_handler
 
+# columns of the input MITAB files used by the ID mapping (see read_network)
+node_columns = [0, 1]
+annotation_columns = [25, 26]
+metadata_column = 27
+
 
 def parse_args(args):
     help_text = \
@@ -38,7 +43,8 @@ def parse_args(args):
         
         Th output of the tool is a standard MITAB file (using standard NavigOmiX identifiers). The
         tool is not sensitive to self-loops, it will copy them to the output file as well, if they
-        were present in the input. But there will be no duplicate links in the output file. 
+        were present in the input. But there will be no duplicate links in the output file (the links are
+        undirected, so A-B and B-A are duplicates, only the first one is kept).
         
         All the metadata from the input connections will be copied to the output file as well without 
         any change, only the fully qualified NavigOmiX identifiers will be updated with the correct 
@@ -72,6 +78,21 @@ def parse_args(args):
         
         -o, --output <path>                : output MITAB file
         
+        -s, --selective-load              : read only the mapping of the nodes of the input network: the
+                                            input is scanned for its node IDs first, then the mapping
+                                            files are streamed once, keeping only the lines of these IDs
+                                            (for small networks and mapping files without a compiled index)
+                                            [Optional, default: use the compiled mapping index]
+        
+        -uc, --upper-case                 : the uniprot IDs of the output will be uppercase, like after running
+                                            the uniprot ID formatter with --upper-case [Optional]
+        
+        -ni, --no-isoform                 : the isoforms of the uniprot IDs of the output will be deleted, like
+                                            after running the uniprot ID formatter with --no-isoform [Optional]
+        
+        -if, --index-folder <path>        : path to the folder of the compiled mapping index [Optional, default:
+                                            a folder in the temporary folder of the system]
+        
         
         **Exit codes**
         
@@ -124,9 +145,34 @@ def parse_args(args):
                         action="store",
                         required=True)
 
+    parser.add_argument("-s", "--selective-load",
+                        help="read only the mapping of the nodes of the input network [optional]",
+                        dest="selective_load",
+                        action="store_true",
+                        default=False)
+
+    parser.add_argument("-uc", "--upper-case",
+                        help="the uniprot IDs of the output will be uppercase [optional]",
+                        dest="upper_case",
+                        action="store_true",
+                        default=None)
+
+    parser.add_argument("-ni", "--no-isoform",
+                        help="the isoforms of the uniprot IDs of the output will be deleted [optional]",
+                        dest="no_isoform",
+                        action="store_true",
+                        default=None)
+
+    parser.add_argument("-if", "--index-folder",
+                        help="<path to the folder of the compiled mapping index> [optional]",
+                        dest="index_folder",
+                        action="store",
+                        required=False)
+
     results = parser.parse_args(args)
     return results.input_file, results.remove, results.molecule_type_selector.lower(), \
-           results.target_id_type.lower(), results.mapping_data, results.output_file
+           results.target_id_type.lower(), results.mapping_data, results.selective_load, results.output_file, \
+           results.upper_case, results.no_isoform, results.index_folder
 
 
 def check_params(input_file, mapping_file_paths):
@@ -140,41 +186,34 @@ def check_params(input_file, mapping_file_paths):
             sys.exit(2)
 
 
-def write_to_output(output_network, source_node, source_node_id, target_node, target_node_id, tax_id, source_node_molecule_type, target_node_molecule_type,
-                    old_source_node, old_source_node_id, old_target_node, old_target_node_id, metadata):
-    mitab = mitab_handler.MiTabHandler()
-
-    interaction = mitab.new_interaction()
-
-    interaction[mitab.uidA] = f'{source_node}:{source_node_id}'
-    interaction[mitab.uidB] = f'{target_node}:{target_node_id}'
-    interaction[mitab.altA] = f'{old_source_node}:{old_source_node_id}'
-    interaction[mitab.altB] = f'{old_target_node}:{old_target_node_id}'
-    interaction[mitab.taxA] = f'{tax_id}'
-    interaction[mitab.taxB] = f'{tax_id}'
-    interaction[mitab.annotA] = f'start:{source_node_molecule_type};{source_node};{source_node_id}'
-    interaction[mitab.annotB] = f'end:{target_node_molecule_type};{target_node};{target_node_id}'
-    interaction[mitab.annotInter] = f'{metadata}'
-
-    mitab.add_interaction(interaction)
+def input_node_ids(input_file):
+    """ Returns the set of the (lowercase) node IDs of a MITAB file """
+    node_ids = set()
+    nodes = pd.read_csv(input_file, delimiter='\t', header=None, names=range(len(mitab_handler.mitab_header)),
+                        dtype=str)
+    for column in node_columns:
+        node_ids.update(nodes[column].str.lower().str.split(":").str[1].dropna())
+    return node_ids
 
-    mitab.serialise_mitab(output_network, add_header=False)
 
+def import_mapping_data(mapping_file_paths, target_id_type, node_ids=None, index_folder=None):
+    """
+    Opens the compiled ID mapping of the mapping files (compiled once into index_folder, by default a
+    folder in the temporary folder, and memory-mapped afterwards, see common_libs.id_mapping.mapping_index).
 
-def import_mapping_data(mapping_file_paths, target_id_type):
+    If node_ids is given, only the mapping of these IDs is read from the mapping files (without compiling
+    the whole mapping), see mapping_index.load_selected_mapping_index.
 
-    mapping_dictionary1 = defaultdict(set)
-    mapping_dictionary2 = defaultdict(set)
-
-    for file in mapping_file_paths:
-        with open(file, "r") as mapping_file:
-            for line in mapping_file:
-                map_line = json.loads(line.strip())
-                if map_line["to_id_type"].lower() == target_id_type:
-                    mapping_dictionary1[map_line["from_id"].lower()].add(map_line["to_id"].lower())
-                if map_line["from_id_type"].lower() == "uniquename":
-                    mapping_dictionary2[map_line["from_id"].lower()].add(map_line["to_id"].lower())
-    return mapping_dictionary1, mapping_dictionary2
+    Returns
+    -------
+    mapping_dictionary: from ID -> set of the to IDs of the target ID type
+    mapping_dictionary_uniquename: from ID -> set of the to IDs of the uniquename from IDs
+    """
+    if node_ids is not None:
+        index = mapping_index.load_selected_mapping_index(mapping_file_paths, target_id_type, node_ids)
+    else:
+        index = mapping_index.load_mapping_index(mapping_file_paths, target_id_type, index_folder)
+    return index.mapping, index.uniquename
 
 
 def map_single_id(id, id_type, molecule_type, requested_mapped_id_type, molecule_types_list, remove, mapping_dictionary,
@@ -199,49 +238,149 @@ def map_single_id(id, id_type, molecule_type, requested_mapped_id_type, molecule
     return keep_original
 
 
-def id_mapping(input_file, remove, molecule_types_list, requested_mapped_id_type, mapping_dictionary,
-               mapping_dictionary_uniquename, output_file):
+def read_network(input_file):
+    """
+    Reads the columns of a MITAB file which are needed for the ID mapping (the node IDs, the molecule
+    types and the metadata of the interactions). The values are lowercase, missing values are "-" (like
+    in MiTabHandler.parse_mitab). The distinct nodes are parsed once, not for every interaction.
+
+    Returns
+    -------
+    edges: dataframe of the interactions, source_node and target_node (the row of the node in nodes) and
+        metadata
+    nodes: dataframe of the distinct nodes, node_id_type, node_id and node_molecule_type
+    """
+    columns = node_columns + annotation_columns + [metadata_column]
+    with open(input_file) as input_network:
+        n_columns = input_network.readline().count('\t') + 1
+    # the missing columns of shorter MITAB files are missing values
+    network = pd.read_csv(input_file, delimiter='\t', header=None, dtype=str, names=range(n_columns),
+                          usecols=[column for column in columns if column < n_columns])
+    network = network.reindex(columns=columns, fill_value='-').fillna('-')
+    n_edges = len(network)
+
+    def codes(columns):
+        # codes of the lowercase values of the source and the target column
+        values = pd.concat([network[column] for column in columns], ignore_index=True)
+        value_codes, distinct_values = pd.factorize(values)
+        lowercase_codes, lowercase_values = pd.factorize(pd.Series(distinct_values, dtype=object).str.lower())
+        return lowercase_codes[value_codes], pd.Series(lowercase_values)
+
+    id_codes, ids = codes(node_columns)
+    annotation_codes, annotations = codes(annotation_columns)
+    node_codes, node_keys = pd.factorize(id_codes.astype(np.int64) * len(annotations) + annotation_codes)
+
+    node_ids = ids.iloc[node_keys // len(annotations)].reset_index(drop=True).str.split(":")
+    molecule_types = annotations.iloc[node_keys % len(annotations)].reset_index(drop=True).str.split(":").str[1]
+    nodes = pd.DataFrame({"node_id_type": node_ids.str[0],
+                          "node_id": node_ids.str[1].fillna(''),
+                          "node_molecule_type": molecule_types.str.split(";").str[0].fillna('')})
+
+    edges = pd.DataFrame({"source_node": node_codes[:n_edges], "target_node": node_codes[n_edges:],
+                          "metadata": network[metadata_column].str.lower()})
+    return edges, nodes
+
+
+def map_nodes(nodes, remove, molecule_types_list, requested_mapped_id_type, mapping_dictionary,
+              mapping_dictionary_uniquename):
+    """
+    Maps every distinct node of the network once (see map_single_id).
+
+    Returns
+    -------
+    A dataframe of the mapped nodes: node (the row of the node in nodes), mapped_id and mapped_id_type,
+    with a row for each mapped ID of a node (sorted), and no row for a node without any mapped ID.
+    """
+    mapped_ids = []
+    mapped_id_types = []
+    for id_type, id, molecule_type in nodes.itertuples(index=False):
+        ids, mapped_id_type = map_single_id(id, id_type, molecule_type, requested_mapped_id_type,
+                                            molecule_types_list, remove, mapping_dictionary,
+                                            mapping_dictionary_uniquename)
+        mapped_ids.append(sorted(ids))
+        mapped_id_types.append(mapped_id_type)
+    mapped_nodes = pd.DataFrame({"node": np.arange(len(nodes)), "mapped_id": pd.Series(mapped_ids, dtype=object),
+                                 "mapped_id_type": pd.Series(mapped_id_types, dtype=object)})
+    return mapped_nodes.explode("mapped_id").dropna(subset=["mapped_id"]).reset_index(drop=True)
+
+
+def mapped_links(edges, mapped_nodes):
+    """
+    Joins the interactions with the mapped nodes of their source and target nodes, so an interaction is
+    replaced by the interactions between all the mapped IDs of its nodes. The links are undirected, so links
+    between the same two mapped IDs (in either direction, e.g. A-B and B-A) are duplicates, only the first
+    one is kept.
+
+    Returns
+    -------
+    A dataframe of the links: interaction (the row of the interaction in edges), source and target (the
+    rows of the mapped nodes in mapped_nodes).
+    """
+    mapped = mapped_nodes[["node"]].rename_axis("mapped").reset_index()
+    links = edges[["source_node", "target_node"]].rename_axis("interaction").reset_index()
+    links = links.merge(mapped.rename(columns={"node": "source_node", "mapped": "source"}), on="source_node")
+    links = links.merge(mapped.rename(columns={"node": "target_node", "mapped": "target"}), on="target_node")
+    links = links.sort_values(["interaction", "source", "target"], kind="stable", ignore_index=True)
+
+    # the same mapped ID can be the mapping of more nodes, so the links are compared by their mapped IDs
+    mapped_id_codes, mapped_ids = pd.factorize(mapped_nodes["mapped_id_type"] + ":" + mapped_nodes["mapped_id"])
+    source_codes = mapped_id_codes[links["source"]].astype(np.int64)
+    target_codes = mapped_id_codes[links["target"]].astype(np.int64)
+    link_keys = np.minimum(source_codes, target_codes) * len(mapped_ids) + np.maximum(source_codes, target_codes)
+    return links.loc[~pd.Series(link_keys).duplicated().values, ["interaction", "source", "target"]]
+
+
+def _mitab_value(value):
+    """ Quotes a value the same way as the csv module (and DataFrame.to_csv) does """
+    if any(character in value for character in '\t"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def write_network(output_file, edges, nodes, mapped_nodes, links, upper_case=None, no_isoform=None):
+    """
+    Writes the mapped links to a MITAB file in one go. The columns of the nodes are formatted once per
+    mapped node (not for every link). The uniprot IDs are formatted like by the uniprot ID formatter, if
+    upper_case or no_isoform is given (see uniprot_format.format_interactor).
+    """
+    tax_id = 'taxid:9606(homo sapiens)'
+    mapped = mapped_nodes.join(nodes, on="node")
+    uids = mapped["mapped_id_type"] + ":" + mapped["mapped_id"]
+    alts = mapped["node_id_type"] + ":" + mapped["node_id"]
+    annotations = mapped["node_molecule_type"] + ";" + mapped["mapped_id_type"] + ";" + mapped["mapped_id"]
+
+    source_uids, source_alts, starts, target_uids, target_alts, ends = [
+        column.map(_mitab_value).tolist()
+        for direction in ["start:", "end:"]
+        for column in uniprot_format.format_interactor(uids, alts, direction + annotations, upper_case, no_isoform)]
+    metadata = edges["metadata"].map(_mitab_value).tolist()
+
+    # uidA, uidB, altA, altB, 5 missing columns, taxA, taxB, 14 missing columns, annotA, annotB, annotInter
+    # and 14 missing columns (see mitab_handler.mitab_header)
+    tax_columns = "\t-" * 5 + f"\t{tax_id}\t{tax_id}" + "\t-" * 14
+    last_columns = "\t-" * (len(mitab_handler.mitab_header) - metadata_column - 1)
     with open(output_file, "w") as output_network:
+        output_network.writelines(f"{source_uids[source]}\t{target_uids[target]}\t{source_alts[source]}\t"
+                                  f"{target_alts[target]}{tax_columns}"
+                                  f"\t{starts[source]}\t{ends[target]}\t{metadata[interaction]}{last_columns}\n"
+                                  for interaction, source, target in zip(links["interaction"].tolist(),
+                                                                         links["source"].tolist(),
+                                                                         links["target"].tolist()))
 
-        mitab = mitab_handler.MiTabHandler()
-        input_network = mitab.parse_mitab(input_file)
-        rows = input_network.values
-
-        for row in rows:
-            tax_id = 'taxid:9606(Homo sapiens)'
-            source_node_id_type = row[0].split(":")[0].lower()
-            target_node_id_type = row[1].split(":")[0].lower()
-            source_node_id = row[0].split(":")[1].lower()
-            target_node_id = row[1].split(":")[1].lower()
-            source_node_molecule_type = row[25].split(":")[1].split(";")[0].lower()
-            target_node_molecule_type = row[26].split(":")[1].split(";")[0].lower()
-            metadata = row[27]
-
-            mapped_source_ids, mapped_source_id_type = map_single_id(source_node_id, source_node_id_type,
-                                                                     source_node_molecule_type,
-                                                                     requested_mapped_id_type, molecule_types_list,
-                                                                     remove, mapping_dictionary,
-                                                                     mapping_dictionary_uniquename)
-
-            mapped_target_ids, mapped_target_id_type = map_single_id(target_node_id, target_node_id_type,
-                                                                     target_node_molecule_type,
-                                                                     requested_mapped_id_type, molecule_types_list,
-                                                                     remove, mapping_dictionary,
-                                                                     mapping_dictionary_uniquename)
-
-            for new_source_node_id in mapped_source_ids:
-                for new_target_node_id in mapped_target_ids:
-                    write_to_output(output_network, mapped_source_id_type, new_source_node_id,
-                                    mapped_target_id_type, new_target_node_id, tax_id, source_node_molecule_type,
-                                    target_node_molecule_type, source_node_id_type, source_node_id, target_node_id_type,
-                                    target_node_id, metadata)
-
-    output_network.close()
+
+def id_mapping(input_file, remove, molecule_types_list, requested_mapped_id_type, mapping_dictionary,
+               mapping_dictionary_uniquename, output_file, upper_case=None, no_isoform=None):
+    edges, nodes = read_network(input_file)
+    mapped_nodes = map_nodes(nodes, remove, molecule_types_list, requested_mapped_id_type, mapping_dictionary,
+                             mapping_dictionary_uniquename)
+    links = mapped_links(edges, mapped_nodes)
+    write_network(output_file, edges, nodes, mapped_nodes, links, upper_case, no_isoform)
 
 
 def main():
 
-    input_file, remove, molecule_type_selector, target_id_type, mapping_data, output_file = parse_args(sys.argv[1:])
+    input_file, remove, molecule_type_selector, target_id_type, mapping_data, selective_load, output_file, \
+        upper_case, no_isoform, index_folder = parse_args(sys.argv[1:])
     mapping_files_paths = mapping_data.split(",")
 
     print(f'====== Starting Network ID Mapper ======')
@@ -253,13 +392,19 @@ def main():
         molecule_types.add("gene")
         molecule_types.add("protein")
 
+    node_ids = None
+    if selective_load:
+        print(f'====== Reading the node IDs of: {input_file} ======')
+        node_ids = input_node_ids(input_file)
+
     for mapping_file in mapping_files_paths:
         print(f'====== Loading mapping data from: {mapping_file} ======')
-    mapping_dictionary, mapping_dictionary_uniquename = import_mapping_data(mapping_files_paths, target_id_type)
+    mapping_dictionary, mapping_dictionary_uniquename = import_mapping_data(mapping_files_paths, target_id_type,
+                                                                            node_ids, index_folder)
 
     print(f'====== Writing mapped connections to: {output_file} ======')
     id_mapping(input_file, remove, molecule_types, target_id_type, mapping_dictionary, mapping_dictionary_uniquename,
-               output_file)
+               output_file, upper_case, no_isoform)
     print(f'====== Network ID mapper finished successfully! ======')
 
 
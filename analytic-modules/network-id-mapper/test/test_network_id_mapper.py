@@ -13,7 +13,7 @@ example_files_list = ["example_files/file1.tsv",
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_input_network_file_exists(args):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = ['file', '', '', '', example_files_list[1], '', False]
+        args.return_value = ['file', '', '', '', example_files_list[1], '', False, None, None, None]
         network_id_mapper.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -23,7 +23,7 @@ def test_input_network_file_exists(args):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_remove_parameter_is_good(args):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [example_files_list[0], 'asdasd', '', '', example_files_list[1], '', False]
+        args.return_value = [example_files_list[0], 'asdasd', '', '', example_files_list[1], '', False, None, None, None]
         network_id_mapper.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -33,7 +33,7 @@ def test_remove_parameter_is_good(args):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_mapping_files_exists(args):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [example_files_list[0], 'true', '', '', 'fake_file.txt', '', False]
+        args.return_value = [example_files_list[0], 'true', '', '', 'fake_file.txt', '', False, None, None, None]
         network_id_mapper.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -43,7 +43,7 @@ def test_mapping_files_exists(args):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_case_one(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
-    args.return_value = [example_files_list[0], 'true', '', 'uniprotac', example_files_list[1], '', output_file]
+    args.return_value = [example_files_list[0], 'true', '', 'uniprotac', example_files_list[1], '', output_file, None, None, None]
     network_id_mapper.main()
 
     num_lines = sum(1 for line in open(output_file))
@@ -67,7 +67,7 @@ def test_case_one(args, tmpdir):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_case_two(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
-    args.return_value = [example_files_list[0], 'true', 'protein', 'uniprotac', example_files_list[1], '', output_file]
+    args.return_value = [example_files_list[0], 'true', 'protein', 'uniprotac', example_files_list[1], '', output_file, None, None, None]
     network_id_mapper.main()
 
     ensg_number = 0
@@ -83,7 +83,7 @@ def test_case_two(args, tmpdir):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_case_three(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
-    args.return_value = [example_files_list[0], 'false', 'protein', 'uniprotac', example_files_list[1], '', output_file]
+    args.return_value = [example_files_list[0], 'false', 'protein', 'uniprotac', example_files_list[1], '', output_file, None, None, None]
     network_id_mapper.main()
 
     ensg_number = 0
@@ -99,7 +99,7 @@ def test_case_three(args, tmpdir):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_case_four(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
-    args.return_value = [example_files_list[0], 'true', '', 'uniprotac', example_files_list[1], '', output_file]
+    args.return_value = [example_files_list[0], 'true', '', 'uniprotac', example_files_list[1], '', output_file, None, None, None]
     network_id_mapper.main()
 
     p11007_number = 0
@@ -115,7 +115,7 @@ def test_case_four(args, tmpdir):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_case_five(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
-    args.return_value = [example_files_list[0], 'false', '', 'test', example_files_list[1], '', output_file]
+    args.return_value = [example_files_list[0], 'false', '', 'test', example_files_list[1], '', output_file, None, None, None]
     network_id_mapper.main()
 
     num_lines_input_file = sum(1 for line in open(example_files_list[0]))
@@ -127,7 +127,7 @@ def test_case_five(args, tmpdir):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_case_six(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
-    args.return_value = [example_files_list[0], 'true', '', 'test', example_files_list[1], '', output_file]
+    args.return_value = [example_files_list[0], 'true', '', 'test', example_files_list[1], '', output_file, None, None, None]
     network_id_mapper.main()
 
     assert os.stat(output_file).st_size == 0
@@ -136,7 +136,7 @@ def test_case_six(args, tmpdir):
 @mock.patch.object(network_id_mapper, 'parse_args')
 def test_case_if_uniquename_is_given(args, tmpdir):
     output_file = tmpdir.join("output.tsv")
-    args.return_value = [example_files_list[2], 'false', '', 'uniprotac', example_files_list[3], 'true', output_file]
+    args.return_value = [example_files_list[2], 'false', '', 'uniprotac', example_files_list[3], 'true', output_file, None, None, None]
     network_id_mapper.main()
 
     outputfile_rows_int_a = ["uniprotac:p52879", "uniprotac:p29999", "uniprotac:g29999"]
@@ -164,3 +164,64 @@ def test_case_if_uniquename_is_given(args, tmpdir):
     for member in outputfile_rows_int_b:
         assert member == result_b[index2]
         index2 = index2 + 1
+
+
+def test_selective_load():
+    example_files = os.path.join(os.path.dirname(__file__), "example_files")
+    input_file = os.path.join(example_files, "file1.tsv")
+    mapping_files = [os.path.join(example_files, name) for name in ["mapping_file.json", "mapping_file2.json"]]
+
+    node_ids = network_id_mapper.input_node_ids(input_file)
+    assert "ensg00000010401" in node_ids and "mi0000004" in node_ids
+
+    mapping, uniquename = network_id_mapper.import_mapping_data(mapping_files, "uniprotac", node_ids)
+    full_mapping, full_uniquename = network_id_mapper.import_mapping_data(mapping_files, "uniprotac")
+    for node_id in node_ids:
+        assert mapping[node_id] == full_mapping[node_id]
+        assert uniquename[node_id] == full_uniquename[node_id]
+    assert 0 < len(mapping) <= len(node_ids)
+
+
+def test_id_mapping_without_duplicates(tmpdir):
+    input_file = tmpdir.join("input.tsv")
+    # ensg00000010401 and ensg00000010402 are mapped to the same protein
+    input_file.write("ensembl:ensg00000010401\tensembl:ensg00000010406" + "\t" * 24 +
+                     "start:gene;ensembl;ensg00000010401\tend:gene;ensembl;ensg00000010406\tm1\n"
+                     "ensembl:ensg00000010402\tensembl:ensg00000010406" + "\t" * 24 +
+                     "start:gene;ensembl;ensg00000010402\tend:gene;ensembl;ensg00000010406\tm2\n")
+    mapping_file = tmpdir.join("mapping.json")
+    mapping_file.write("".join(f'{{"from_id_type": "ensembl", "to_id_type": "uniprotac", "from_id": "{from_id}", '
+                               f'"to_id": "{to_id}"}}\n'
+                               for from_id, to_id in [("ensg00000010401", "p00001"), ("ensg00000010402", "p00001"),
+                                                      ("ensg00000010406", "p10006"), ("ensg00000010406", "p00006")]))
+    mapping, uniquename = network_id_mapper.import_mapping_data([str(mapping_file)], "uniprotac")
+    output_file = tmpdir.join("output.tsv")
+    network_id_mapper.id_mapping(str(input_file), True, set(), "uniprotac", mapping, uniquename, str(output_file))
+
+    links = [line.split("\t") for line in output_file.read().splitlines()]
+    assert [link[:4] for link in links] == [["uniprotac:p00001", "uniprotac:p00006", "ensembl:ensg00000010401",
+                                             "ensembl:ensg00000010406"],
+                                            ["uniprotac:p00001", "uniprotac:p10006", "ensembl:ensg00000010401",
+                                             "ensembl:ensg00000010406"]]
+    assert links[0][25:28] == ["start:gene;uniprotac;p00001", "end:gene;uniprotac;p00006", "m1"]
+    assert all(len(link) == 42 for link in links)
+
+
+def test_id_mapping_without_reversed_duplicates(tmpdir):
+    input_file = tmpdir.join("input.tsv")
+    # ensg00000010401 -> ensg00000010406 and ensg00000010406 -> ensg00000010402 are the same protein link
+    input_file.write("ensembl:ensg00000010401\tensembl:ensg00000010406" + "\t" * 24 +
+                     "start:gene;ensembl;ensg00000010401\tend:gene;ensembl;ensg00000010406\tm1\n"
+                     "ensembl:ensg00000010406\tensembl:ensg00000010402" + "\t" * 24 +
+                     "start:gene;ensembl;ensg00000010406\tend:gene;ensembl;ensg00000010402\tm2\n")
+    mapping_file = tmpdir.join("mapping.json")
+    mapping_file.write("".join(f'{{"from_id_type": "ensembl", "to_id_type": "uniprotac", "from_id": "{from_id}", '
+                               f'"to_id": "{to_id}"}}\n'
+                               for from_id, to_id in [("ensg00000010401", "p00001"), ("ensg00000010402", "p00001"),
+                                                      ("ensg00000010406", "p00006")]))
+    mapping, uniquename = network_id_mapper.import_mapping_data([str(mapping_file)], "uniprotac")
+    output_file = tmpdir.join("output.tsv")
+    network_id_mapper.id_mapping(str(input_file), True, set(), "uniprotac", mapping, uniquename, str(output_file))
+
+    links = [line.split("\t") for line in output_file.read().splitlines()]
+    assert [link[:2] + link[27:28] for link in links] == [["uniprotac:p00001", "uniprotac:p00006", "m1"]]
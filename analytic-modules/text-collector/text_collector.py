@@ -1,31 +1,114 @@
 import argparse
 import os
+import shutil
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.file_handler import shard_manifest
+
+# size of the blocks read and written at once when copying the input files
+copy_buffer_size = 4 << 20
+
+
+def copy_file(input_file, output_file):
+    """
+    Copies the content of a binary input file to a binary output file, in the kernel with os.sendfile if
+    possible (otherwise with large buffers).
+
+    Returns
+    -------
+    The last byte of the input file (empty for an empty file).
+    """
+    size = os.fstat(input_file.fileno()).st_size
+    if size == 0:
+        return b""
+    input_file.seek(size - 1)
+    last_byte = input_file.read(1)
+    input_file.seek(0)
+
+    output_file.flush()
+    offset = 0
+    try:
+        while offset < size:
+            sent = os.sendfile(output_file.fileno(), input_file.fileno(), offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+    except (AttributeError, OSError):
+        # no os.sendfile (e.g. on Windows), or not supported by the file systems
+        input_file.seek(offset)
+        shutil.copyfileobj(input_file, output_file, copy_buffer_size)
+    return last_byte
+
+
+def _read_block(path, offset):
+    with open(path, 'rb') as inp:
+        inp.seek(offset)
+        return inp.read(copy_buffer_size)
 
 
 class TextCollector:
 
-    def __init__(self, input_files, output_file):
+    def __init__(self, input_files, output_file, prefetch_threads=0, manifest_file=None):
         self.input_files = input_files
         self.output_file = output_file
+        self.prefetch_threads = prefetch_threads
+        self.manifest_file = manifest_file
 
     def check_params(self):
         for input_file in self.input_files:
             if not os.path.isfile(input_file):
                 print("ERROR! the specified input file doesn't exists: " + input_file)
                 sys.exit(1)
+        if self.manifest_file:
+            # the outputs of the shards are collected in the order of the shards
+            try:
+                manifest = shard_manifest.read_manifest(self.manifest_file)
+                self.input_files = shard_manifest.order_by_manifest(self.input_files, manifest)
+            except (OSError, shard_manifest.InvalidManifest) as error:
+                print(f"ERROR! {error}")
+                sys.exit(2)
 
     def run_tool(self):
-        with open(self.output_file, 'w') as outp:
+        with open(self.output_file, 'wb') as outp:
+            if self.prefetch_threads:
+                self.collect_prefetched(outp)
+                return
             for input_path in self.input_files:
                 print("processing input file: " + input_path)
-                with (open(input_path, 'r')) as inp:
-                    line = inp.readline()
-                    while line:
-                        outp.write(line)
-                        if not line.endswith("\n"):
-                            outp.write("\n")
-                        line = inp.readline()
+                with open(input_path, 'rb') as inp:
+                    last_byte = copy_file(inp, outp)
+                if last_byte not in (b"", b"\n"):
+                    outp.write(b"\n")
+
+    def collect_prefetched(self, outp):
+        """
+        Copies the input files block by block, while the next blocks are read by a thread pool (useful on
+        network file systems, where reading in parallel is faster). At most 4 blocks per thread are kept
+        in memory.
+        """
+        max_pending = self.prefetch_threads * 4
+        pending = deque()
+
+        def write_next_block():
+            is_last_block, future = pending.popleft()
+            block = future.result()
+            outp.write(block)
+            if is_last_block and not block.endswith(b"\n"):
+                outp.write(b"\n")
+
+        with ThreadPoolExecutor(max_workers=self.prefetch_threads) as executor:
+            for input_path in self.input_files:
+                print("processing input file: " + input_path)
+                size = os.path.getsize(input_path)
+                for offset in range(0, size, copy_buffer_size):
+                    if len(pending) >= max_pending:
+                        write_next_block()
+                    pending.append((offset + copy_buffer_size >= size,
+                                    executor.submit(_read_block, input_path, offset)))
+            while pending:
+                write_next_block()
 
 
 def parse_args(args=None):
@@ -45,6 +128,8 @@ def parse_args(args=None):
     Parameters:
     --input-files <comma separated list of primitive files from each iteration> [mandatory]
     --output-file <path to the output primitive file> [mandatory]   
+    --prefetch-threads <number of threads reading the input files ahead> [optional, default: 0, no prefetch]
+    --manifest <path to the manifest file of the sharded iterations> [optional]
     """
 
     parser = argparse.ArgumentParser(description=description)
@@ -57,18 +142,30 @@ def parse_args(args=None):
                         dest='output_file',
                         action='store',
                         required=True)
+    parser.add_argument("-t",
+                        "--prefetch-threads",
+                        dest='prefetch_threads',
+                        type=int,
+                        action='store',
+                        default=0,
+                        required=False)
+    parser.add_argument("-m",
+                        "--manifest",
+                        dest='manifest',
+                        action='store',
+                        required=False)
 
     results = parser.parse_args(args)
-    return results.input_files, results.output_file
+    return results.input_files, results.output_file, results.prefetch_threads, results.manifest
 
 
 def main():
-    input_files, output_file = parse_args(sys.argv[1:])
+    input_files, output_file, prefetch_threads, manifest_file = parse_args(sys.argv[1:])
 
     print("starting TextCollector")
 
     input_file_list = list(filter(lambda x: len(x) > 0, input_files.split(',')))
-    module = TextCollector(input_file_list, output_file)
+    module = TextCollector(input_file_list, output_file, prefetch_threads, manifest_file)
     module.check_params()
     module.run_tool()
 
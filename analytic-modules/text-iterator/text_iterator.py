@@ -1,13 +1,19 @@
 import argparse
+import itertools
 import os.path
 import sys
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.file_handler import shard_manifest
 
 
 class TextIterator:
 
-    def __init__(self, input_file, output_folder):
+    def __init__(self, input_file, output_folder, chunk_size=None, chunks=None, manifest_file=None):
         self.input_file = input_file
         self.output_folder = output_folder
+        self.chunk_size = chunk_size
+        self.chunks = chunks
+        self.manifest_file = manifest_file
 
     def check_params(self):
         if not os.path.isfile(self.input_file):
@@ -16,15 +22,34 @@ class TextIterator:
         if not os.path.isdir(self.output_folder):
             print("ERROR! the specified output folder doesn't exists: " + self.output_folder)
             sys.exit(2)
+        if self.chunk_size is not None and self.chunks is not None:
+            print("ERROR! only one of the chunk size and the number of chunks can be specified")
+            sys.exit(3)
+        if (self.chunk_size is not None and self.chunk_size < 1) or (self.chunks is not None and self.chunks < 1):
+            print("ERROR! the chunk size and the number of chunks must be positive")
+            sys.exit(3)
 
     def run_tool(self):
+        chunk_size = self.chunk_size
+        if chunk_size is None and self.chunks is None:
+            # one iteration for each line
+            chunk_size = 1
         with open(self.input_file, 'r') as inp:
-            for index, line in enumerate(inp):
+            n_lines = sum(1 for _ in inp)
+        ranges = shard_manifest.shard_ranges(n_lines, chunk_size, self.chunks)
+
+        with open(self.input_file, 'r') as inp:
+            for index, (first_line, last_line) in enumerate(ranges):
                 output_file_path = self.get_output_file_path(index)
                 with (open(output_file_path, 'w')) as outp:
-                    outp.write(line)
+                    outp.writelines(itertools.islice(inp, last_line - first_line + 1))
                 print("output file created: " + output_file_path)
 
+        if self.manifest_file:
+            shard_names = [os.path.basename(self.get_output_file_path(index)) for index in range(len(ranges))]
+            shard_manifest.write_manifest(self.manifest_file, shard_names, ranges)
+            print("manifest file created: " + self.manifest_file)
+
     def get_output_file_path(self, index):
         output_file_name = "iteration-{}".format(index + 1)
         return os.path.join(self.output_folder, output_file_name)
@@ -43,9 +68,15 @@ def parse_args(args=None):
         \nThe output is an ordered set of NavigOmiX primitive files in a given output folder. 
         The file names will be `iteration-1`, `iteration-2`, ... The ordering of the 
         output files is deterministic, following the order of lines in the input file.
+        \nWith --chunk-size or --chunks, each iteration gets a shard of consecutive lines instead
+        of a single line. The shards are balanced (their sizes differ by at most one line). The
+        shards can be described in a manifest file (JSON), which is understood by the collectors.
         \nParameters:
         --input-file <path to the input file> [mandatory]   
-        --output-folder [mandatory]"""
+        --output-folder [mandatory]
+        --chunk-size <maximum number of lines in an iteration> [optional]
+        --chunks <number of iterations> [optional]
+        --manifest <path to the output manifest file, outside of the output folder> [optional]"""
 
     parser = argparse.ArgumentParser(description=help_text)
 
@@ -61,16 +92,36 @@ def parse_args(args=None):
                         action="store",
                         required=True)
 
+    parser.add_argument("-k", "--chunk-size",
+                        help="<maximum number of lines in an iteration> [optional]",
+                        dest="chunk_size",
+                        type=int,
+                        action="store",
+                        required=False)
+
+    parser.add_argument("-n", "--chunks",
+                        help="<number of iterations> [optional]",
+                        dest="chunks",
+                        type=int,
+                        action="store",
+                        required=False)
+
+    parser.add_argument("-m", "--manifest",
+                        help="<path to the output manifest file> [optional]",
+                        dest="manifest",
+                        action="store",
+                        required=False)
+
     results = parser.parse_args(args)
-    return results.input, results.output
+    return results.input, results.output, results.chunk_size, results.chunks, results.manifest
 
 
 def main():
-    input_file, output_folder = parse_args(sys.argv[1:])
+    input_file, output_folder, chunk_size, chunks, manifest_file = parse_args(sys.argv[1:])
 
     print("starting TextIterator")
 
-    module = TextIterator(input_file, output_folder)
+    module = TextIterator(input_file, output_folder, chunk_size, chunks, manifest_file)
     module.check_params()
     module.run_tool()
 
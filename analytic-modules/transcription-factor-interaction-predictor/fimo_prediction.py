@@ -8,23 +8,27 @@ sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
 from common_libs.mitab_handler import mitab_handler
 
 
-def _create_interaction(pred, mitab, snp, uniprot_id, motif_id):
+def _create_interaction(pred, mitab, snp, uniprot_id, motif_id, target):
     """ Add a new interaction line to the mitab dict builder """
     fimo_confidence_score = f"fimo-p-value:{pred[6]};fimo-q-value:{pred[6]}"
     interaction = mitab.new_interaction()
     interaction[mitab.uidA] = f'entity:tf;{uniprot_id.replace(" ", "")}'
-    interaction[mitab.uidB] = f'{pred[2]}'
+    interaction[mitab.uidB] = f'{target}'
     interaction[mitab.taxA] = "taxid:9606('homo sapiens')"
     interaction[mitab.taxB] = "taxid:9606('homo sapiens')"
     interaction[mitab.confidence] = fimo_confidence_score
     interaction[mitab.annotA] = f'motif_id:{motif_id}'
-    interaction[mitab.annotB] = f'sequence_name:{pred[2]}'
+    interaction[mitab.annotB] = f'sequence_name:{target}'
     interaction[mitab.annotInter] = f'origin:snp;dbsnp;{snp.split(":")[1]}'
     return interaction
 
 
 def create_network_file(fimo_output_predictions, uniprot_motif_mapping_dict, dbsnp_gene_dict, output):
-    """ A method to create the network file with the newly predicted interactions using the mitab handler """
+    """
+    A method to create the network file with the newly predicted interactions using the mitab handler.
+    If the sequence belongs to more genes (listed in the sequence name separated by ','), the interactions
+    are created for each of the genes.
+    """
     inner_structure = {}
     mitab = mitab_handler.MiTabHandler()
 
@@ -49,14 +53,16 @@ def create_network_file(fimo_output_predictions, uniprot_motif_mapping_dict, dbs
                 uniprot_id_complex = f"{temp_uniprot_id[0]};{temp_uniprot_id[2]}"
                 motif_id_complex = temp_motif_id[1]
 
-            interaction = _create_interaction(fimo_prediction, mitab, snp, uniprot_id, motif_id)
-            inner_structure[idx] = interaction
-            if uniprot_id_complex:
-                idx += 1
-                interaction = _create_interaction(fimo_prediction, mitab, snp, uniprot_id_complex, motif_id_complex)
+            for target in fimo_prediction[2].split(","):
+                interaction = _create_interaction(fimo_prediction, mitab, snp, uniprot_id, motif_id, target)
                 inner_structure[idx] = interaction
-                uniprot_id_complex = None
-            idx += 1
+                if uniprot_id_complex:
+                    idx += 1
+                    interaction = _create_interaction(fimo_prediction, mitab, snp, uniprot_id_complex,
+                                                      motif_id_complex, target)
+                    inner_structure[idx] = interaction
+                idx += 1
+            uniprot_id_complex = None
 
     mitab.build_network_frame(inner_structure=inner_structure)
     mitab.serialise_mitab(output, add_header=False)
@@ -76,7 +76,8 @@ def process_rsat_results(in_path, pval_threshold=None, actual_patient_folder=Non
 
 def write_rsat_results(in_path, out_path, pval_threshold=None, actual_patient_folder=None):
     """
-    Write output dictionary to a MITAB file.
+    Write output dictionary to a MITAB file. If the sequence belongs to more genes (listed in the
+    sequence id separated by ','), the interactions are written for each of the genes.
 
     Parameters
     ----------
@@ -89,21 +90,24 @@ def write_rsat_results(in_path, out_path, pval_threshold=None, actual_patient_fo
     idx = 0
     mitab = mitab_handler.MiTabHandler()
     inner_structure = {}
-    for tseq, tfprot in rsat_results:
-        pval = rsat_results[(tseq, tfprot)]
-        for tf in tfprot.split("::"):
-            tf = tf.split("(")[0]
-            interaction = mitab.new_interaction()
-            interaction[mitab.uidA] = "name:%s" % tf
-            interaction[mitab.uidB] = "uniprotac:%s" % tseq.split(";")[3].split("|")[0]
-            interaction[mitab.taxA] = "taxid:9606('homo sapiens')"
-            interaction[mitab.taxB] = "taxid:9906('homo sapiens')"
-            interaction[mitab.confidence] = "rsat_pvalue:%.16f" % pval
-            interaction[mitab.annotA] = "start:protein;name;%s" % tf
-            interaction[mitab.annotB] = f'end:{tseq.split(":")[1].split("|")[0]}'
-            interaction[mitab.annotInter] = f'origin:snp;dbsnp;{tseq.split("|")[1].split(":")[1]}'
-            inner_structure[idx] = interaction
-            idx += 1
+    for seq_id, tfprot in rsat_results:
+        pval = rsat_results[(seq_id, tfprot)]
+        genes, _, seq_meta = seq_id.partition("|")
+        for gene in genes.split(","):
+            tseq = f"{gene}|{seq_meta}"
+            for tf in tfprot.split("::"):
+                tf = tf.split("(")[0]
+                interaction = mitab.new_interaction()
+                interaction[mitab.uidA] = "name:%s" % tf
+                interaction[mitab.uidB] = "uniprotac:%s" % tseq.split(";")[3].split("|")[0]
+                interaction[mitab.taxA] = "taxid:9606('homo sapiens')"
+                interaction[mitab.taxB] = "taxid:9906('homo sapiens')"
+                interaction[mitab.confidence] = "rsat_pvalue:%.16f" % pval
+                interaction[mitab.annotA] = "start:protein;name;%s" % tf
+                interaction[mitab.annotB] = f'end:{tseq.split(":")[1].split("|")[0]}'
+                interaction[mitab.annotInter] = f'origin:snp;dbsnp;{tseq.split("|")[1].split(":")[1]}'
+                inner_structure[idx] = interaction
+                idx += 1
     mitab.build_network_frame(inner_structure=inner_structure)
     mitab.serialise_mitab(out_path, add_header=False)
 
@@ -1,7 +1,15 @@
 import argparse
+import itertools
 import sys
 import os
-import re
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+
+import pandas as pd
+
+from common_libs.id_mapping import uniprot_format
+
+# number of lines formatted at once
+chunk_size = 100000
 
 
 def parse_args(args):
@@ -108,71 +116,25 @@ def check_params(input_network_file, lower_case, upper_case):
         sys.exit(2)
 
 
-def id_formatting(dictionary, upper_case, no_isoform):
+def format_lines(lines, upper_case, no_isoform):
     """
-    e.g. having the uniprot ID: uniprotac:P2E7D5-54
-    the matching will be:
-
-    Full match	0-19	uniprotac:P2E7D5-54
-    Group 1.	10-19	P2E7D5-54
-    Group 2.	10-16	P2E7D5
-    Group 3.	14-16	D5
-    Group 4.	16-19	-54
+    Formats the uniprot IDs of a chunk of MITAB lines. Only the columns which can contain uniprot IDs are
+    formatted (vectorised, see uniprot_format.format_interactor), the other columns are copied.
     """
-    pattern = "uniprotac\S(([A-Za-z][0-9]([A-Za-z0-9][A-Za-z0-9]){2,4})(-[0-9]{1,2}){0,1})"
-
-    for index in range(1, len(dictionary)):
-
-        uniprot_id = re.findall(pattern, dictionary[index])
-
-        if uniprot_id != []:
-
-            izoform = uniprot_id[0][3]
-            original_id = uniprot_id[0][0]
-            new_id = uniprot_id[0][1]
-            upper_new_id = new_id.upper()
-            upper_original_id = original_id.upper()
-
-            if no_isoform:
-                if upper_case:
-
-                    if index == 1 or index == 2:
-                        dictionary[index] = f'uniprotac:{upper_new_id}'
+    rows = [line.strip().split("\t") for line in lines]
 
-                        if izoform != '':
-                            if dictionary[index + 2] != '-':
-                                dictionary[index + 2] = f'{dictionary[index + 2]}|uniprotac:{upper_original_id}'
-                            else:
-                                dictionary[index + 2] = f'uniprotac:{upper_original_id}'
+    for columns in zip(uniprot_format.id_columns, uniprot_format.alt_columns, uniprot_format.annotation_columns):
+        # the missing columns of the shorter lines are formatted as missing values, but not written
+        values = [pd.Series([row[column] if len(row) > column else "-" for row in rows], dtype=object)
+                  for column in columns]
+        formatted = uniprot_format.format_interactor(*values, upper_case, no_isoform)
+        for column, formatted_values in zip(columns, formatted):
+            for row, value in zip(rows, formatted_values.tolist()):
+                if len(row) > column:
+                    row[column] = value
 
-                    elif index == 26 or index == 27:
-                        dictionary[index] = f'{dictionary[index].split(";")[0]};{dictionary[index].split(";")[1]}' \
-                            f';{upper_new_id}'
-
-                else:
-                    if index == 1 or index == 2:
-                        dictionary[index] = f'uniprotac:{new_id}'
-
-                        if izoform != '':
-                            if dictionary[index + 2] != '-':
-                                dictionary[index + 2] = f'{dictionary[index + 2]}|uniprotac:{original_id}'
-                            else:
-                                dictionary[index + 2] = f'uniprotac:{original_id}'
-
-                    elif index == 26 or index == 27:
-                        dictionary[index] = f'{dictionary[index].split(";")[0]};{dictionary[index].split(";")[1]}' \
-                            f';{new_id}'
-
-            else:
-                if upper_case:
-                    if index == 1 or index == 2:
-                        dictionary[index] = f'uniprotac:{upper_original_id}'
-
-                    elif index == 26 or index == 27:
-                        dictionary[index] = f'{dictionary[index].split(";")[0]};{dictionary[index].split(";")[1]}' \
-                            f';{upper_original_id}'
-
-    return dictionary
+    # the lines with less than 42 columns are closed with a tab
+    return ["\t".join(row) + ("\n" if len(row) >= 42 else "\t\n") for row in rows]
 
 
 def main():
@@ -190,21 +152,11 @@ def main():
     with open(input_network_file, 'r') as input_network, open(output_file, "w") as output_network:
 
         print(f'====== Write results to file: {output_file} ======')
-        for line in input_network:
-            line = line.strip().split("\t")
-            dictionary = {}
-
-            for index in range(0, len(line)):
-                dictionary[index + 1] = line[index]
-
-            formatted_dictionary = id_formatting(dictionary, upper_case, no_isoform)
-
-            for keys, value in formatted_dictionary.items():
-                if keys == 42:
-                    output_network.write(value)
-                else:
-                    output_network.write(value + '\t')
-            output_network.write('\n')
+        while True:
+            lines = list(itertools.islice(input_network, chunk_size))
+            if not lines:
+                break
+            output_network.writelines(format_lines(lines, upper_case, no_isoform))
 
     print(f'====== Uniprot ID Formatter succesfully finished ======')
 
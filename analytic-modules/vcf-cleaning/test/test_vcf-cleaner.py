@@ -15,7 +15,7 @@ example_files_list = ["example_files/test.vcf",
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_input_vcf_file_exists(args, tmpdir):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = ['file', False, False, example_files_list[3], False, tmpdir]
+        args.return_value = ['file', False, False, example_files_list[3], False, tmpdir, None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -26,7 +26,7 @@ def test_input_vcf_file_exists(args, tmpdir):
 def test_input_vcf_file_is_not_a_vcf_file(args, tmpdir):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
         txt_file = "example_files/new.txt"
-        args.return_value = [txt_file, False, False, example_files_list[3], False, tmpdir]
+        args.return_value = [txt_file, False, False, example_files_list[3], False, tmpdir, None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -36,7 +36,7 @@ def test_input_vcf_file_is_not_a_vcf_file(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_input_folder_exists(args, tmpdir):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [False, 'input_folder', False, example_files_list[3], False, tmpdir]
+        args.return_value = [False, 'input_folder', False, example_files_list[3], False, tmpdir, None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -46,7 +46,7 @@ def test_input_folder_exists(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_input_snp_list_exists(args, tmpdir):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [False, False, 'snp_list.txt', False, example_files_list[4], tmpdir]
+        args.return_value = [False, False, 'snp_list.txt', False, example_files_list[4], tmpdir, None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -56,7 +56,7 @@ def test_input_snp_list_exists(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_reference_genome_file_exists(args, tmpdir):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [example_files_list[0], False, False, 'reference.bed', False, tmpdir]
+        args.return_value = [example_files_list[0], False, False, 'reference.bed', False, tmpdir, None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -66,7 +66,7 @@ def test_reference_genome_file_exists(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_reference_vcf_file_exists(args, tmpdir):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [False, False, example_files_list[2], False, 'reference.vcf', tmpdir]
+        args.return_value = [False, False, example_files_list[2], False, 'reference.vcf', tmpdir, None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -76,7 +76,7 @@ def test_reference_vcf_file_exists(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_output_folder_exists(args):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [example_files_list[0], False, False, example_files_list[3], False, 'output']
+        args.return_value = [example_files_list[0], False, False, example_files_list[3], False, 'output', None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -86,7 +86,7 @@ def test_output_folder_exists(args):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_if_input_vcf_file_and_input_folder_at_the_same_time(args, tmpdir):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [example_files_list[0], example_files_list[1], False, example_files_list[3], False, tmpdir]
+        args.return_value = [example_files_list[0], example_files_list[1], False, example_files_list[3], False, tmpdir, None]
         vcf_cleaner.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -96,7 +96,7 @@ def test_if_input_vcf_file_and_input_folder_at_the_same_time(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_case_one(args, tmpdir):
     output_folder = tmpdir.mkdir('output')
-    args.return_value = [example_files_list[0], False, False, example_files_list[3], False, output_folder]
+    args.return_value = [example_files_list[0], False, False, example_files_list[3], False, output_folder, None]
     vcf_cleaner.main()
 
     print(example_files_list[0])
@@ -114,7 +114,7 @@ def test_case_one(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_case_two(args, tmpdir):
     output_folder = tmpdir.mkdir('output')
-    args.return_value = [False, example_files_list[1], False, example_files_list[3], False, output_folder]
+    args.return_value = [False, example_files_list[1], False, example_files_list[3], False, output_folder, None]
     vcf_cleaner.main()
 
     assert len([name for name in os.listdir(output_folder)]) == 2
@@ -128,7 +128,7 @@ def test_case_two(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_case_three(args, tmpdir):
     output_folder = tmpdir.mkdir('output')
-    args.return_value = [example_files_list[0], False, False, example_files_list[3], False, output_folder]
+    args.return_value = [example_files_list[0], False, False, example_files_list[3], False, output_folder, None]
     vcf_cleaner.main()
 
     for filename in os.listdir(output_folder):
@@ -148,7 +148,7 @@ def test_case_three(args, tmpdir):
 @mock.patch.object(vcf_cleaner, 'parse_args')
 def test_case_four(args, tmpdir):
     output_folder = tmpdir.mkdir('output')
-    args.return_value = [False, False, example_files_list[2], False, example_files_list[4], output_folder]
+    args.return_value = [False, False, example_files_list[2], False, example_files_list[4], output_folder, None]
     vcf_cleaner.main()
 
     assert len([name for name in os.listdir(output_folder)]) == 1
@@ -158,3 +158,20 @@ def test_case_four(args, tmpdir):
         num_lines = sum(1 for line in open(file))
         assert num_lines == 3
 
+
+
+def test_snp_list_output_in_reference_order(tmpdir):
+    reference = tmpdir.join("reference.vcf")
+    reference.write("##fileformat=VCFv4.0\n"
+                    "1\t100\trs3\tA\tG\t.\t.\t.\n"
+                    "1\t200\trs1\tC\tT\t.\t.\t.\n"
+                    "1\t300\trs2\tG\tA\t.\t.\t.\n"
+                    "2\t50\trs3\tA\tC\t.\t.\t.\n")
+    snp_list = tmpdir.join("snps.txt")
+    output_folder = tmpdir.mkdir('output')
+    vcf_cleaner.collect_snp_information_and_write_to_output(str(snp_list), [str(reference)], ["rs1", "rs3", "rs1"],
+                                                            str(output_folder))
+
+    with open(os.path.join(str(output_folder), "snps.vcf")) as output:
+        records = [line.split("\t")[:3] for line in output if line[:1] != "#"]
+    assert records == [["chr1", "100", "rs3"], ["chr1", "200", "rs1"], ["chr2", "50", "rs3"]]
@@ -1,6 +1,12 @@
 import argparse
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.file_handler import file_handler
+from common_libs.filters import snp_index
+
+vcf_suffixes = (".vcf", ".vcf.gz", ".vcf.bgz")
 
 
 def parse_args(args):
@@ -11,6 +17,8 @@ def parse_args(args):
         **Description:** 
 
         This script will take a single input .vcf file or an input folder, that contains one or more .vcf files.
+        The input and reference .vcf files can be gzip or bgzip compressed (.vcf.gz, .vcf.bgz), the output is
+        always uncompressed.
         Then it will replace the locations of the SNP's in the .vcf file(s) to a new one according to the reference genom
         file(s). In that case you have to use just the --input-file OR just the --input-folder parameter as input and the
         --reference-genome-file parameter as reference.
@@ -41,6 +49,8 @@ def parse_args(args):
         
         -o, --output-folder <path>                : path to an output folder that contain the changed VCF files [Mandatory]
         
+        -if, --index-folder <path>                : path to the folder of the compiled reference index [Optional]
+        
         
         **Exit codes**
         
@@ -103,9 +113,16 @@ def parse_args(args):
                         action="store",
                         required=True)
 
+    # Folder of the reference index
+    parser.add_argument("-if", "--index-folder",
+                        help="<path to the folder of the compiled reference index> [optional]",
+                        dest="index_folder",
+                        action="store",
+                        required=False)
+
     results = parser.parse_args(args)
     return results.input_file, results.input_folder, results.input_snp_list, results.reference_genome_files,\
-           results.reference_vcf_files, results.output_folder
+           results.reference_vcf_files, results.output_folder, results.index_folder
 
 
 def check_params(input_file, input_folder, input_snp_list, reference_genome_paths, reference_vcf_paths, output_folder):
@@ -114,7 +131,7 @@ def check_params(input_file, input_folder, input_snp_list, reference_genome_path
             sys.stderr.write(f'ERROR! the input .vcf file does not exists: {input_file}')
             sys.exit(1)
 
-        if not input_file.endswith(".vcf"):
+        if not input_file.endswith(vcf_suffixes):
             sys.stderr.write(f'ERROR! the input .vcf file is not a .vcf file: {input_file}')
             sys.exit(2)
 
@@ -147,11 +164,12 @@ def check_params(input_file, input_folder, input_snp_list, reference_genome_path
         sys.exit(7)
 
 
-def parse_vcf(input_file):
+def parse_vcf(input_file, snp_dictionary=None):
 
-    snp_dictionary = {}
+    if snp_dictionary is None:
+        snp_dictionary = {}
 
-    with open(input_file, "r") as input_vcf:
+    with file_handler.open_file(input_file) as input_vcf:
         for line in input_vcf:
             line = line.strip()
             if line[:1] != "#":
@@ -173,48 +191,53 @@ def parse_snp_list(input_snp_list):
     return snp_array
 
 
-def collect_snp_locations(reference_files_paths, snp_dictionary):
+def reference_files(reference_files_paths):
+    """ The reference files with a file extension (e.g. .bed, .vcf, .vcf.gz), the rest of the paths are ignored """
+    return [reference_file for reference_file in reference_files_paths
+            if reference_file.endswith(vcf_suffixes) or reference_file.endswith((".gz", ".bgz"))
+            or reference_file[-4:-3] == "."]
 
-    for reference_file in reference_files_paths:
-        if reference_file[-4:-3] == ".":
-            print(f'====== Collect new SNP locations from reference file: {reference_file} ======')
-            with open(reference_file, "r") as reference:
-                for row in reference:
-                    if row[:1] != "#":
-                        row = row.strip().split("\t")
-                        snp_id = row[3]
-                        location = row[2]
-                        if snp_id in snp_dictionary:
-                            snp_dictionary[snp_id] = location
+
+def collect_snp_locations(reference_files_paths, snp_dictionary, index_folder=None):
+
+    reference_files_paths = reference_files(reference_files_paths)
+    if not reference_files_paths:
+        return snp_dictionary
+
+    print(f'====== Collect new SNP locations from reference files: {", ".join(reference_files_paths)} ======')
+    reference_index = snp_index.load_snp_index(reference_files_paths, reference_format="bed", index_folder=index_folder)
+    for snp_id in snp_dictionary:
+        record = reference_index.lookup(snp_id)
+        if record is not None:
+            snp_dictionary[snp_id] = record[1]
 
     return snp_dictionary
 
 
-def collect_snp_information_and_write_to_output(input_snp_list, reference_files_paths, snp_array, output_folder):
+def collect_snp_information_and_write_to_output(input_snp_list, reference_files_paths, snp_array, output_folder,
+                                                index_folder=None):
 
     new_filename = f'{input_snp_list.split("/")[-1:][0].split(".")[0]}.vcf'
     output_file = os.path.join(output_folder, new_filename)
 
-    for reference_file in reference_files_paths:
-        if reference_file[-4:-3] == ".":
-            print(f'====== Collect new SNP informations from reference file: {reference_file} ======')
-            with open(reference_file, "r") as reference, open(output_file, "a") as output:
-                output.write("##fileformat=VCF" + '\n')
-                for row in reference:
-                    if row[:1] != "#":
-                        row = row.strip().split("\t")
-                        snp_id = row[2]
-                        if snp_id in snp_array:
-                            chromosome = f'chr{row[0]}'
-                            location = row[1]
-                            ref = row[3]
-                            alt = row[4]
-                            mutant = f'1/1'
-                            print(f'======= Write {snp_id} SNP information to output file ======')
-                            output.write(chromosome + '\t' + location + '\t' + snp_id + '\t' + ref + '\t' + alt + '\t'
-                                         + "." + '\t' + "." + '\t' + "." + '\t' + "." + '\t' + mutant + '\n')
-
-            output.close()
+    reference_files_paths = reference_files(reference_files_paths)
+    if not reference_files_paths:
+        return
+
+    print(f'====== Collect new SNP informations from reference files: {", ".join(reference_files_paths)} ======')
+    reference_index = snp_index.load_snp_index(reference_files_paths, reference_format="vcf", index_folder=index_folder)
+    # every reference record of the SNPs, in the order of the reference files (sorted by position)
+    records = sorted((record_number, snp_id, record) for snp_id in set(snp_array)
+                     for record_number, record in reference_index.lookup_all(snp_id))
+    with open(output_file, "a") as output:
+        output.write("##fileformat=VCF" + '\n')
+        for _, snp_id, record in records:
+            chromosome = f'chr{record[0]}'
+            location, ref, alt = record[1:]
+            mutant = f'1/1'
+            print(f'======= Write {snp_id} SNP information to output file ======')
+            output.write(chromosome + '\t' + location + '\t' + snp_id + '\t' + ref + '\t' + alt + '\t'
+                         + "." + '\t' + "." + '\t' + "." + '\t' + "." + '\t' + mutant + '\n')
 
 
 def snp_dictionary_cleaning(snp_dictionary_with_locations):
@@ -230,28 +253,37 @@ def snp_dictionary_cleaning(snp_dictionary_with_locations):
 
 def data_cleaning(input_file, output_folder, snp_dictionary_cleaned):
 
-    output_file = os.path.join(output_folder, input_file.split("/")[-1:][0])
+    output_file = os.path.join(output_folder, _output_name(input_file))
 
-    with open(input_file, "r") as input_vcf, open(output_file, "w") as output:
+    with file_handler.open_file(input_file) as input_vcf, open(output_file, "w") as output:
         print(f"====== Replacing old SNP identifiers with new ones in {input_file} ======")
         for line in input_vcf:
             line = line.strip()
             if line[:1] == "#":
                 output.write(line + '\n')
             else:
-                snp_id = line.split("\t")[2]
-                snp_location = line.split("\t")[1]
+                # only the POS field is rewritten, the rest of the record is copied as it is
+                chromosome, _, rest = line.split("\t", 2)
+                snp_id = rest.split("\t", 1)[0]
                 if snp_id in snp_dictionary_cleaned:
-                    new_line = line.replace(snp_location, snp_dictionary_cleaned[snp_id])
-                    output.write(new_line + '\n')
+                    output.write(chromosome + '\t' + snp_dictionary_cleaned[snp_id] + '\t' + rest + '\n')
+
 
+def _output_name(input_file):
+    """ Name of the (uncompressed) output file of an input .vcf file, e.g. patient_1.vcf for patient_1.vcf.gz """
+    filename = input_file.split("/")[-1:][0]
+    for suffix in vcf_suffixes[1:]:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)] + ".vcf"
+    return filename
 
-def input_file_given(input_file, reference_files_paths, output_folder):
+
+def input_file_given(input_file, reference_files_paths, output_folder, index_folder=None):
 
     print(f'====== Collect SNP identifiers from the input vcf ======')
     snp_dictionary = parse_vcf(input_file)
 
-    snp_dictionary_with_locations = collect_snp_locations(reference_files_paths, snp_dictionary)
+    snp_dictionary_with_locations = collect_snp_locations(reference_files_paths, snp_dictionary, index_folder)
 
     print(f"====== Remove SNP's that not have locations")
     snp_dictionary_cleaned = snp_dictionary_cleaning(snp_dictionary_with_locations)
@@ -259,35 +291,58 @@ def input_file_given(input_file, reference_files_paths, output_folder):
     data_cleaning(input_file, output_folder, snp_dictionary_cleaned)
 
 
-def input_folder_given(input_folder, reference_files_paths, output_folder):
+def input_folder_given(input_folder, reference_files_paths, output_folder, index_folder=None):
 
-    reference_vcf_file = next(os.path.join(input_folder, f) for f in os.listdir(input_folder) if f.endswith(".vcf"))
+    input_files = sorted(os.path.join(input_folder, f) for f in os.listdir(input_folder) if f.endswith(vcf_suffixes))
 
-    print(f'====== Collect SNP identifiers from the input vcf ======')
-    snp_dictionary = parse_vcf(reference_vcf_file)
+    print(f'====== Collect SNP identifiers from the input vcf files ======')
+    snp_dictionary = {}
+    for input_file in input_files:
+        parse_vcf(input_file, snp_dictionary)
 
-    snp_dictionary_with_locations = collect_snp_locations(reference_files_paths, snp_dictionary)
+    snp_dictionary_with_locations = collect_snp_locations(reference_files_paths, snp_dictionary, index_folder)
 
     print(f"====== Remove SNP's that not have locations")
     snp_dictionary_cleaned = snp_dictionary_cleaning(snp_dictionary_with_locations)
 
-    for file in os.listdir(input_folder):
-        filename = os.path.join(input_folder, file)
-        if filename.endswith(".vcf"):
-            data_cleaning(filename, output_folder, snp_dictionary_cleaned)
+    workers = min(len(input_files), os.cpu_count() or 1)
+    if workers <= 1:
+        for input_file in input_files:
+            data_cleaning(input_file, output_folder, snp_dictionary_cleaned)
+        return
+
+    # the lookup is sent once to each worker process, not with every file
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(output_folder, snp_dictionary_cleaned)) as executor:
+        for _ in executor.map(_clean_file, input_files):
+            pass
+
+
+_worker_args = None
+
+
+def _init_worker(output_folder, snp_dictionary_cleaned):
+    global _worker_args
+    _worker_args = (output_folder, snp_dictionary_cleaned)
+
+
+def _clean_file(input_file):
+    data_cleaning(input_file, *_worker_args)
 
 
-def input_snp_list_given(input_snp_list, reference_files_paths, output_folder):
+def input_snp_list_given(input_snp_list, reference_files_paths, output_folder, index_folder=None):
 
     print(f'====== Collect SNP identifiers from the input SNP list file ======')
     snp_array = parse_snp_list(input_snp_list)
 
-    collect_snp_information_and_write_to_output(input_snp_list, reference_files_paths, snp_array, output_folder)
+    collect_snp_information_and_write_to_output(input_snp_list, reference_files_paths, snp_array, output_folder,
+                                                index_folder)
 
 
 def main():
 
-    input_file, input_folder, input_snp_list, reference_genome_files, reference_vcf_files, output_folder = parse_args(sys.argv[1:])
+    input_file, input_folder, input_snp_list, reference_genome_files, reference_vcf_files, output_folder, \
+        index_folder = parse_args(sys.argv[1:])
 
     if input_file and input_folder:
         sys.stderr.write(f'ERROR MESSAGE: you have to give a single vcf input file or an input folder, '
@@ -302,10 +357,10 @@ def main():
         print(f'====== Parameters are fine, starting... ======')
 
         if input_file:
-            input_file_given(input_file, reference_genome_paths, output_folder)
+            input_file_given(input_file, reference_genome_paths, output_folder, index_folder)
 
         if input_folder:
-            input_folder_given(input_folder, reference_genome_paths, output_folder)
+            input_folder_given(input_folder, reference_genome_paths, output_folder, index_folder)
 
     if reference_vcf_files:
         reference_vcf_paths = reference_vcf_files.split(",")
@@ -315,7 +370,7 @@ def main():
         print(f'====== Parameters are fine, starting... ======')
 
         if input_snp_list:
-            input_snp_list_given(input_snp_list, reference_vcf_paths, output_folder)
+            input_snp_list_given(input_snp_list, reference_vcf_paths, output_folder, index_folder)
 
     print(f'====== VCF Cleaner finished succesfully ======')
 
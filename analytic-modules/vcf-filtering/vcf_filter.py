@@ -23,6 +23,13 @@ def check_args(args=None):
             gene promoter regions - (BED file format)
         -s, --snp : this is a NavigOmix entity set file, that contains the set of SNP IDs for filtering
         -o, --output : containing just filtered mutations - (VCF/BED file format)
+        --snp-panel-cache : folder of the compiled SNP panels (default: a folder in the temporary folder)
+        --no-collapse : write a separate record for each annotation overlapping a SNP (by default a single
+            record is written for each SNP, listing all the overlapping annotations separated by ',')
+
+        More annotation files can be given as a comma separated list, with a comma separated list of the
+        same number of outputs. In this case the input VCF is read only once: the records are filtered by
+        the SNP list (if given) and routed to the output of each annotation file they overlap.
         """
 
     # New argument Parser
@@ -38,7 +45,8 @@ def check_args(args=None):
     # Output file path
     parser.add_argument("-a", "--annotation",
                         help="<this is a .bed file, that contains the appropriate annotations: miRNA coding "
-                             "regions and gene promoter regions - (BED file format)> [mandatory]",
+                             "regions and gene promoter regions - (BED file format), or a comma separated list "
+                             "of .bed files> [mandatory]",
                         dest="annotation",
                         action="store",
                         default=None)
@@ -53,45 +61,71 @@ def check_args(args=None):
 
     # Exit code
     parser.add_argument("-o", "--output",
-                        help="<containing just filtered mutations - (VCF/BED file format)>",
+                        help="<containing just filtered mutations - (VCF/BED file format), or a comma "
+                             "separated list of outputs (one for each annotation file)>",
                         dest="output",
                         action="store",
                         required=True)
 
+    parser.add_argument("--snp-panel-cache",
+                        help="<folder of the compiled SNP panels, reused for all the patients> "
+                             "[optional, default is a folder in the temporary folder]",
+                        dest="snp_panel_cache",
+                        action="store",
+                        default=None)
+
+    parser.add_argument("--no-collapse",
+                        help="<write a separate record for each annotation overlapping a SNP> [optional]",
+                        dest="collapse",
+                        action="store_false",
+                        default=True)
+
     # Get arguments
     results = parser.parse_args(args)
-    return results.input, results.annotation, results.snp, results.output
+    annotations = results.annotation.split(",") if results.annotation else []
+    if len(results.output.split(",")) != max(len(annotations), 1):
+        parser.error("--output must have the same number of elements as --annotation")
+    return results.input, results.annotation, results.snp, results.output, results.collapse, results.snp_panel_cache
 
 
-def vcf_filter(input_vcf_file, output, annotation=None, snp=None):
+def vcf_filter(input_vcf_file, output, annotation=None, snp=None, collapse_annotations=True, snp_panel_cache=None):
     """
     Filter of SNPs in VCF files based on bed files and/or snp lists.
     """
+    if annotation and "," in annotation:
+        print(input_vcf_file, " : ", annotation, " : ", output)
+        filter_vcf.filter_vcf_multi(input_vcf_file, annotation.split(","), output.split(","), path_to_snp_list=snp,
+                                    collapse_annotations=collapse_annotations, snp_panel_cache=snp_panel_cache)
+        return
     if snp:
         temp_out = output + ".temp"
     else:
         temp_out = output
     if annotation:
         print(input_vcf_file, " : ", annotation, " : ", temp_out)
-        filter_vcf.filter_vcf(input_vcf_file, annotation, temp_out, bed_info=True)
+        filter_vcf.filter_vcf(input_vcf_file, annotation, temp_out, bed_info=True,
+                              collapse_annotations=collapse_annotations)
     else:
         shutil.copyfile(input_vcf_file, temp_out)
     if snp:
-        filter_vcf.filter_vcf_by_id(temp_out, snp, output)
+        filter_vcf.filter_vcf_by_id(temp_out, snp, output, snp_panel_cache=snp_panel_cache)
     if snp:
         os.remove(temp_out)
 
 
 def main(argv):
-    input_file, annotation, snp, output = check_args(argv)
+    input_file, annotation, snp, output, collapse, snp_panel_cache = check_args(argv)
     if os.stat(input_file).st_size == 0:
         print(f'====== The input VCF file is empty! ======')
-        open(output, "a").close()
+        for each_output in output.split(","):
+            open(each_output, "a").close()
     else:
         vcf_filter(input_vcf_file=input_file,
                    output=output,
                    annotation=annotation,
-                   snp=snp)
+                   snp=snp,
+                   collapse_annotations=collapse,
+                   snp_panel_cache=snp_panel_cache)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,7 @@
 import os
 import sys
+import json
+import tarfile
 import mock
 import pytest
 import vcf_iterator
@@ -14,12 +16,14 @@ params_list = [
     "example_files/output/"
 ]
 
+vcf_data = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_files", "vcf_data")
+
 
 @mock.patch.object(vcf_iterator, 'parse_args')
 def test_vcf_files_exists(args):
     """ Exception handling test: no vcf file found """
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = ['file', False, False, params_list[3]]
+        args.return_value = ['file', False, False, params_list[3], None, None, None]
         vcf_iterator.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -30,7 +34,7 @@ def test_vcf_files_exists(args):
 def test_tar_file_exists(args):
     """ Exception handling test: no tar file found """
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [params_list[0], 'no_tar', False, params_list[3]]
+        args.return_value = [params_list[0], 'no_tar', False, params_list[3], None, None, None]
         vcf_iterator.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -41,7 +45,7 @@ def test_tar_file_exists(args):
 def test_plink_file_exists(args):
     """ Exception handling test: no plink file found """
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = [params_list[0], False, 'no_plink', params_list[3]]
+        args.return_value = [params_list[0], False, 'no_plink', params_list[3], None, None, None]
         vcf_iterator.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -52,7 +56,7 @@ def test_plink_file_exists(args):
 def test_no_output_folder(args):
     """ Exception handling test: no output folder found"""
     with pytest.raises(SystemExit) as pytest_wrapped_e:
-        args.return_value = ['file', False, False, 'output']
+        args.return_value = ['file', False, False, 'output', None, None, None]
         vcf_iterator.main()
 
     assert pytest_wrapped_e.type == SystemExit
@@ -63,7 +67,7 @@ def test_no_output_folder(args):
 def test_component_vcf_iterator(args, tmpdir):
     """ Exception handling test: component test for just vcf files """
     output_folder = tmpdir.mkdir('output_test')
-    args.return_value = [params_list[0], False, False, output_folder]
+    args.return_value = [params_list[0], False, False, output_folder, None, None, None]
     vcf_iterator.main()
 
     assert len([name for name in os.listdir(output_folder)]) == 3
@@ -87,3 +91,106 @@ def test_plink_output_vcf_files_exists(tmpdir):
 
         assert file.endswith(".vcf")
 
+
+def test_input_paths_iteration_names(tmpdir):
+    output_folder = tmpdir.mkdir('output_test')
+    input_paths = ",".join(os.path.join(vcf_data, name) for name in ["margaret.vcf", "norman.vcf", "bucky.vcf"])
+    next_index = vcf_iterator.input_paths_iteration(input_paths, str(output_folder), index_input=2)
+
+    assert next_index == 5
+    assert sorted(os.listdir(output_folder)) == ["iteration-2", "iteration-3", "iteration-4"]
+    with open(os.path.join(output_folder, "iteration-4")) as staged, open(os.path.join(vcf_data, "bucky.vcf")) as source:
+        assert staged.read() == source.read()
+
+
+def test_targz_file_iteration_order(tmpdir):
+    archive = str(tmpdir.join("patients.tar.gz"))
+    with tarfile.open(archive, "w:gz") as tar:
+        tar.add(os.path.join(vcf_data, "norman.vcf"), arcname="patients/norman.vcf")
+        tar.add(os.path.join(vcf_data, "bucky.vcf"), arcname="patients/bucky.vcf")
+    output_folder = tmpdir.mkdir('output_test')
+    next_index = vcf_iterator.targz_file_iteration(archive, str(output_folder), index_targz=4)
+
+    assert next_index == 6
+    assert sorted(os.listdir(output_folder)) == ["iteration-4", "iteration-5"]
+    with open(os.path.join(output_folder, "iteration-4")) as staged, open(os.path.join(vcf_data, "norman.vcf")) as source:
+        assert staged.read() == source.read()
+
+
+def test_plink_extraction_genotypes(tmpdir):
+    plink_files = tmpdir.mkdir("plink")
+    plink_folder = str(plink_files)
+    with open(os.path.join(plink_folder, "data.bim"), "w") as bim:
+        bim.write("1\trs1\t0\t100\tA\tG\n23\trs2\t0\t200\t0\tT\n")
+    with open(os.path.join(plink_folder, "data.fam"), "w") as fam:
+        fam.write("F1 I1 0 0 1 -9\nF2 I2 0 0 1 -9\nF3 I3 0 0 1 -9\n")
+    with open(os.path.join(plink_folder, "data.bed"), "wb") as bed:
+        # variant 1: hom A1, het, hom A2; variant 2: missing, hom A2, hom A1
+        bed.write(bytes([0x6c, 0x1b, 0x01, 0b00111000, 0b00001101]))
+    output_folder = tmpdir.mkdir('output_test')
+    paths = ",".join(os.path.join(plink_folder, name) for name in ["data.fam", "data.bed", "data.bim"])
+
+    next_index = vcf_iterator.plink_extraction(paths, str(output_folder), index_plink=3)
+
+    assert next_index == 6
+    assert sorted(os.listdir(output_folder)) == ["iteration-3.vcf", "iteration-4.vcf", "iteration-5.vcf"]
+    with open(os.path.join(output_folder, "iteration-4.vcf")) as vcf:
+        lines = vcf.read().splitlines()
+    assert lines[-3].endswith("\tFORMAT\tF2_I2")
+    assert lines[-2:] == ["1\t100\trs1\tG\tA\t.\t.\tPR\tGT\t0/1",
+                          "X\t200\trs2\tT\t.\t.\t.\tPR\tGT\t0/0"]
+
+
+def test_shard_iterations(tmpdir):
+    output_folder = tmpdir.mkdir('output_test')
+    input_paths = ",".join(os.path.join(vcf_data, name) for name in ["margaret.vcf", "norman.vcf", "bucky.vcf"])
+    next_index = vcf_iterator.input_paths_iteration(input_paths, str(output_folder))
+    manifest_file = str(tmpdir.join("manifest.json"))
+
+    shard_names = vcf_iterator.shard_iterations(str(output_folder), next_index - 1, chunks=2,
+                                                manifest_file=manifest_file)
+
+    assert shard_names == ["iteration-1", "iteration-2"]
+    assert sorted(os.listdir(output_folder)) == ["iteration-1", "iteration-2"]
+    assert sorted(os.listdir(os.path.join(output_folder, "iteration-1"))) == ["iteration-1", "iteration-2"]
+    assert os.listdir(os.path.join(output_folder, "iteration-2")) == ["iteration-3"]
+    with open(manifest_file) as manifest:
+        assert json.load(manifest)["shards"][1] == {"name": "iteration-2", "first_item": 3, "last_item": 3}
+
+
+def test_input_paths_iteration_twice(tmpdir):
+    sources = tmpdir.mkdir("sources")
+    contents = {}
+    for name in ["margaret.vcf", "norman.vcf"]:
+        with open(os.path.join(vcf_data, name)) as source:
+            contents[name] = source.read()
+        sources.join(name).write(contents[name])
+    input_paths = ",".join(str(sources.join(name)) for name in contents)
+    output_folder = tmpdir.mkdir('output_test')
+
+    vcf_iterator.input_paths_iteration(input_paths, str(output_folder))
+    vcf_iterator.input_paths_iteration(input_paths, str(output_folder))
+
+    assert sorted(os.listdir(output_folder)) == ["iteration-1", "iteration-2"]
+    for index, name in enumerate(contents, start=1):
+        assert sources.join(name).read() == contents[name]
+        assert output_folder.join(f"iteration-{index}").read() == contents[name]
+
+
+def test_targz_file_iteration_after_input_paths(tmpdir):
+    sources = tmpdir.mkdir("sources")
+    with open(os.path.join(vcf_data, "margaret.vcf")) as source:
+        content = source.read()
+    sources.join("a.vcf").write(content)
+    archive = str(tmpdir.join("patients.tar.gz"))
+    with tarfile.open(archive, "w:gz") as tar:
+        tar.add(os.path.join(vcf_data, "bucky.vcf"), arcname="patients/bucky.vcf")
+    output_folder = tmpdir.mkdir('output_test')
+
+    vcf_iterator.input_paths_iteration(str(sources.join("a.vcf")), str(output_folder))
+    vcf_iterator.targz_file_iteration(archive, str(output_folder))
+
+    assert sources.join("a.vcf").read() == content
+    assert os.listdir(output_folder) == ["iteration-1"]
+    with open(os.path.join(vcf_data, "bucky.vcf")) as source:
+        assert output_folder.join("iteration-1").read() == source.read()
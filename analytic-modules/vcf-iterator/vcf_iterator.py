@@ -1,9 +1,19 @@
 import argparse
+import contextlib
+import fcntl
 import os
 import shutil
-import subprocess
 import sys
 import tarfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.file_handler import plink_reader, shard_manifest
+
+# ioctl request of the copy-on-write file clone (reflink) on Linux
+FICLONE = 0x40049409
 
 
 def parse_args(args):
@@ -30,6 +40,21 @@ def parse_args(args):
         At least one of the input parameters must be specified. If multiple input parameters
         are used, then the tool will first iterate over the vcf file paths given by the user,
         then processes the archive file and finally takes the plink files.
+
+        The VCF files are not copied: they are hard linked into the output folder (or reflinked, if
+        the output folder is on another file system supporting it), so the outputs share the data of
+        the inputs (so the outputs must not be modified in place, only replaced). Existing outputs are
+        replaced, never overwritten. The files of the archive are streamed into their output files (also replaced).
+
+        The plink files are read by a built-in reader (plink2 is not needed): the genotypes are read
+        once from the memory-mapped .bed file, and the VCF files of the individuals (named
+        `iteration-N.vcf`, in the order of the .fam file) are written by parallel processes, each
+        handling a group of individuals. A2 is used as the reference allele, like in `plink2 --recode vcf`.
+
+        With --chunk-size or --chunks, the VCF files are grouped into balanced shards of consecutive
+        files (their sizes differ by at most one file): the output folders `iteration-1`, `iteration-2`, ...
+        each containing the VCF files of one iteration (with the names they would have without sharding).
+        The shards can be described in a manifest file (JSON), which is understood by the collectors.
         
         
         **Parameters:**
@@ -41,6 +66,12 @@ def parse_args(args):
         --input-plink-files <comma separeted list to plink file paths> [optional]
         
         --output-folder [mandatory]
+
+        --chunk-size <maximum number of VCF files in an iteration> [optional]
+
+        --chunks <number of iterations> [optional]
+
+        --manifest <path to the output manifest file, outside of the output folder> [optional]
         
         
         **Exit codes**
@@ -51,8 +82,8 @@ def parse_args(args):
         Exit code 4: The specified output folder doesn't exists!
         Exit code 5: It's not a .vcf file!
         Exit code 6: It's not a tar.gz file!
-        Exit code 7: The plink found an error during individual extraction!
-        Exit code 8: The plink found an error during making vcf files!
+        Exit code 7: The plink files are not valid (not a variant-major .bed file, or the .bed, .bim and .fam files do not match)!
+        Exit code 8: Invalid chunk size or number of chunks (not positive, or both are given)!
         """
 
     parser = argparse.ArgumentParser(description=help_text)
@@ -87,8 +118,29 @@ def parse_args(args):
                         action="store",
                         required=True)
 
+    # Maximum number of VCF files in a shard
+    parser.add_argument("-k", "--chunk-size",
+                        help="<maximum number of VCF files in an iteration> [optional]",
+                        type=int,
+                        dest="chunk_size",
+                        action="store")
+
+    # Number of shards
+    parser.add_argument("-n", "--chunks",
+                        help="<number of iterations> [optional]",
+                        type=int,
+                        dest="chunks",
+                        action="store")
+
+    # Manifest of the shards
+    parser.add_argument("-m", "--manifest",
+                        help="<path to the output manifest file> [optional]",
+                        dest="manifest",
+                        action="store")
+
     results = parser.parse_args(args)
-    return results.input_files, results.targz_file, results.plink_files, results.output_folder
+    return (results.input_files, results.targz_file, results.plink_files, results.output_folder,
+            results.chunk_size, results.chunks, results.manifest)
 
 
 def check_input_paths(input_paths):
@@ -121,174 +173,221 @@ def check_output_folder(output_folder):
         sys.exit(4)  # Exit code 4: The specified output folder doesn't exists!
 
 
-def input_paths_iteration(input_paths, output_folder):
+def check_chunks(chunk_size, chunks):
+    if (chunk_size is not None and chunks is not None) or (chunk_size is not None and chunk_size < 1) or \
+            (chunks is not None and chunks < 1):
+        sys.stderr.write(f"ERROR! Invalid chunk size or number of chunks: {chunk_size}, {chunks}")
+        sys.exit(8)  # Exit code 8: Invalid chunk size or number of chunks!
+
+
+@contextlib.contextmanager
+def staged_output(target_file):
+    """
+    Yields a temporary path in the folder of target_file. The file written there is moved onto target_file
+    (if no exception is raised), so an existing target_file (e.g. a hard link of an input from a previous
+    run) is replaced and never opened for writing. The temporary file is always removed.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target_file)), prefix=".staging-")
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, target_file)
+    finally:
+        # also left if target_file was already a hard link of the temporary file (the rename does nothing then)
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+
+def stage_file(source_file, target_file):
+    """
+    Puts a copy of source_file to target_file without copying the data if possible: the file is hard linked
+    (if it is on the same file system) or reflinked (copy-on-write clone, on btrfs / xfs), and copied only if
+    neither of these works. An existing target_file is replaced, see staged_output.
+    """
+    with staged_output(target_file) as tmp_path:
+        try:
+            os.link(source_file, tmp_path)
+        except OSError:
+            with open(source_file, "rb") as source, open(tmp_path, "xb") as target:
+                try:
+                    fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                except OSError:
+                    shutil.copyfileobj(source, target, 1 << 20)
+
+
+def input_paths_iteration(input_paths, output_folder, index_input=1):
+    """ Stages the input files as iteration-<index_input>, ... and returns the next free index """
     input_vcf_files = input_paths.split(",")
-    index_input = 1
-
-    for files in input_vcf_files:
-        shutil.copy(files, output_folder)
-
-        for file in os.listdir(output_folder):
-            word = "iteration-"
-            if word in file:
-                continue
-
-            else:
-                old_file = os.path.join(output_folder, file)
-                new_file = os.path.join(output_folder, f"iteration-{index_input}")
-                os.rename(old_file, new_file)
-                index_input = index_input + 1
-
 
-def extract_targz_file(targz_file, output_folder):
-    tar = tarfile.open(targz_file, "r:gz")
+    for file in input_vcf_files:
+        stage_file(file, os.path.join(output_folder, f"iteration-{index_input}"))
+        index_input = index_input + 1
 
-    for members in tar:
-        tar.extract(members, output_folder)
-    tar.close()
+    return index_input
 
 
-def tar_file_iteration(output_folder, index_targz):
-    for dirpath, dirnames, filenames in os.walk(output_folder):
-        for filename in filenames:
-            word = "iteration-"
-            if word in filename:
+def targz_file_iteration(targz_file, output_folder, index_targz=1):
+    """
+    Streams the files of a tar.gz archive (in the order of the archive) to iteration-<index_targz>, ... and
+    returns the next free index. Directories and other non regular members are skipped. An existing output is
+    replaced, see staged_output.
+    """
+    with tarfile.open(targz_file, "r|gz") as tar:
+        for member in tar:
+            if not member.isfile():
                 continue
-            else:
-                old_file = os.path.join(dirpath, filename)
-                new_file = os.path.join(output_folder, f"iteration-{index_targz}")
-                os.rename(old_file, new_file)
-                index_targz = index_targz + 1
-
-
-def plink_extraction(plink_file_paths, output_folder, index_plink):
-    in_dataset = plink_file_paths.split(",")[0].split("/")[-1][:-4]
-    plink_files = plink_file_paths.split(",")
-
-    shutil.copy(plink_files[0], output_folder)
-    shutil.copy(plink_files[1], output_folder)
-    shutil.copy(plink_files[2], output_folder)
-
-    fam_format = f"{in_dataset}.fam"
-    file = os.path.join(output_folder, fam_format)
-
-    with open(file, 'r') as fam_file:
-
-        for line in fam_file:
-            line = line.strip()
-            cells = line.split()
-            id = cells[0]
-
-            tmp_file = os.path.join(output_folder, "tmp.keep")
-            with open(tmp_file, "w") as tmp_keep:
-                tmp_keep.write("%s %s\n" % (id, id))
-
-            plinkCMD = ["plink2", "--bfile", in_dataset, "--keep", "tmp.keep", "--make-bed", "--out", id]
-
-            proc = subprocess.Popen(plinkCMD, cwd=output_folder)
-            return_code = proc.wait()
-
-            if proc.returncode == 0:
-                print("====== analytical tool executed successfully! ======")
-
-            else:
-                sys.stderr.write(f"ERROR! Plink exited with error code: {return_code}")
-                sys.exit(7)  # Exit code 7: The plink found an error during individual extraction!
-
-            iteration = os.path.join(f"iteration-{index_plink}")
-
-            plinkProc = ["plink2", "--bfile", id, "--recode", "vcf", "--out", iteration]
-
-            proc2 = subprocess.Popen(plinkProc, cwd=output_folder)
-            return_code = proc2.wait()
-
-            if proc.returncode == 0:
-                print("====== analytical tool executed successfully! ======")
-
-            else:
-                sys.stderr.write(f"ERROR! Plink exited with error code: {return_code}")
-                sys.exit(8)  # Exit code 8: The plink found an error during making vcf files!
-
-            index_plink = index_plink + 1
-
-    for files in os.listdir(output_folder):
-        filenames = os.path.join(output_folder, files)
-
-        if filenames.endswith(".bed"):
-            os.remove(filenames)
-        elif filenames.endswith(".fam"):
-            os.remove(filenames)
-        elif filenames.endswith(".bim"):
-            os.remove(filenames)
-        elif filenames.endswith(".log"):
-            os.remove(filenames)
-        elif filenames.endswith(".keep"):
-            os.remove(filenames)
-        else:
-            continue
+            with staged_output(os.path.join(output_folder, f"iteration-{index_targz}")) as tmp_path:
+                with tar.extractfile(member) as source, open(tmp_path, "xb") as target:
+                    shutil.copyfileobj(source, target, 1 << 20)
+            index_targz = index_targz + 1
+
+    return index_targz
+
+
+def plink_extraction(plink_file_paths, output_folder, index_plink=1):
+    """
+    Writes a VCF file for each individual of the plink files (in the order of the .fam file) as
+    iteration-<index_plink>.vcf, ... and returns the next free index.
+
+    The genotypes are read from the memory-mapped .bed file (see common_libs.file_handler.plink_reader), so
+    the dataset is read only once, and the individuals are split into groups written by parallel processes.
+    The output is the same as 'plink2 --recode vcf' would write for each individual (A2 is the reference
+    allele).
+    """
+    try:
+        bed_path, bim_path, fam_path = plink_reader.find_plink_files(plink_file_paths.split(","))
+        samples = plink_reader.read_fam(fam_path)
+        with open(bim_path) as bim:
+            n_variants = sum(1 for line in bim if line.strip())
+        plink_reader.PlinkBed(bed_path, len(samples), n_variants)
+    except plink_reader.InvalidPlinkFile as error:
+        sys.stderr.write(f"ERROR! {error}")
+        sys.exit(7)  # Exit code 7: The plink files are not valid!
+
+    sample_names = [f"{family_id}_{individual_id}" for family_id, individual_id in samples]
+    initargs = (bed_path, bim_path, sample_names, output_folder)
+    sample_ranges = [(start, min(start + samples_per_process, len(samples)), index_plink + start)
+                     for start in range(0, len(samples), samples_per_process)]
+
+    workers = min(len(sample_ranges), os.cpu_count() or 1)
+    if workers <= 1:
+        _init_plink_worker(*initargs)
+        for sample_range in sample_ranges:
+            _write_sample_vcfs(sample_range)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_plink_worker, initargs=initargs) as executor:
+            for _ in executor.map(_write_sample_vcfs, sample_ranges):
+                pass
+
+    print("====== VCF files of the plink individuals written successfully! ======")
+    return index_plink + len(samples)
+
+
+# number of individuals (open output files) handled by one process at a time
+samples_per_process = 256
+
+# number of variants decoded at a time
+variants_per_block = 4096
+
+_plink_state = None
+
+
+def _init_plink_worker(bed_path, bim_path, sample_names, output_folder):
+    """ Reads the .bim file and opens the .bed file once in each process """
+    global _plink_state
+    variants = plink_reader.read_bim(bim_path)
+    prefixes = [f"{chrom}\t{position}\t{variant_id}\t{a2}\t{a1}\t.\t.\tPR\tGT\t"
+                for chrom, variant_id, position, a1, a2 in variants]
+    header = ["##fileformat=VCFv4.2", "##source=vcf_iterator"]
+    header += [f"##contig=<ID={chrom}>" for chrom in dict.fromkeys(variant[0] for variant in variants)]
+    header += ['##INFO=<ID=PR,Number=0,Type=Flag,Description="Provisional reference allele, may not be based on '
+               'real reference genome">',
+               '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+               "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t"]
+    bed = plink_reader.PlinkBed(bed_path, len(sample_names), len(variants))
+    _plink_state = (bed, prefixes, "\n".join(header), sample_names, output_folder)
+
+
+def _write_sample_vcfs(sample_range):
+    """ Writes the VCF files of the [sample_start, sample_end) individuals in a single pass over the variants """
+    sample_start, sample_end, first_index = sample_range
+    bed, prefixes, header, sample_names, output_folder = _plink_state
+    genotypes = np.array([genotype + "\n" for genotype in plink_reader.VCF_GENOTYPES])
+
+    out_files = [open(os.path.join(output_folder, f"iteration-{first_index + offset}.vcf"), "w", buffering=1 << 16)
+                 for offset in range(sample_end - sample_start)]
+    try:
+        for offset, out_file in enumerate(out_files):
+            out_file.write(header + sample_names[sample_start + offset] + "\n")
+        for variant_start in range(0, bed.n_variants, variants_per_block):
+            variant_end = min(variant_start + variants_per_block, bed.n_variants)
+            block = genotypes[bed.genotype_codes(variant_start, variant_end, sample_start, sample_end)]
+            block_prefixes = prefixes[variant_start:variant_end]
+            for offset, out_file in enumerate(out_files):
+                out_file.write("".join(map(str.__add__, block_prefixes, block[:, offset].tolist())))
+    finally:
+        for out_file in out_files:
+            out_file.close()
+
+
+def shard_iterations(output_folder, n_items, chunk_size=None, chunks=None, manifest_file=None):
+    """
+    Groups the outputs iteration-1, ..., iteration-<n_items> (.vcf) into balanced shards of consecutive
+    items: the folders iteration-1, iteration-2, ... (the files are moved, not copied). Without chunk_size
+    and chunks each output is a shard of its own, and the files are not moved. The manifest of the shards
+    is written to manifest_file, if it is given.
+    """
+    item_names = []
+    for index in range(1, n_items + 1):
+        name = f"iteration-{index}"
+        item_names.append(name if os.path.exists(os.path.join(output_folder, name)) else name + ".vcf")
+
+    if chunk_size is None and chunks is None:
+        ranges = [(index, index) for index in range(1, n_items + 1)]
+        shard_names = item_names
+    else:
+        ranges = shard_manifest.shard_ranges(n_items, chunk_size, chunks)
+        shard_names = [f"iteration-{index}" for index in range(1, len(ranges) + 1)]
+        # the files are moved to temporary folders first, as the shard folders have the names of some files
+        for shard_name, (first_item, last_item) in zip(shard_names, ranges):
+            shard_folder = os.path.join(output_folder, f".{shard_name}.tmp")
+            os.mkdir(shard_folder)
+            for name in item_names[first_item - 1:last_item]:
+                os.rename(os.path.join(output_folder, name), os.path.join(shard_folder, name))
+        for shard_name in shard_names:
+            os.rename(os.path.join(output_folder, f".{shard_name}.tmp"), os.path.join(output_folder, shard_name))
+
+    if manifest_file:
+        shard_manifest.write_manifest(manifest_file, shard_names, ranges)
+    return shard_names
 
 
 def main():
-    input_files, targz_file, plink_files, output_folder = parse_args(sys.argv[1:])
+    input_files, targz_file, plink_files, output_folder, chunk_size, chunks, manifest_file = \
+        parse_args(sys.argv[1:])
 
     check_output_folder(output_folder)
+    check_chunks(chunk_size, chunks)
 
-    if input_files and targz_file and plink_files:
-
-        check_input_paths(input_files)
-        check_targz_file(targz_file)
-        check_plink_files(plink_files)
-        input_paths_iteration(input_files, output_folder)
-        index_targz = len(input_files.split(",")) + 1
-        extract_targz_file(targz_file, output_folder)
-        tar_file_iteration(output_folder, index_targz)
-        index_plink = len([name for name in os.listdir(output_folder) if name.endswith(".vcf")]) + 1
-        plink_extraction(plink_files, output_folder, index_plink)
-
-    elif input_files and targz_file:
-
-        check_input_paths(input_files)
-        check_targz_file(targz_file)
-        input_paths_iteration(input_files, output_folder)
-        index_targz = len(input_files.split(",")) + 1
-        extract_targz_file(targz_file, output_folder)
-        tar_file_iteration(output_folder, index_targz)
-
-    elif input_files and plink_files:
-
+    if input_files:
         check_input_paths(input_files)
-        check_plink_files(plink_files)
-        input_paths_iteration(input_files, output_folder)
-        index_plink = len(input_files.split(",")) + 1
-        plink_extraction(plink_files, output_folder, index_plink)
-
-    elif targz_file and plink_files:
-
+    if targz_file:
         check_targz_file(targz_file)
+    if plink_files:
         check_plink_files(plink_files)
-        extract_targz_file(targz_file, output_folder)
-        index_targz = 1
-        tar_file_iteration(output_folder, index_targz)
-        index_plink = len([name for name in os.listdir(output_folder) if name.endswith(".vcf")]) + 1
-        plink_extraction(plink_files, output_folder, index_plink)
-
-    elif input_files:
 
-        check_input_paths(input_files)
-        input_paths_iteration(input_files, output_folder)
-
-    elif targz_file:
-
-        check_targz_file(targz_file)
-        extract_targz_file(targz_file, output_folder)
-        index_targz = 1
-        tar_file_iteration(output_folder, index_targz)
-
-    elif plink_files:
-
-        check_plink_files(plink_files)
-        index_plink = 1
-        plink_extraction(plink_files, output_folder, index_plink)
+    # the outputs are numbered in a single pass: first the vcf files, then the archive, finally the plink files
+    next_index = 1
+    if input_files:
+        next_index = input_paths_iteration(input_files, output_folder, next_index)
+    if targz_file:
+        next_index = targz_file_iteration(targz_file, output_folder, next_index)
+    if plink_files:
+        next_index = plink_extraction(plink_files, output_folder, next_index)
+
+    if chunk_size is not None or chunks is not None or manifest_file:
+        shard_iterations(output_folder, next_index - 1, chunk_size, chunks, manifest_file)
 
     print(f"====== VCF-Iterator finished successfully! ======")
 
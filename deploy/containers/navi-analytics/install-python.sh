@@ -18,6 +18,7 @@ pip3 install --upgrade xgboost
 pip3 install --upgrade scikit-learn
 pip3 install --upgrade biopython
 pip3 install --upgrade docker
+pip3 install --upgrade zstandard
 
 # python dependencies for the main executor script
 pip3 install --upgrade argparse
@@ -62,39 +62,25 @@ def main(stdscr, params, navigomix_path):
         docker_helper.start_long_term_container()
         # time.sleep(1000)
 
+    # the disease SNP filter and the promoter / protein coding region filters are done in a single pass
     execute_command(docker_helper, 0, display,
                     ["python3", "/analytic-modules/vcf-filtering/vcf_filter.py",
                      "--input", "/input/" + params.patient_vcf,
                      "--snp", "/input/" + params.snp_id_list,
-                     "--output", "/output/disease_filtered.vcf"])
-
-    execute_command(docker_helper, 1, display,
-                    ["python3", "/analytic-modules/vcf-filtering/vcf_filter.py",
-                     "--input", "/output/disease_filtered.vcf",
-                     "--annotation", "/input/" + params.promoter_regions,
-                     "--output", "/output/promoter-regions.vcf"])
-
-    execute_command(docker_helper, 2, display,
-                    ["python3", "/analytic-modules/vcf-filtering/vcf_filter.py",
-                     "--input", "/output/disease_filtered.vcf",
-                     "--annotation", "/input/" + params.protein_coding_regions,
-                     "--output", "/output/protein-coding-regions.vcf"])
+                     "--annotation", "/input/" + params.promoter_regions + ",/input/" + params.protein_coding_regions,
+                     "--output", "/output/promoter-regions.vcf,/output/protein-coding-regions.vcf"])
+    display.set_success_status(1)
+    display.set_success_status(2)
 
+    # the protein coding and promoter regions are generated in a single run, reading each genomic span once
     execute_command(docker_helper, 3, display,
                     ["python3", "/analytic-modules/mutated-sequence-generator/mutated_sequence_generator.py",
-                     "--input_vcf", "/output/protein-coding-regions.vcf",
-                     "--genome", "/input/" + params.genome,
-                     "--output_wild_type", "/output/snp_in_protein-coding-regions_wt.fasta",
-                     "--output_mutated", "/output/snp_in_protein-coding-regions_mut.fasta",
-                     "--region_length", str(params.snp_genome_region_radius_protein_coding)])
-
-    execute_command(docker_helper, 4, display,
-                    ["python3", "/analytic-modules/mutated-sequence-generator/mutated_sequence_generator.py",
-                     "--input_vcf", "/output/promoter-regions.vcf",
+                     "--input_vcf", "/output/protein-coding-regions.vcf,/output/promoter-regions.vcf",
                      "--genome", "/input/" + params.genome,
-                     "--output_wild_type", "/output/snp_in_promoter-regions_wt.fasta",
-                     "--output_mutated", "/output/snp_in_promoter-regions_mut.fasta",
-                     "--region_length", str(params.snp_genome_region_radius_promoter)])
+                     "--output_wild_type", "/output/snp_in_protein-coding-regions_wt.fasta,/output/snp_in_promoter-regions_wt.fasta",
+                     "--output_mutated", "/output/snp_in_protein-coding-regions_mut.fasta,/output/snp_in_promoter-regions_mut.fasta",
+                     "--region_length", str(params.snp_genome_region_radius_protein_coding) + "," + str(params.snp_genome_region_radius_promoter)])
+    display.set_success_status(4)
 
     execute_command(docker_helper, 5, display,
                     ["python3", "/analytic-modules/mirna-interaction-predictor/mirna_interaction_predictor.py",
@@ -13,42 +13,20 @@ def run_pipeline(params, input_folder, output_folder, patient_folder, patient_fi
     module_0_command = ["python3", "../analytic-modules/vcf-filtering/vcf_filter.py",
                         "--input", f"{patient_folder}" + patient_file,
                         "--snp", f"{input_folder}" + params.snp_id_list,
-                        "--output", f"{output_folder}/{actual_patient}/disease_filtered.vcf"]
-    logging.info(f"### [{strftime('%H:%M:%S')}] 1/16 ======= running analytical task with command: {module_0_command}")
+                        "--annotation", f"{input_folder}" + params.promoter_regions + "," + f"{input_folder}" + params.protein_coding_regions,
+                        "--output", f"{output_folder}/{actual_patient}/promoter-regions.vcf,{output_folder}/{actual_patient}/protein-coding-regions.vcf"]
+    logging.info(f"### [{strftime('%H:%M:%S')}] 1-3/16 ======= running analytical task with command: {module_0_command}")
     subprocess.run(module_0_command, check = True)
 
-    module_1_command = ["python3", "../analytic-modules/vcf-filtering/vcf_filter.py",
-                        "--input", f"{output_folder}/{actual_patient}/disease_filtered.vcf",
-                        "--annotation", f"{input_folder}" + params.promoter_regions,
-                        "--output", f"{output_folder}/{actual_patient}/promoter-regions.vcf"]
-    logging.info(f"### [{strftime('%H:%M:%S')}] 2/16 ======= running analytical task with command: {module_1_command}")
-    subprocess.run(module_1_command, check = True)
-
-    module_2_command = ["python3", "../analytic-modules/vcf-filtering/vcf_filter.py",
-                        "--input", f"{output_folder}/{actual_patient}/disease_filtered.vcf",
-                        "--annotation", f"{input_folder}" + params.protein_coding_regions,
-                        "--output", f"{output_folder}/{actual_patient}/protein-coding-regions.vcf"]
-    logging.info(f"### [{strftime('%H:%M:%S')}] 3/16 ======= running analytical task with command: {module_2_command}")
-    subprocess.run(module_2_command, check = True)
-
     module_3_command = ["python3", "../analytic-modules/mutated-sequence-generator/mutated_sequence_generator.py",
-                        "--input_vcf", f"{output_folder}/{actual_patient}/protein-coding-regions.vcf",
+                        "--input_vcf", f"{output_folder}/{actual_patient}/protein-coding-regions.vcf,{output_folder}/{actual_patient}/promoter-regions.vcf",
                         "--genome", f"{input_folder}" + params.genome,
-                        "--output_wild_type", f"{output_folder}/{actual_patient}/snp_in_protein-coding-regions_wt.fasta",
-                        "--output_mutated", f"{output_folder}/{actual_patient}/snp_in_protein-coding-regions_mut.fasta",
-                        "--region_length", str(params.snp_genome_region_radius_protein_coding)]
-    logging.info(f"### [{strftime('%H:%M:%S')}] 4/16 ======= running analytical task with command: {module_3_command}")
+                        "--output_wild_type", f"{output_folder}/{actual_patient}/snp_in_protein-coding-regions_wt.fasta,{output_folder}/{actual_patient}/snp_in_promoter-regions_wt.fasta",
+                        "--output_mutated", f"{output_folder}/{actual_patient}/snp_in_protein-coding-regions_mut.fasta,{output_folder}/{actual_patient}/snp_in_promoter-regions_mut.fasta",
+                        "--region_length", str(params.snp_genome_region_radius_protein_coding) + "," + str(params.snp_genome_region_radius_promoter)]
+    logging.info(f"### [{strftime('%H:%M:%S')}] 4-5/16 ======= running analytical task with command: {module_3_command}")
     subprocess.run(module_3_command, check = True)
 
-    module_4_command = ["python3", "../analytic-modules/mutated-sequence-generator/mutated_sequence_generator.py",
-                        "--input_vcf", f"{output_folder}/{actual_patient}/promoter-regions.vcf",
-                        "--genome", f"{input_folder}" + params.genome,
-                        "--output_wild_type", f"{output_folder}/{actual_patient}/snp_in_promoter-regions_wt.fasta",
-                        "--output_mutated", f"{output_folder}/{actual_patient}/snp_in_promoter-regions_mut.fasta",
-                        "--region_length", str(params.snp_genome_region_radius_promoter)]
-    logging.info(f"### [{strftime('%H:%M:%S')}] 5/16 ======= running analytical task with command: {module_4_command}")
-    subprocess.run(module_4_command, check = True)
-
     module_5_command = ["python3", "../analytic-modules/mirna-interaction-predictor/mirna_interaction_predictor.py",
                         "--mirna", f"{output_folder}/{actual_patient}/snp_in_protein-coding-regions_mut.fasta",
                         "--genomic", f"{input_folder}" + params.mirna_fasta,
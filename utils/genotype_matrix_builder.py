@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+import os
+import sys
+import argparse
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.genotype_matrix import genotype_matrix
+
+
+def parse_args(argv):
+    """ Genotype matrix builder default cli interface """
+    help_text = \
+        """
+        === ISNP Cohort Genotype Matrix Builder ===
+        This script reads the genotypes of a cohort once (from patient VCF files, a MAF file or PLINK files)
+        and saves them as a sparse patients x SNPs matrix, which can be memory-mapped by the later steps.
+        """
+    args_parser = argparse.ArgumentParser(description=help_text)
+    args_parser.add_argument('-i', '--input_vcfs', help="<comma separated list of VCF files, or a folder of VCF "
+                                                        "files> [optional]",
+                             action='store', dest="input_vcfs", required=False)
+    args_parser.add_argument('-m', '--input_maf', help="<the input MAF file> [optional]",
+                             action='store', dest="input_maf", required=False)
+    args_parser.add_argument('-p', '--input_plink', help="<comma separated list of the .bed, .bim and .fam files> "
+                                                         "[optional]",
+                             action='store', dest="input_plink", required=False)
+    args_parser.add_argument('-o', '--output_dir', help="<output folder of the genotype matrix> [mandatory]",
+                             action='store', dest="output_dir", required=True)
+    return args_parser.parse_args(argv[1:])
+
+
+def _vcf_paths(input_vcfs):
+    """ The VCF files of a folder (sorted by name), or the comma separated list of VCF files """
+    if os.path.isdir(input_vcfs):
+        return sorted(os.path.join(input_vcfs, name) for name in os.listdir(input_vcfs)
+                      if name.endswith((".vcf", ".vcf.gz", ".vcf.bgz")) or name.startswith("iteration-"))
+    return input_vcfs.split(",")
+
+
+def build_genotype_matrix(argv):
+    """ Main logic for the genotype matrix builder """
+    args = parse_args(argv)
+    inputs = [args.input_vcfs, args.input_maf, args.input_plink]
+    assert sum(1 for given in inputs if given) == 1, "Exactly one of the inputs (VCFs, MAF, PLINK) must be given"
+    if args.input_vcfs:
+        matrix = genotype_matrix.from_vcfs(_vcf_paths(args.input_vcfs))
+    elif args.input_maf:
+        matrix = genotype_matrix.from_maf(args.input_maf)
+    else:
+        matrix = genotype_matrix.from_plink(args.input_plink.split(","))
+    matrix.save(args.output_dir)
+    print(f"Saved the genotype matrix of {matrix.shape[0]} patients and {matrix.shape[1]} SNPs "
+          f"({len(matrix.data)} non-reference genotypes) to: {args.output_dir}")
+
+
+if __name__ == "__main__":
+    sys.exit(build_genotype_matrix(sys.argv))
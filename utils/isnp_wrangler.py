@@ -2,7 +2,6 @@ import os
 import re
 import sys
 import csv
-import json
 import errno
 import logging
 import argparse
@@ -11,6 +10,8 @@ from collections import defaultdict
 from logging.handlers import QueueHandler, QueueListener
 from multiprocessing import Queue
 from concurrent.futures import ProcessPoolExecutor, as_completed
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.id_mapping import mapping_index
 
 ID_VERSION_SEP = "."
 HEADER = ["source", "target", "score", "region", "snp", "file", "mutated", "tool"]
@@ -76,6 +77,8 @@ def parse_args(argv):
                              default=["source", "target", "snp", "tool"])
     args_parser.add_argument('-p', '--processes', action='store', dest="processes", type=int, default=os.cpu_count(),
                              help="Number of parallel processes to use")
+    args_parser.add_argument('-x', '--index_folder', action='store', dest="index_folder", default=None,
+                             help="Folder of the compiled mapping index (default: a folder in the temporary folder)")
     return args_parser.parse_args(argv[1:])
 
 
@@ -84,18 +87,12 @@ def _strip_dict(d):
     return {k: v.strip() for k, v in d.items()}
 
 
-def _load_mapping_dict(mapping_file_path, target_id_type):
-    """ Load the sherlock mapping dictionary """
-    mapping_dict = {}
-    with open(mapping_file_path, "r") as mapping_file:
-        for line in mapping_file:
-            try:
-                map_line = json.loads(line.strip())
-                if map_line["to_id_type"].lower() == target_id_type:
-                    mapping_dict[map_line["from_id"].lower()] = map_line["to_id"].lower()
-            except json.JSONDecodeError:
-                continue
-    return mapping_dict
+def _load_mapping_dict(mapping_file_path, target_id_type, index_folder=None):
+    """
+    Load the sherlock mapping dictionary. The mapping is compiled once into index_folder and memory-mapped
+    afterwards (see common_libs.id_mapping.mapping_index), so it is also cheap to pass to the worker processes.
+    """
+    return mapping_index.load_mapping_index([mapping_file_path], target_id_type, index_folder).mapping
 
 
 def remap_ids(identifier, mapping_dict):
@@ -321,7 +318,7 @@ def reformat(argv):
     logging.info(f"Starting iSNP Wrangler with {args.processes} processes")
     
     try:
-        mapping_dict = _load_mapping_dict(args.mapping_file_path, args.target_id)
+        mapping_dict = _load_mapping_dict(args.mapping_file_path, args.target_id, args.index_folder)
         patients = [p for p in os.listdir(args.input_dir) if os.path.isdir(os.path.join(args.input_dir, p))]
         
         if args.processes > 1 and len(patients) > 1:
@@ -2,7 +2,8 @@
 import os
 import sys
 import argparse
-import pandas as pd
+sys.path.append("/rds/general/user/jno25/home/iSNP/analytic-modules")
+from common_libs.file_handler import file_handler
 
 
 def parse_args(argv):
@@ -10,7 +11,7 @@ def parse_args(argv):
     help_text = \
         """
         === ISNP VCF Files Formatter ===
-        This script takes a main VCF files and splits into sample specific VCF files. 
+        This script takes a main VCF files (plain, gzip or bgzip compressed) and splits into sample specific VCF files. 
         """
     args_parser = argparse.ArgumentParser(description=help_text)
     args_parser.add_argument('-i', '--input_vcf', help="<the input vcf file to be split> [mandatory]",
@@ -19,40 +20,80 @@ def parse_args(argv):
                              action='store', dest="output_dir", required=True)
     args_parser.add_argument('-p', '--prefix', help="<the prefix to add for chromosome field [optional]>",
                              action='store', dest="prefix", required=False, default="chr")
+    args_parser.add_argument('-s', '--sparse', help="<write only the non-reference genotypes of each sample [optional]>",
+                             action='store_true', dest="sparse", required=False, default=False)
+    args_parser.add_argument('-m', '--max_open_files', help="<maximum number of sample files written at the same "
+                                                            "time. Default: 512 [optional]>",
+                             action='store', dest="max_open_files", type=int, required=False, default=512)
     return args_parser.parse_args(argv[1:])
 
 
-def _split_vcf(file, output_dir_path, info_line_id="#CHROM", prefix='chr'):
-    """ Split VCF file into individual vcf files """
-    with open(file, "r") as read_vcf_file:
-        info_lines, headers = [], []
+def _read_vcf_header(file, info_line_id="#CHROM"):
+    """ Returns the meta-information lines (##) and the column names of a VCF file, reading only its header """
+    info_lines, headers = [], []
+    with file_handler.open_file(file) as read_vcf_file:
         for line in read_vcf_file:
             if line.startswith(info_line_id):
                 headers = line.strip().split('\t')
+                break
             elif line.startswith('##'):
                 info_lines.append(line.strip())
+            elif not line.startswith('#'):
+                break
+    return info_lines, headers
+
+
+def _is_non_reference(genotype):
+    """ True if the GT field of a genotype (e.g. 0/1:35) contains an allele other than the reference """
+    alleles = genotype.split(':', 1)[0].replace('|', '/').split('/')
+    return any(allele not in ('0', '.') for allele in alleles)
+
+
+def _split_vcf(file, output_dir_path, info_line_id="#CHROM", prefix='chr', sparse=False, max_open_files=512):
+    """
+    Split VCF file into individual vcf files.
+
+    The VCF file is streamed: each variant line is read once and its genotype columns are written to the
+    (buffered) files of the samples, so the memory use does not depend on the number of variants. At most
+    max_open_files sample files are open at the same time; for more samples the VCF file is read once for
+    each group of max_open_files samples. If sparse is True, only the non-reference genotypes of a sample
+    are written to its file.
+    """
+    info_lines, headers = _read_vcf_header(file, info_line_id)
     assert len(headers) != 0, "Non matching id parameter"
-    read_vcf_file_df = pd.read_csv(file, sep='\t', comment='#', header=None)
-    read_vcf_file_df.columns = headers
-    read_vcf_file_df[info_line_id] = prefix + read_vcf_file_df[info_line_id].astype(str)
-    standard_header = headers[0:9]
+    standard_header = '\t'.join(headers[0:9])
     sample_ids = headers[9:]
-    for sample in sample_ids:
-        print(f"Processing: {sample}")
-        sample_indices = standard_header + [sample]
-        sub_df = read_vcf_file_df[sample_indices]
-        sample_file_path = os.path.join(output_dir_path, f"{sample}.vcf")
-        with open(sample_file_path, 'w') as out_vcf_file:
-            for line in info_lines:
-                out_vcf_file.write(line + '\n')
-        sub_df.to_csv(sample_file_path, mode='a', sep='\t', index=False, header=True)
+    for group_start in range(0, len(sample_ids), max_open_files):
+        group = list(enumerate(sample_ids[group_start:group_start + max_open_files], start=9 + group_start))
+        print(f"Processing: {', '.join(sample for _, sample in group)}")
+        out_vcf_files = [open(os.path.join(output_dir_path, f"{sample}.vcf"), 'w', buffering=1 << 16)
+                         for _, sample in group]
+        try:
+            for (_, sample), out_vcf_file in zip(group, out_vcf_files):
+                for line in info_lines:
+                    out_vcf_file.write(line + '\n')
+                out_vcf_file.write(standard_header + '\t' + sample + '\n')
+            with file_handler.open_file(file) as read_vcf_file:
+                for line in read_vcf_file:
+                    if line.startswith('#') or not line.strip():
+                        continue
+                    fields = line.rstrip('\r\n').split('\t')
+                    variant = prefix + '\t'.join(fields[0:9]) + '\t'
+                    for (column, _), out_vcf_file in zip(group, out_vcf_files):
+                        genotype = fields[column]
+                        if not sparse or _is_non_reference(genotype):
+                            out_vcf_file.write(variant + genotype + '\n')
+        finally:
+            for out_vcf_file in out_vcf_files:
+                out_vcf_file.close()
     print("Done. :-)")
 
 
 def split_vcf(argv):
     """ Main logic for vcf splitter """
     args = parse_args(argv)
-    _split_vcf(file=args.input_vcf, output_dir_path=args.output_dir, prefix=args.prefix)
+    _split_vcf(file=args.input_vcf, output_dir_path=args.output_dir, prefix=args.prefix, sparse=args.sparse,
+               max_open_files=args.max_open_files)
 
 
 if __name__ == "__main__":